@@ -4,4 +4,5 @@ SERVERS = [
     {"name": "Undernet", "host": "irc.undernet.org", "port": 6697, "ssl": True},
     {"name": "DALnet", "host": "irc.dal.net", "port": 7000, "ssl": True},
     {"name": "AnonOps", "host": "irc.anonops.com", "port": 6697, "ssl": True},
+    {"name": "Irc2P (I2P)", "host": "irc.postman.i2p", "port": 6667, "ssl": False},
 ]
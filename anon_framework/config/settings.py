@@ -0,0 +1,284 @@
+import hashlib
+import json
+import marshal
+import os
+import sys
+from anon_framework.config.servers import SERVERS
+from anon_framework.utils import metrics
+
+# Every setting the framework understands: section -> key -> (type, default).
+SCHEMA = {
+    'qbittorrent': {
+        'host': (str, 'localhost'),
+        'port': (int, 8080),
+        'username': (str, None),
+        'password': (str, None),
+    },
+    'tor': {
+        'service': (str, 'tor'),
+        'socks_host': (str, '127.0.0.1'),
+        'socks_port': (int, 9050),
+        'dns_port': (int, 9053),
+    },
+    'dns': {
+        'mode': (str, 'socks'),
+        # Refuse to connect when the Tor resolver fails instead of using the system resolver.
+        'fail_closed': (bool, False),
+        'cache_size': (int, 1024),
+        'min_ttl': (int, 30),
+        'max_ttl': (int, 3600),
+        'negative_ttl': (int, 60),
+        'timeout': (int, 5),
+        'prefetch': (bool, True),
+    },
+    'i2p': {
+        'service': (str, 'i2p'),
+        'sam_host': (str, '127.0.0.1'),
+        'sam_port': (int, 7656),
+        'sam_options': (list, ['inbound.quantity=3', 'outbound.quantity=3']),
+        'sam_timeout': (int, 60),
+        'sam_lookup_ttl': (int, 3600),
+    },
+    'systemd': {
+        'backend': (str, 'auto'),
+        'timeout': (int, 90),
+    },
+    'tor_browser': {
+        'bundle_dir': (str, '~/tor-browser'),
+        'binary': (str, None),
+        'template_profile': (str, None),
+        'ram_dir': (str, None),
+        'prewarm': (bool, False),
+    },
+    'killswitch': {
+        'table': (str, 'anon_killswitch'),
+        'interfaces': (list, ['tun*', 'wg*', 'nordlynx', 'nordtun']),
+        'allowed_users': (list, ['debian-tor', 'tor', 'i2psvc', 'i2p']),
+        'allowed_ports': (list, []),
+        'allow_lan': (bool, True),
+        'lan_ranges': (list, ['10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16', 'fe80::/10']),
+        # Marks on the VPN's own packets: NordVPN (0xe1f1), Mullvad (0x6d6f6c65), wg-quick (51820).
+        'endpoint_marks': (list, [0xe1f1, 0x6d6f6c65, 51820]),
+        'endpoints': (list, []),
+    },
+    'relays': {
+        'ttl': (int, 3600),
+        'candidates': (int, 40),
+        'concurrency': (int, 16),
+        'probe_port': (int, 443),
+        'probe_timeout_ms': (int, 1500),
+        'load_weight': (int, 1),
+    },
+    'irc': {
+        'nickname': (str, 'anon_framework_user'),
+        'channel': (str, '#anon-framework'),
+        'servers': (list, SERVERS),
+        'dcc_dir': (str, '~/Downloads/anon-framework'),
+        'dcc_host': (str, None),
+        'dcc_passive': (bool, False),
+        'dcc_auto_accept': (bool, False),
+        'dcc_timeout': (int, 120),
+        'plugins': (list, []),
+        'plugin_dir': (str, '~/.config/anon-framework/plugins'),
+        'plugin_timeout': (int, 5),
+        'tui': (bool, False),
+        'tui_fps': (int, 30),
+        'tui_scrollback': (int, 2000),
+    },
+}
+
+SYSTEM_CONFIG_PATH = '/etc/anon-framework/config.json'
+USER_CONFIG_PATH = os.path.join(
+    os.environ.get('XDG_CONFIG_HOME', os.path.expanduser('~/.config')), 'anon-framework', 'config.json')
+CACHE_PATH = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'anon-framework', 'config.cache')
+ENV_PREFIX = 'ANON_'
+
+# Bumped whenever the snapshot layout changes. Schema changes are picked up
+# automatically through SCHEMA_DIGEST, so stale caches are never used.
+CACHE_VERSION = 1
+SCHEMA_DIGEST = hashlib.sha1(repr(SCHEMA).encode('utf-8')).hexdigest()
+
+_config = None
+
+
+class ConfigError(ValueError):
+    """Raised when a configuration source is malformed or fails validation."""
+
+
+def defaults():
+    """Returns a fresh nested dict of the schema defaults."""
+    return {section: {key: default for key, (_, default) in keys.items()} for section, keys in SCHEMA.items()}
+
+
+def _coerce(section, key, value, source):
+    """Validates `value` against the schema, converting strings from env/CLI layers."""
+    if section not in SCHEMA:
+        raise ConfigError(f"{source}: unknown section '{section}'.")
+    if key not in SCHEMA[section]:
+        raise ConfigError(f"{source}: unknown setting '{section}.{key}'.")
+    expected, _ = SCHEMA[section][key]
+    if value is None or (isinstance(value, expected) and not (expected is int and isinstance(value, bool))):
+        return value
+    if isinstance(value, str):
+        try:
+            if expected is int:
+                return int(value)
+            if expected is bool:
+                return value.lower() in ('1', 'true', 'yes', 'on')
+            if expected is list:
+                parsed = json.loads(value)
+                if isinstance(parsed, list):
+                    return parsed
+        except ValueError:
+            pass
+    raise ConfigError(f"{source}: '{section}.{key}' must be of type {expected.__name__}, got {value!r}.")
+
+
+def _merge(config, layer, source):
+    if not isinstance(layer, dict):
+        raise ConfigError(f"{source}: top level must be an object.")
+    for section, values in layer.items():
+        if section not in SCHEMA:
+            raise ConfigError(f"{source}: unknown section '{section}'.")
+        if not isinstance(values, dict):
+            raise ConfigError(f"{source}: section '{section}' must be an object.")
+        for key, value in values.items():
+            config[section][key] = _coerce(section, key, value, source)
+
+
+def _read_file(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except ValueError as e:
+        raise ConfigError(f"{path}: invalid JSON ({e}).")
+    except OSError as e:
+        raise ConfigError(f"{path}: cannot read the file ({e.strerror}).")
+
+
+def _fingerprint(paths):
+    """Returns (path, mtime_ns, size) for every path; missing files are recorded as absent."""
+    prints = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            prints.append((path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            prints.append((path, None, None))
+    return prints
+
+
+def _load_cache(cache_path, fingerprint):
+    try:
+        with open(cache_path, 'rb') as f:
+            version, digest, cached_fingerprint, config = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if version != CACHE_VERSION or digest != SCHEMA_DIGEST or cached_fingerprint != fingerprint:
+        return None
+    return config
+
+
+def _store_cache(cache_path, fingerprint, config):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(marshal.dumps((CACHE_VERSION, SCHEMA_DIGEST, fingerprint, config)))
+        os.replace(tmp_path, cache_path)
+    except (OSError, ValueError):
+        # The cache is only an accelerator; an unwritable cache dir is not an error.
+        pass
+
+
+def _file_layers(paths, cache_path):
+    """Merges defaults and the file layers, going through the snapshot cache when possible."""
+    fingerprint = _fingerprint(paths)
+    if cache_path:
+        config = _load_cache(cache_path, fingerprint)
+        if config is not None:
+            return config
+
+    config = defaults()
+    for (path, mtime, _) in fingerprint:
+        if mtime is not None:
+            _merge(config, _read_file(path), path)
+    if cache_path:
+        _store_cache(cache_path, fingerprint, config)
+    return config
+
+
+def _env_layer(environ):
+    """
+    Collects ANON_<SECTION>_<KEY> variables. Variables that name no setting
+    belong to something else and are ignored; those that start with a known
+    section are probably typos and get a warning on stderr.
+    """
+    # Section names contain underscores too (tor vs tor_browser), so try the longest first.
+    sections = sorted(SCHEMA, key=len, reverse=True)
+    layer = {}
+    for name, value in environ.items():
+        if not name.startswith(ENV_PREFIX):
+            continue
+        setting = name[len(ENV_PREFIX):].lower()
+        for section in sections:
+            key = setting[len(section) + 1:]
+            if setting.startswith(section + '_') and key in SCHEMA[section]:
+                layer.setdefault(section, {})[key] = value
+                break
+        else:
+            if any(setting.startswith(section + '_') for section in sections):
+                print(f"Warning: ignoring {name}, which names no setting (expected {ENV_PREFIX}<SECTION>_<KEY>).",
+                      file=sys.stderr)
+    return layer
+
+
+def _cli_layer(overrides):
+    layer = {}
+    for override in overrides:
+        dotted, sep, value = override.partition('=')
+        section, dot, key = dotted.strip().partition('.')
+        if not sep or not dot:
+            raise ConfigError(f"--set: expected SECTION.KEY=VALUE, got '{override}'.")
+        layer.setdefault(section, {})[key] = value
+    return layer
+
+
+def load(config_file=None, overrides=(), use_cache=True, environ=None):
+    """
+    Builds the effective configuration from all layers.
+
+    Layers are applied in order: defaults, system file, user file (or
+    `config_file`), ANON_<SECTION>_<KEY> environment variables, and
+    `--set SECTION.KEY=VALUE` overrides. The merged result of the file
+    layers is cached as a marshal snapshot keyed on the files' mtimes.
+
+    Args:
+        config_file (str): Use this file instead of the user config file. Unlike
+            the default locations, it must exist.
+        overrides (list): SECTION.KEY=VALUE strings from the command line.
+        use_cache (bool): Read and write the snapshot cache.
+        environ (dict): Environment to read from (defaults to os.environ).
+
+    Returns:
+        dict: The validated configuration, also stored as the process-wide config.
+    """
+    global _config
+    if config_file and not os.path.exists(config_file):
+        # Only the default locations are optional; a file the user named must exist.
+        raise ConfigError(f"{config_file}: config file not found.")
+    paths = [SYSTEM_CONFIG_PATH, config_file or USER_CONFIG_PATH]
+    with metrics.span("config load", 'anon_config_load_seconds'):
+        config = _file_layers(paths, CACHE_PATH if use_cache else None)
+        _merge(config, _env_layer(os.environ if environ is None else environ), 'environment')
+        _merge(config, _cli_layer(overrides), '--set')
+    _config = config
+    return config
+
+
+def get_config():
+    """Returns the process-wide configuration, loading it on first use."""
+    if _config is None:
+        return load()
+    return _config
@@ -1,14 +1,71 @@
 import argparse
+import json
 import sys
-import asyncio
+import time
 from anon_framework.vpn.nord import NordVPN
 from anon_framework.vpn.mullvad import MullvadVPN
 from anon_framework.vpn.tor import TorVPN
+from anon_framework.vpn.monitor import BandwidthMonitor, format_rate
+from anon_framework.vpn.relays import RELAY_SOURCES, rank_relays
 from anon_framework.services.qbittorrent import QBittorrentClient
 from anon_framework.services.i2p import I2PService
+from anon_framework.services.tor_browser import TorBrowserService
+from anon_framework.services.search_results import ResultSet, SORT_KEYS
 from anon_framework.privacy.telemetry import disable_telemetry
+from anon_framework.privacy.killswitch import KillSwitch, KillSwitchError, compile_ruleset, diff_rulesets
 from anon_framework.services.communication.irc import IRCClient
-from anon_framework.utils.helpers import run_command
+from anon_framework.utils.systemd import ServiceError, get_service_manager
+from anon_framework.utils import metrics
+from anon_framework.utils import console
+from anon_framework.utils import runtime
+from anon_framework.utils.runtime import AsyncFacade
+from anon_framework.utils.formatters import FORMATS, get_writer
+from anon_framework.config import settings
+
+# Columns emitted for search results, and their labels in the human-readable format.
+SEARCH_FIELDS = ['fileName', 'fileSize', 'nbSeeders', 'nbLeechers', 'siteUrl', 'fileUrl']
+SEARCH_TEXT_FIELDS = ['fileName', 'fileSize', 'nbSeeders', 'fileUrl']
+SEARCH_LABELS = {'fileName': 'Name', 'fileSize': 'Size', 'nbSeeders': 'Seeds', 'fileUrl': 'Link'}
+STATUS_CSV_FIELDS = ['provider', 'connected', 'status']
+
+def print_status(client, fmt):
+    """Prints a status either as the provider's raw text or as a structured record."""
+    if fmt == 'text':
+        print(runtime.run(client.get_status()))
+        return
+    with get_writer(fmt, fields=STATUS_CSV_FIELDS if fmt == 'csv' else None) as writer:
+        writer.write(runtime.run(client.get_status_info()))
+
+def watch_bandwidth(interfaces, interval, fmt):
+    """Prints live throughput for the tunnel interfaces until interrupted."""
+    try:
+        monitor = BandwidthMonitor(interfaces or None)
+    except OSError as e:
+        print(f"Error: Bandwidth monitoring is not available on this system ({e}).")
+        sys.exit(1)
+    if interfaces and not monitor.read_counters():
+        print(f"No tunnel interface matching {list(interfaces)} found; watching all interfaces.")
+        monitor.prefixes = None
+
+    async def watch():
+        writer = get_writer(fmt) if fmt != 'text' else None
+        try:
+            async for stats in monitor.watch(interval):
+                for iface in stats.values():
+                    if writer is not None:
+                        writer.write(iface.as_dict())
+                        continue
+                    print(f"{iface.name}: rx {format_rate(iface.rx_rate.latest())}, tx {format_rate(iface.tx_rate.latest())}"
+                          f" (p95 rx {format_rate(iface.rx_rate.percentile(95))}, tx {format_rate(iface.tx_rate.percentile(95))})")
+        finally:
+            if writer is not None:
+                writer.close()
+            monitor.close()
+
+    try:
+        runtime.run(watch())
+    except KeyboardInterrupt:
+        pass
 
 def handle_vpn_command(args):
     """Handles all VPN-related commands."""
@@ -22,45 +79,112 @@ def handle_vpn_command(args):
         print(f"Error: Invalid VPN provider '{args.provider}'. Choices are {list(vpn_map.keys())}.")
         sys.exit(1)
         
-    vpn_client = vpn_map[args.provider]
+    provider = vpn_map[args.provider]
+    vpn_client = AsyncFacade(provider)
     
+    if (args.fastest or args.vpn_action == 'relays') and args.provider not in RELAY_SOURCES:
+        print(f"Error: Relay selection is not available for '{args.provider}'.")
+        sys.exit(1)
+
     if args.vpn_action == 'connect':
-        vpn_client.connect()
+        server = args.server
+        if args.fastest:
+            print("Probing relays...")
+            try:
+                ranked = runtime.run(rank_relays(args.provider, args.country))
+            except ConnectionError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+            if not ranked:
+                print("Error: No relay answered; not connecting.")
+                sys.exit(1)
+            server = ranked[0].name
+            print(f"Fastest relay: {server} ({ranked[0].latency * 1000:.0f} ms, load {ranked[0].load if ranked[0].load is not None else 'n/a'})")
+        runtime.run(vpn_client.connect(server))
+    elif args.vpn_action == 'relays':
+        try:
+            ranked = runtime.run(rank_relays(args.provider, args.country))
+        except ConnectionError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        with get_writer(args.format) as writer:
+            for relay in ranked[:args.limit]:
+                writer.write(relay.as_dict())
     elif args.vpn_action == 'disconnect':
-        vpn_client.disconnect()
+        runtime.run(vpn_client.disconnect())
     elif args.vpn_action == 'status':
-        print(vpn_client.get_status())
+        print_status(vpn_client, args.format)
+        if args.watch:
+            watch_bandwidth(provider.tunnel_interfaces, args.interval, args.format)
     else:
         print(f"Error: Invalid VPN action '{args.vpn_action}'.")
         sys.exit(1)
 
+def refine_results(results, args):
+    """Applies the --dedup, --min-seeds, --sort and --top options to raw search results."""
+    result_set = ResultSet.from_results(results)
+    if args.dedup:
+        result_set = result_set.dedup(by=args.dedup)
+    if args.min_seeds is not None:
+        result_set = result_set.filter(min_seeds=args.min_seeds)
+    if args.top:
+        return result_set.top(args.top, key=args.sort or 'seeds')
+    if args.sort:
+        return result_set.sort(args.sort, descending=args.sort != 'name')
+    return result_set
+
 def handle_services_command(args):
     """Handles all service-related commands."""
     if args.service == 'qbittorrent':
-        # NOTE: You may need to pass credentials from a config file in a real app
-        client = QBittorrentClient() 
+        qbittorrent = QBittorrentClient(**settings.get_config()['qbittorrent'])
         if args.service_action == 'search':
             if not args.query:
                 print("Error: The 'search' action requires a query.")
                 sys.exit(1)
-            results = client.search(" ".join(args.query))
-            # Basic print of results
-            for res in results:
-                print(f"Name: {res.get('fileName')}\nSize: {res.get('fileSize')}\nSeeds: {res.get('nbSeeders')}\nLink: {res.get('fileUrl')}\n---")
+            query = " ".join(args.query)
+            if args.sort or args.dedup or args.top:
+                # Ranking needs the whole result set before the first record can be emitted.
+                results = refine_results(runtime.run(AsyncFacade(qbittorrent).search(query, limit=args.limit)), args).rows()
+            else:
+                # Otherwise stream each result as soon as qBittorrent reports it.
+                results = qbittorrent.iter_search(query, limit=args.limit)
+                if args.min_seeds is not None:
+                    results = (res for res in results if int(res.get('nbSeeders') or 0) >= args.min_seeds)
+            fields = SEARCH_TEXT_FIELDS if args.format == 'text' else SEARCH_FIELDS
+            with get_writer(args.format, fields=fields, labels=SEARCH_LABELS) as writer:
+                writer.write_all(results)
 
     elif args.service == 'i2p':
-        client = I2PService()
+        client = AsyncFacade(I2PService())
         if args.service_action == 'start':
-            client.start()
+            runtime.run(client.start())
         elif args.service_action == 'stop':
-            client.stop()
+            runtime.run(client.stop())
         elif args.service_action == 'status':
-            print(client.get_status())
+            print_status(client, args.format)
         elif args.service_action == 'search':
              if not args.query:
                 print("Error: The 'search' action requires a query.")
                 sys.exit(1)
-             client.search_torrents(" ".join(args.query))
+             runtime.run(client.search_torrents(" ".join(args.query)))
+    elif args.service == 'tor-browser':
+        if args.service_action == 'launch':
+            browser = TorBrowserService()
+            try:
+                session = browser.launch(extra_args=args.query)
+            except (FileNotFoundError, OSError) as e:
+                print(f"Error launching Tor Browser: {e}")
+                sys.exit(1)
+            print("Tor Browser started with a disposable RAM profile. It is wiped when the browser exits.")
+            try:
+                session.wait()
+            except KeyboardInterrupt:
+                session.close()
+            finally:
+                browser.shutdown()
+        else:
+            print(f"Error: Invalid tor-browser action '{args.service_action}'.")
+            sys.exit(1)
     else:
         print(f"Error: Invalid service '{args.service}'.")
         sys.exit(1)
@@ -69,31 +193,69 @@ def handle_privacy_command(args):
     """Handles all privacy-related commands."""
     if args.privacy_action == 'disable-telemetry':
         disable_telemetry()
-    elif args.privacy_action == 'start-tor':
-        print("Starting Tor service...")
-        stdout, stderr, code = run_command(['sudo', 'systemctl', 'start', 'tor'])
-        if code == 0:
-            print("Tor service started successfully.")
-        else:
-            print(f"Error starting Tor service:\n{stderr}")
-    elif args.privacy_action == 'stop-tor':
-        print("Stopping Tor service...")
-        stdout, stderr, code = run_command(['sudo', 'systemctl', 'stop', 'tor'])
-        if code == 0:
-            print("Tor service stopped successfully.")
-        else:
-            print(f"Error stopping Tor service:\n{stderr}")
+    elif args.privacy_action in ('start-tor', 'stop-tor'):
+        service = settings.get_config()['tor']['service']
+        manager = get_service_manager()
+        try:
+            if args.privacy_action == 'start-tor':
+                print("Starting Tor service...")
+                runtime.run(manager.start(service))
+                print("Tor service started successfully.")
+            else:
+                print("Stopping Tor service...")
+                runtime.run(manager.stop(service))
+                print("Tor service stopped successfully.")
+        except ServiceError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+    elif args.privacy_action.startswith('killswitch-'):
+        handle_killswitch(args)
     else:
         print(f"Error: Invalid privacy action '{args.privacy_action}'.")
         sys.exit(1)
 
+def handle_killswitch(args):
+    """Enables, disables or reports on the nftables kill switch."""
+    try:
+        killswitch = KillSwitch()
+        desired = compile_ruleset(killswitch.policy)
+        if args.dry_run:
+            print(json.dumps(desired, indent=2))
+            return
+        if args.privacy_action == 'killswitch-on':
+            if killswitch.enable(force=args.force):
+                print("Kill switch enabled.")
+            else:
+                print("Kill switch already up to date.")
+        elif args.privacy_action == 'killswitch-off':
+            if killswitch.disable():
+                print("Kill switch disabled.")
+            else:
+                print("Kill switch is not active.")
+        else:
+            live = killswitch.live_ruleset()
+            if live is None:
+                print("Kill switch: inactive")
+                return
+            added, removed = diff_rulesets(desired, live, killswitch.policy.table)
+            print("Kill switch: active" + (" (out of date)" if added or removed else ""))
+            for chain, rule in added:
+                print(f"  + {chain}: {rule or 'chain definition / order'}")
+            for chain, rule in removed:
+                print(f"  - {chain}: {rule or 'chain definition / order'}")
+    except KillSwitchError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
 def handle_communicate_command(args):
     """Handles all communication-related commands."""
     if args.protocol == 'irc':
-        client = IRCClient(args.nickname, args.channel, use_tor=args.tor)
+        irc_config = settings.get_config()['irc']
+        client = IRCClient(args.nickname or irc_config['nickname'], args.channel or irc_config['channel'],
+                           use_tor=args.tor, tui=args.tui or irc_config['tui'])
         try:
-            # Use asyncio.run() to properly execute the async start method.
-            asyncio.run(client.start())
+            # The client runs on the shared runtime loop alongside any other subsystem work.
+            runtime.run(client.start())
         except KeyboardInterrupt:
             print("\nClient shut down by user.")
     else:
@@ -105,36 +267,78 @@ def main():
     parser = argparse.ArgumentParser(
         description="A cross-platform framework for enhancing user anonymity and privacy."
     )
+    parser.add_argument('--profile', action='store_true', help='Print a per-phase timing breakdown when the command finishes')
+    parser.add_argument('--metrics-file', metavar='PATH', help='Write Prometheus metrics to PATH when the command finishes')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT', help='Serve Prometheus metrics on 127.0.0.1:PORT while running')
+    parser.add_argument('--config', metavar='PATH', help='Read user settings from PATH instead of ~/.config/anon-framework/config.json')
+    parser.add_argument('--set', action='append', default=[], metavar='SECTION.KEY=VALUE', help='Override a configuration setting (repeatable)')
+    parser.add_argument('--no-config-cache', action='store_true', help='Bypass the compiled configuration cache')
+    parser.add_argument('--log-format', choices=['text', 'json'], default='text', help='Output format for event logs (json emits one object per line)')
     subparsers = parser.add_subparsers(dest='command', required=True, help='Main command')
 
     # VPN Parser
     vpn_parser = subparsers.add_parser('vpn', help='Manage VPN connections')
     vpn_parser.add_argument('provider', choices=['nord', 'mullvad', 'tor'], help='The VPN provider')
-    vpn_parser.add_argument('vpn_action', choices=['connect', 'disconnect', 'status'], help='Action to perform')
+    vpn_parser.add_argument('vpn_action', choices=['connect', 'disconnect', 'status', 'relays'], help='Action to perform')
+    vpn_parser.add_argument('--format', choices=FORMATS, default='text', help='Output format for status and relays')
+    vpn_parser.add_argument('--server', help='Connect through this server (provider-specific name)')
+    vpn_parser.add_argument('--fastest', action='store_true', help='Probe the relay list and connect through the fastest relay')
+    vpn_parser.add_argument('--country', help='Only consider relays in this country code (with --fastest or relays)')
+    vpn_parser.add_argument('--limit', type=int, default=10, help='Number of relays to list')
+    vpn_parser.add_argument('--watch', action='store_true', help='After status, keep printing tunnel throughput until Ctrl-C')
+    vpn_parser.add_argument('--interval', type=float, default=1.0, help='Seconds between --watch samples')
     vpn_parser.set_defaults(func=handle_vpn_command)
 
     # Services Parser
     services_parser = subparsers.add_parser('services', help='Manage external services')
-    services_parser.add_argument('service', choices=['qbittorrent', 'i2p'], help='The service to manage')
+    services_parser.add_argument('service', choices=['qbittorrent', 'i2p', 'tor-browser'], help='The service to manage')
     services_parser.add_argument('service_action', help='Action to perform (e.g., search, start, stop)')
     services_parser.add_argument('query', nargs='*', help='Search query (for search action)')
+    services_parser.add_argument('--format', choices=FORMATS, default='text', help='Output format for search and status (streamed record by record)')
+    services_parser.add_argument('--limit', type=int, default=50, help='Maximum results to fetch (0 for no limit)')
+    services_parser.add_argument('--min-seeds', type=int, help='Drop results with fewer seeders')
+    services_parser.add_argument('--sort', choices=SORT_KEYS, help='Order results by this column')
+    services_parser.add_argument('--top', type=int, help='Only show the N best results (by --sort, default seeds)')
+    services_parser.add_argument('--dedup', choices=['infohash', 'name'], help='Collapse duplicate results across plugins')
     services_parser.set_defaults(func=handle_services_command)
 
     # Privacy Parser
     privacy_parser = subparsers.add_parser('privacy', help='Manage privacy settings')
-    privacy_parser.add_argument('privacy_action', choices=['disable-telemetry', 'start-tor', 'stop-tor'], help='Action to perform')
+    privacy_parser.add_argument('privacy_action', choices=['disable-telemetry', 'start-tor', 'stop-tor', 'killswitch-on', 'killswitch-off', 'killswitch-status'], help='Action to perform')
+    privacy_parser.add_argument('--force', action='store_true', help='Reload the kill switch even if the live ruleset already matches')
+    privacy_parser.add_argument('--dry-run', action='store_true', help='Print the compiled kill-switch ruleset instead of applying it')
     privacy_parser.set_defaults(func=handle_privacy_command)
 
     # Communication Parser
     communicate_parser = subparsers.add_parser('communicate', help='Manage communication clients')
     communicate_parser.add_argument('protocol', choices=['irc'], help='The communication protocol')
-    communicate_parser.add_argument('--nickname', default='anon_framework_user', help='Your nickname')
-    communicate_parser.add_argument('--channel', default='#anon-framework', help='The channel to join')
+    communicate_parser.add_argument('--nickname', help='Your nickname (default: irc.nickname setting)')
+    communicate_parser.add_argument('--channel', help='The channel to join (default: irc.channel setting)')
     communicate_parser.add_argument('--tor', action='store_true', help='Use Tor for the connection')
+    communicate_parser.add_argument('--tui', action='store_true', help='Use the split-pane terminal UI (default: irc.tui setting)')
     communicate_parser.set_defaults(func=handle_communicate_command)
 
     args = parser.parse_args()
-    args.func(args)
+    console.configure(json_mode=args.log_format == 'json')
+    if args.profile or args.metrics_file or args.metrics_port:
+        metrics.enable()
+    if args.metrics_port:
+        metrics.serve_prometheus(args.metrics_port)
+
+    start = time.perf_counter()
+    try:
+        try:
+            settings.load(config_file=args.config, overrides=args.set, use_cache=not args.no_config_cache)
+        except settings.ConfigError as e:
+            print(f"Configuration error: {e}")
+            sys.exit(1)
+        args.func(args)
+    finally:
+        if args.metrics_file:
+            metrics.write_prometheus(args.metrics_file)
+        runtime.shutdown()
+        if args.profile:
+            print(metrics.phase_report(total=time.perf_counter() - start), file=sys.stderr)
 
 if __name__ == "__main__":
     main()
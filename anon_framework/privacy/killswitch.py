@@ -0,0 +1,301 @@
+import ipaddress
+import json
+from anon_framework.config.settings import get_config
+from anon_framework.utils.helpers import run_command
+from anon_framework.utils import metrics
+
+FAMILY = 'inet'
+CHAIN = 'output'
+
+_ACCEPT = {'accept': None}
+# What nft prints when the table being listed or deleted is not loaded.
+MISSING_TABLE = 'No such file or directory'
+
+
+class KillSwitchError(RuntimeError):
+    """Raised when the policy is invalid, or nft rejects a ruleset or cannot be run."""
+
+
+class Policy:
+    """
+    The desired kill-switch policy: everything leaving the machine is dropped
+    unless it goes through a tunnel interface, is the tunnel's own traffic to
+    its endpoint (by firewall mark or endpoint address), belongs to an allowed
+    user (the Tor/I2P daemons), targets an allowed port, or stays on the LAN.
+    """
+
+    def __init__(self, table='anon_killswitch', interfaces=(), allowed_uids=(), allowed_ports=(),
+                 allow_lan=True, lan_ranges=(), endpoint_marks=(), endpoints=()):
+        """
+        Args:
+            table (str): Name of the nftables table the policy owns.
+            interfaces (iterable): Tunnel interface names; nft wildcards such as 'tun*' are allowed.
+            allowed_uids (iterable): Numeric uids whose traffic may leave on any interface.
+            allowed_ports (iterable): TCP/UDP destination ports allowed on any interface
+                (e.g. the VPN endpoint port, needed before the tunnel is up).
+            allow_lan (bool): Allow traffic to `lan_ranges`.
+            lan_ranges (iterable): CIDR ranges treated as local, IPv4 or IPv6.
+            endpoint_marks (iterable): Firewall marks the VPN puts on its own encrypted
+                packets. Kernel WireGuard sends them with no owning socket, so no uid
+                rule can match them.
+            endpoints (iterable): VPN endpoints as 'address' or 'address:port'
+                ('[address]:port' for IPv6), for clients that mark nothing.
+        """
+        self.table = table
+        self.interfaces = list(interfaces)
+        self.allowed_uids = sorted(set(allowed_uids))
+        self.allowed_ports = sorted(set(int(port) for port in allowed_ports))
+        self.allow_lan = allow_lan
+        self.lan_ranges = [ipaddress.ip_network(cidr, strict=False) for cidr in lan_ranges]
+        self.endpoint_marks = sorted(set(int(mark, 0) if isinstance(mark, str) else mark for mark in endpoint_marks))
+        self.endpoints = [parse_endpoint(endpoint) for endpoint in endpoints]
+
+    @classmethod
+    def from_config(cls, config=None):
+        """Builds the policy from the 'killswitch' config section, resolving user names to uids."""
+        # POSIX-only; imported here so the rest of the CLI still loads on Windows.
+        import pwd
+        config = (config or get_config())['killswitch']
+        uids = []
+        for user in config['allowed_users']:
+            try:
+                uids.append(pwd.getpwnam(user).pw_uid)
+            except KeyError:
+                # Daemon accounts differ between distributions; absent ones are skipped.
+                pass
+        return cls(
+            table=config['table'],
+            interfaces=config['interfaces'],
+            allowed_uids=uids,
+            allowed_ports=config['allowed_ports'],
+            allow_lan=config['allow_lan'],
+            lan_ranges=config['lan_ranges'],
+            endpoint_marks=config['endpoint_marks'],
+            endpoints=config['endpoints'],
+        )
+
+
+def parse_endpoint(endpoint):
+    """
+    Parses 'address', 'address:port' or '[address]:port'.
+
+    Returns:
+        tuple: (ipaddress object, port or None).
+    """
+    address, port = endpoint, None
+    if endpoint.startswith('['):
+        address, _, rest = endpoint[1:].partition(']')
+        port = rest[1:] if rest.startswith(':') else None
+    elif endpoint.count(':') == 1:
+        address, port = endpoint.split(':')
+    try:
+        return ipaddress.ip_address(address), int(port) if port else None
+    except ValueError:
+        raise KillSwitchError(f"Invalid kill-switch endpoint '{endpoint}' (expected address, address:port or [address]:port)")
+
+
+def _match(left, right, op='=='):
+    return {'match': {'op': op, 'left': left, 'right': right}}
+
+
+def _one_or_set(values):
+    return values[0] if len(values) == 1 else {'set': list(values)}
+
+
+def _prefix(network):
+    return {'prefix': {'addr': str(network.network_address), 'len': network.prefixlen}}
+
+
+def compile_rules(policy):
+    """
+    Compiles the policy into the expression lists of the output chain, in order.
+
+    The expressions use the same shape `nft -j list` prints, so compiled and
+    live rules can be compared directly. There is deliberately no blanket
+    `ct state established,related accept`: connections opened before the
+    switch was enabled must not keep flowing outside the tunnel. The tunnel's
+    own traffic is let through by its mark or its endpoint address instead.
+    """
+    rules = [
+        [_match({'meta': {'key': 'oifname'}}, 'lo'), _ACCEPT],
+    ]
+    for interface in policy.interfaces:
+        rules.append([_match({'meta': {'key': 'oifname'}}, interface), _ACCEPT])
+    if policy.endpoint_marks:
+        rules.append([_match({'meta': {'key': 'mark'}}, _one_or_set(policy.endpoint_marks)), _ACCEPT])
+    for address, port in policy.endpoints:
+        daddr = _match({'payload': {'protocol': 'ip' if address.version == 4 else 'ip6', 'field': 'daddr'}}, str(address))
+        if port is None:
+            rules.append([daddr, _ACCEPT])
+            continue
+        for protocol in ('tcp', 'udp'):
+            rules.append([daddr, _match({'payload': {'protocol': protocol, 'field': 'dport'}}, port), _ACCEPT])
+    for uid in policy.allowed_uids:
+        rules.append([_match({'meta': {'key': 'skuid'}}, uid), _ACCEPT])
+    if policy.allowed_ports:
+        for protocol in ('tcp', 'udp'):
+            rules.append([
+                _match({'payload': {'protocol': protocol, 'field': 'dport'}}, _one_or_set(policy.allowed_ports)),
+                _ACCEPT,
+            ])
+    if policy.allow_lan:
+        for protocol, version in (('ip', 4), ('ip6', 6)):
+            ranges = [_prefix(net) for net in policy.lan_ranges if net.version == version]
+            if ranges:
+                rules.append([
+                    _match({'payload': {'protocol': protocol, 'field': 'daddr'}}, _one_or_set(ranges)),
+                    _ACCEPT,
+                ])
+    return rules
+
+
+def compile_ruleset(policy):
+    """
+    Compiles the policy into a single `nft -j -f` batch.
+
+    The batch adds the table (a no-op if it exists), deletes it, and re-creates
+    it with every chain and rule, so nft swaps the old ruleset for the new one
+    in one transaction with no window where the table is missing or partial.
+    """
+    table = {'family': FAMILY, 'name': policy.table}
+    commands = [
+        {'add': {'table': dict(table)}},
+        {'delete': {'table': dict(table)}},
+        {'add': {'table': dict(table)}},
+        {'add': {'chain': {
+            'family': FAMILY, 'table': policy.table, 'name': CHAIN,
+            'type': 'filter', 'hook': 'output', 'prio': 0, 'policy': 'drop',
+        }}},
+    ]
+    for expr in compile_rules(policy):
+        commands.append({'add': {'rule': {'family': FAMILY, 'table': policy.table, 'chain': CHAIN, 'expr': expr}}})
+    return {'nftables': commands}
+
+
+def normalize(ruleset, table):
+    """
+    Reduces a ruleset to the parts that matter for comparison.
+
+    Accepts either a compiled batch or the output of `nft -j list`, and drops
+    handles, metainfo and objects belonging to other tables.
+
+    Returns:
+        dict: {chain_name: (chain_properties, [rule_json, ...])}.
+    """
+    chains = {}
+    rules = []
+    for item in ruleset.get('nftables', ()):
+        if 'add' in item:
+            item = item['add']
+        if 'chain' in item:
+            chain = item['chain']
+            if chain.get('family') == FAMILY and chain.get('table') == table:
+                props = tuple(chain.get(key) for key in ('type', 'hook', 'prio', 'policy'))
+                chains[chain['name']] = (props, [])
+        elif 'rule' in item:
+            rule = item['rule']
+            if rule.get('family') == FAMILY and rule.get('table') == table:
+                rules.append((rule['chain'], json.dumps(rule['expr'], sort_keys=True)))
+    for chain, expr in rules:
+        if chain in chains:
+            chains[chain][1].append(expr)
+    return chains
+
+
+def diff_rulesets(desired, live, table):
+    """
+    Compares two rulesets for `table`.
+
+    Args:
+        desired (dict): Compiled or listed ruleset JSON.
+        live (dict): The live ruleset JSON, or None if the table does not exist.
+
+    Returns:
+        tuple: (added, removed) lists of (chain, rule_json) pairs. A changed
+        chain definition or rule order is reported as (chain, None).
+        Both lists are empty when the rulesets are equivalent.
+    """
+    want = normalize(desired, table)
+    have = normalize(live, table) if live else {}
+    added, removed = [], []
+    for name in sorted(set(want) | set(have)):
+        want_props, want_rules = want.get(name, (None, []))
+        have_props, have_rules = have.get(name, (None, []))
+        if want_props != have_props:
+            if want_props is not None:
+                added.append((name, None))
+            if have_props is not None:
+                removed.append((name, None))
+        if want_rules != have_rules:
+            new = [rule for rule in want_rules if rule not in have_rules]
+            old = [rule for rule in have_rules if rule not in want_rules]
+            if not new and not old:
+                # Same rules in a different order; nft evaluates them in order, so it is still a change.
+                new, old = [None], [None]
+            added.extend((name, rule) for rule in new)
+            removed.extend((name, rule) for rule in old)
+    return added, removed
+
+
+class KillSwitch:
+    """Applies and removes the kill-switch table through nft's JSON interface."""
+
+    def __init__(self, policy=None, nft=('sudo', 'nft')):
+        """
+        Args:
+            policy (Policy): The policy to enforce (defaults to the configured one).
+            nft (tuple): Command prefix used to run nft.
+        """
+        self.policy = policy or Policy.from_config()
+        self.nft = list(nft)
+
+    def live_ruleset(self):
+        """
+        Returns the live JSON for the kill-switch table, or None if it is not loaded.
+
+        Raises:
+            KillSwitchError: If nft cannot be run or fails for any other reason
+                (sudo refused, no permission), since the table may still be loaded.
+        """
+        stdout, stderr, code = run_command(self.nft + ['-j', 'list', 'table', FAMILY, self.policy.table])
+        if code != 0:
+            if stdout is not None and MISSING_TABLE in stderr:
+                return None
+            raise KillSwitchError(f"Could not read the kill-switch table:\n{stderr}")
+        try:
+            return json.loads(stdout)
+        except ValueError as e:
+            raise KillSwitchError(f"nft returned invalid JSON: {e}")
+
+    def is_active(self):
+        return self.live_ruleset() is not None
+
+    def enable(self, force=False):
+        """
+        Loads the policy unless the live table already matches it.
+
+        Args:
+            force (bool): Reload even if nothing changed.
+
+        Returns:
+            bool: True if a new ruleset was loaded, False if it was already current.
+        """
+        desired = compile_ruleset(self.policy)
+        if not force:
+            added, removed = diff_rulesets(desired, self.live_ruleset(), self.policy.table)
+            if not added and not removed:
+                return False
+        with metrics.span("kill switch load", 'anon_killswitch_load_seconds'):
+            _, stderr, code = run_command(self.nft + ['-j', '-f', '-'], input=json.dumps(desired))
+        if code != 0:
+            raise KillSwitchError(f"nft rejected the kill-switch ruleset:\n{stderr}")
+        return True
+
+    def disable(self):
+        """Removes the kill-switch table. Returns False if it was not loaded."""
+        if not self.is_active():
+            return False
+        _, stderr, code = run_command(self.nft + ['delete', 'table', FAMILY, self.policy.table])
+        if code != 0:
+            raise KillSwitchError(f"Could not remove the kill-switch table:\n{stderr}")
+        return True
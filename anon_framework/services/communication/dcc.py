@@ -0,0 +1,494 @@
+import asyncio
+import itertools
+import mmap
+import os
+import socket
+import struct
+import time
+from anon_framework.utils import metrics
+from anon_framework.utils.console import get_console
+
+# Received data lands directly in a buffer of this size (recv_into, no
+# intermediate copies) and is flushed to disk and acknowledged once it is full.
+WRITE_BUFFER = 4 * 1024 * 1024
+# sendfile is issued in slices so progress stays visible during multi-GB sends.
+SENDFILE_SLICE = 64 * 1024 * 1024
+MMAP_CHUNK = 1024 * 1024
+
+DCC_BYTES_SENT = metrics.counter('anon_dcc_bytes_sent', 'File bytes sent over DCC.')
+DCC_BYTES_RECEIVED = metrics.counter('anon_dcc_bytes_received', 'File bytes received over DCC.')
+
+
+def parse_dcc(contents):
+    """
+    Splits a CTCP DCC payload into its parts.
+
+    Returns:
+        tuple: (kind, filename, args), e.g. ('SEND', 'a b.txt', ['3232235777', '5000', '1024']).
+        Returns None for payloads that are not SEND/RESUME/ACCEPT.
+    """
+    kind, _, rest = contents.strip().partition(' ')
+    kind = kind.upper()
+    if kind not in ('SEND', 'RESUME', 'ACCEPT'):
+        return None
+    rest = rest.strip()
+    if rest.startswith('"'):
+        filename, _, rest = rest[1:].partition('"')
+    else:
+        filename, _, rest = rest.partition(' ')
+    return kind, filename, rest.split()
+
+
+def quote_filename(filename):
+    return f'"{filename}"' if ' ' in filename else filename
+
+
+def encode_address(host):
+    """Encodes an IPv4 address as the decimal integer DCC uses; other addresses pass through."""
+    try:
+        return str(int.from_bytes(socket.inet_aton(host), 'big'))
+    except OSError:
+        return host
+
+
+def decode_address(value):
+    if value.isdigit():
+        return socket.inet_ntoa(int(value).to_bytes(4, 'big'))
+    return value
+
+
+async def recv_exactly(sock, size):
+    """Reads exactly `size` bytes from a non-blocking socket on the running loop."""
+    loop = asyncio.get_running_loop()
+    data = b''
+    while len(data) < size:
+        chunk = await loop.sock_recv(sock, size - len(data))
+        if not chunk:
+            raise asyncio.IncompleteReadError(data, size)
+        data += chunk
+    return data
+
+
+async def open_dcc_connection(host, port, proxy=None):
+    """
+    Connects to a DCC peer, through a SOCKS5 proxy (Tor) when `proxy` is given.
+
+    Transfers work on the raw non-blocking socket rather than asyncio streams,
+    so file data can go through `sock_sendfile` and `sock_recv_into`.
+
+    Args:
+        proxy (tuple): (host, port) of the SOCKS5 proxy, or None for a direct connection.
+
+    Returns:
+        socket.socket: The connected, non-blocking socket.
+    """
+    loop = asyncio.get_running_loop()
+    target = proxy or (host, port)
+    info = await loop.getaddrinfo(target[0], target[1], type=socket.SOCK_STREAM)
+    family, _, _, _, address = info[0]
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    try:
+        await loop.sock_connect(sock, address)
+        if proxy is not None:
+            try:
+                dest = b'\x01' + socket.inet_aton(host)
+            except OSError:
+                encoded = host.encode('idna')
+                dest = b'\x03' + bytes((len(encoded),)) + encoded
+            await loop.sock_sendall(sock, b'\x05\x01\x00' + b'\x05\x01\x00' + dest + port.to_bytes(2, 'big'))
+            greeting = await recv_exactly(sock, 2)
+            _, reply, _, atyp = await recv_exactly(sock, 4)
+            if greeting != b'\x05\x00' or reply != 0:
+                raise ConnectionError(f"SOCKS proxy could not reach {host}:{port} (reply {reply})")
+            await recv_exactly(sock, {1: 4, 4: 16}.get(atyp, 0) + 2)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+class DCCTransfer:
+    """State of one DCC file transfer in either direction."""
+    __slots__ = ('id', 'direction', 'nick', 'filename', 'path', 'size', 'position', 'transferred',
+                 'state', 'token', 'host', 'port', 'started', 'finished', 'error', '_server', '_resume', '_task')
+
+    def __init__(self, transfer_id, direction, nick, filename, size, path=None):
+        self.id = transfer_id
+        self.direction = direction
+        self.nick = nick
+        self.filename = filename
+        self.path = path
+        self.size = size
+        # Offset the transfer (re)started from, and bytes moved since then.
+        self.position = 0
+        self.transferred = 0
+        self.state = 'offered'
+        self.token = None
+        self.host = None
+        self.port = 0
+        self.started = None
+        self.finished = None
+        self.error = None
+        self._server = None
+        self._resume = None
+        self._task = None
+
+    def rate(self):
+        """Average throughput in bytes per second since the transfer started."""
+        if self.started is None:
+            return 0.0
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return self.transferred / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'direction': self.direction,
+            'nick': self.nick,
+            'filename': self.filename,
+            'size': self.size,
+            'done': self.position + self.transferred,
+            'state': self.state,
+            'rate': self.rate(),
+        }
+
+
+class DCCManager:
+    """
+    Runs DCC SEND/RECV transfers on the client's event loop.
+
+    Outgoing files go out with `loop.sock_sendfile` (kernel `sendfile`,
+    falling back to sends straight from an `mmap` of the file). Incoming
+    files are preallocated, received with `recv_into` into one reusable
+    buffer and written in large `pwrite` batches. Both directions
+    support passive (reverse) DCC, where the receiver listens instead of the
+    sender, which is what lets a Tor user send files: Tor can only make
+    outbound connections, and those go through the SOCKS proxy. Interrupted
+    receives keep a `.part` file and continue with DCC RESUME.
+    """
+
+    def __init__(self, send_ctcp, download_dir, host=None, proxy=None, passive=False,
+                 auto_accept=False, timeout=120, console=None):
+        """
+        Args:
+            send_ctcp (coroutine function): `send_ctcp(nick, contents)` sends a CTCP DCC message.
+            download_dir (str): Where received files are stored.
+            host (str): Address advertised to peers for active transfers.
+            proxy (tuple): SOCKS5 (host, port) for outbound connections, e.g. Tor.
+            passive (bool): Offer files with passive DCC (always on when `proxy` is set).
+            auto_accept (bool): Start receiving offers without asking.
+            timeout (int): Seconds to wait for a peer to connect or answer a RESUME.
+        """
+        self.send_ctcp = send_ctcp
+        self.download_dir = os.path.expanduser(download_dir)
+        self.host = host
+        self.proxy = proxy
+        self.passive = passive or proxy is not None
+        self.auto_accept = auto_accept
+        self.timeout = timeout
+        self.console = console or get_console()
+        self.transfers = {}
+        self._ids = itertools.count(1)
+        self._tokens = itertools.count(1)
+
+    def _new_transfer(self, direction, nick, filename, size, path=None):
+        transfer = DCCTransfer(next(self._ids), direction, nick, filename, size, path)
+        self.transfers[transfer.id] = transfer
+        return transfer
+
+    def _spawn(self, transfer, coro):
+        transfer._task = asyncio.ensure_future(self._run(transfer, coro))
+        return transfer._task
+
+    async def _run(self, transfer, coro):
+        try:
+            await coro
+        except asyncio.CancelledError:
+            transfer.state = 'cancelled'
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            transfer.state = 'failed'
+            transfer.error = str(e) or type(e).__name__
+            self.console.error(f"DCC #{transfer.id} {transfer.filename}: {transfer.error}", event='dcc', id=transfer.id)
+        finally:
+            if transfer._server is not None:
+                transfer._server.close()
+                transfer._server = None
+
+    def _listen(self, transfer):
+        """Opens a listening socket on an ephemeral port and records the port on the transfer."""
+        family = socket.AF_INET6 if self.host and ':' in self.host else socket.AF_INET
+        server = socket.socket(family, socket.SOCK_STREAM)
+        server.setblocking(False)
+        server.bind(('::' if family == socket.AF_INET6 else '0.0.0.0', 0))
+        server.listen(1)
+        transfer._server = server
+        transfer.port = server.getsockname()[1]
+
+    async def _wait_for_peer(self, transfer):
+        """Accepts the first peer on the transfer's listening socket, then stops listening."""
+        try:
+            sock, _ = await asyncio.wait_for(asyncio.get_running_loop().sock_accept(transfer._server), self.timeout)
+        finally:
+            transfer._server.close()
+            transfer._server = None
+        sock.setblocking(False)
+        return sock
+
+    # Sending
+
+    async def offer(self, nick, path):
+        """
+        Offers a file to `nick` and sends it once the peer connects.
+
+        Returns:
+            DCCTransfer: The outgoing transfer (progress is updated in place).
+        """
+        path = os.path.expanduser(path)
+        size = os.path.getsize(path)
+        filename = os.path.basename(path)
+        transfer = self._new_transfer('send', nick, filename, size, path)
+        transfer.state = 'waiting'
+        host = encode_address(self.host) if self.host else '0'
+        if self.passive:
+            transfer.token = str(next(self._tokens))
+            await self.send_ctcp(nick, f"SEND {quote_filename(filename)} {host} 0 {size} {transfer.token}")
+        else:
+            if not self.host:
+                raise ConnectionError("No address to advertise for an active DCC send; set irc.dcc_host or use passive DCC.")
+            self._listen(transfer)
+            await self.send_ctcp(nick, f"SEND {quote_filename(filename)} {host} {transfer.port} {size}")
+
+            async def wait_and_send():
+                await self._send(transfer, await self._wait_for_peer(transfer))
+
+            self._spawn(transfer, wait_and_send())
+        self.console.info(f"DCC #{transfer.id}: offered {filename} ({size} bytes) to {nick}.", event='dcc', id=transfer.id)
+        return transfer
+
+    async def _send(self, transfer, sock):
+        transfer.state = 'active'
+        transfer.started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        remaining = transfer.size - transfer.position
+        try:
+            with open(transfer.path, 'rb') as f:
+                offset = transfer.position
+                try:
+                    while remaining > 0:
+                        sent = await loop.sock_sendfile(sock, f, offset, min(remaining, SENDFILE_SLICE), fallback=False)
+                        if not sent:
+                            raise ConnectionError("peer closed the connection")
+                        offset += sent
+                        remaining -= sent
+                        transfer.transferred += sent
+                        DCC_BYTES_SENT.inc(sent)
+                except (NotImplementedError, RuntimeError):
+                    # No kernel sendfile on this platform or for this file.
+                    await self._send_mmap(transfer, f, sock, offset, remaining)
+
+            # Wait until the receiver acknowledges the whole file (acks carry the low 32 bits).
+            expected = transfer.size & 0xFFFFFFFF
+            try:
+                while True:
+                    ack = await asyncio.wait_for(recv_exactly(sock, 4), self.timeout)
+                    if struct.unpack('!I', ack)[0] == expected:
+                        break
+            except (asyncio.IncompleteReadError, ConnectionResetError):
+                # Some clients close right after the last byte instead of acknowledging it.
+                pass
+        finally:
+            sock.close()
+        transfer.finished = time.monotonic()
+        transfer.state = 'done'
+        self.console.info(f"DCC #{transfer.id}: sent {transfer.filename} to {transfer.nick} "
+                          f"({transfer.rate() / 1e6:.1f} MB/s).", event='dcc', id=transfer.id)
+
+    async def _send_mmap(self, transfer, f, sock, offset, remaining):
+        if remaining <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+            end = offset + remaining
+            while offset < end:
+                # Slices of the view point into the mapping; no copy is made before the kernel send.
+                chunk = view[offset:min(offset + MMAP_CHUNK, end)]
+                await loop.sock_sendall(sock, chunk)
+                offset += len(chunk)
+                transfer.transferred += len(chunk)
+                DCC_BYTES_SENT.inc(len(chunk))
+                chunk.release()
+
+    # Receiving
+
+    async def accept(self, transfer_id):
+        """Starts receiving an offered file, resuming a previous partial download if there is one."""
+        transfer = self.transfers.get(transfer_id)
+        if transfer is None or transfer.direction != 'recv' or transfer.state != 'offered':
+            raise KeyError(f"No pending DCC offer #{transfer_id}.")
+        if transfer.port == 0 and self.proxy is not None:
+            raise ConnectionError("Passive DCC offers need an inbound connection, which is not possible over Tor.")
+        transfer.state = 'waiting'
+        return self._spawn(transfer, self._accept(transfer))
+
+    async def _accept(self, transfer):
+        os.makedirs(self.download_dir, exist_ok=True)
+        safe_name = os.path.basename(transfer.filename.replace('\\', '/')) or f"dcc-{transfer.id}"
+        transfer.path = os.path.join(self.download_dir, safe_name)
+        part_path = transfer.path + '.part'
+        try:
+            have = os.path.getsize(part_path)
+        except OSError:
+            have = 0
+
+        if 0 < have < transfer.size:
+            transfer._resume = asyncio.get_running_loop().create_future()
+            await self.send_ctcp(transfer.nick, self._with_token(
+                f"RESUME {quote_filename(transfer.filename)} {transfer.port} {have}", transfer))
+            try:
+                transfer.position = await asyncio.wait_for(transfer._resume, self.timeout)
+            except asyncio.TimeoutError:
+                # The sender does not support RESUME; start over.
+                transfer.position = 0
+            transfer._resume = None
+
+        if transfer.port:
+            sock = await open_dcc_connection(transfer.host, transfer.port, self.proxy)
+        else:
+            self._listen(transfer)
+            host = encode_address(self.host) if self.host else '0'
+            await self.send_ctcp(transfer.nick, f"SEND {quote_filename(transfer.filename)} {host} "
+                                                f"{transfer.port} {transfer.size} {transfer.token}")
+            sock = await self._wait_for_peer(transfer)
+        await self._receive(transfer, sock, part_path)
+
+    def _with_token(self, text, transfer):
+        return f"{text} {transfer.token}" if transfer.token else text
+
+    async def _receive(self, transfer, sock, part_path):
+        transfer.state = 'active'
+        transfer.started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        fd = os.open(part_path, os.O_WRONLY | os.O_CREAT, 0o600)
+        offset = transfer.position
+        buffer = bytearray(WRITE_BUFFER)
+        view = memoryview(buffer)
+        filled = 0
+        try:
+            if transfer.position == 0:
+                os.ftruncate(fd, 0)
+            if hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(fd, offset, transfer.size - offset)
+                except OSError:
+                    pass
+            while offset + filled < transfer.size:
+                want = min(WRITE_BUFFER - filled, transfer.size - offset - filled)
+                count = await loop.sock_recv_into(sock, view[filled:filled + want])
+                if not count:
+                    break
+                filled += count
+                if filled == WRITE_BUFFER or offset + filled >= transfer.size:
+                    offset += self._flush(transfer, fd, view[:filled], offset)
+                    filled = 0
+                    await loop.sock_sendall(sock, struct.pack('!I', offset & 0xFFFFFFFF))
+        finally:
+            if filled:
+                offset += self._flush(transfer, fd, view[:filled], offset)
+            view.release()
+            if offset < transfer.size:
+                # Drop the preallocated tail so the .part size is the resume offset.
+                os.ftruncate(fd, offset)
+            os.close(fd)
+            sock.close()
+
+        if offset < transfer.size:
+            raise ConnectionError(f"connection closed at {offset} of {transfer.size} bytes; retry to resume")
+        os.replace(part_path, transfer.path)
+        transfer.finished = time.monotonic()
+        transfer.state = 'done'
+        self.console.info(f"DCC #{transfer.id}: received {transfer.filename} from {transfer.nick} "
+                          f"({transfer.rate() / 1e6:.1f} MB/s) -> {transfer.path}", event='dcc', id=transfer.id)
+
+    def _flush(self, transfer, fd, data, offset):
+        written = os.pwrite(fd, data, offset)
+        transfer.transferred += written
+        DCC_BYTES_RECEIVED.inc(written)
+        return written
+
+    # Control
+
+    def cancel(self, transfer_id):
+        transfer = self.transfers.get(transfer_id)
+        if transfer is None:
+            return False
+        if transfer._task is not None and not transfer._task.done():
+            transfer._task.cancel()
+        elif transfer.state in ('offered', 'waiting'):
+            transfer.state = 'cancelled'
+        return True
+
+    def list(self):
+        return [transfer.as_dict() for transfer in self.transfers.values()]
+
+    def _find(self, direction, nick, filename, port, token):
+        for transfer in self.transfers.values():
+            if transfer.direction != direction or transfer.nick != nick:
+                continue
+            if token is not None:
+                if transfer.token == token:
+                    return transfer
+            elif transfer.filename == filename and str(transfer.port) == port:
+                return transfer
+        return None
+
+    async def handle(self, nick, contents):
+        """Processes an incoming CTCP DCC message from `nick`."""
+        parsed = parse_dcc(contents)
+        if parsed is None:
+            return
+        kind, filename, args = parsed
+        try:
+            if kind == 'SEND':
+                await self._handle_send(nick, filename, args)
+            elif kind == 'RESUME':
+                await self._handle_resume(nick, filename, args)
+            else:
+                self._handle_accept(nick, filename, args)
+        except (ValueError, IndexError):
+            self.console.noise(f"Ignoring malformed DCC {kind} from {nick}.", event='dcc')
+
+    async def _handle_send(self, nick, filename, args):
+        host, port, size = decode_address(args[0]), int(args[1]), int(args[2])
+        token = args[3] if len(args) > 3 else None
+        if token is not None and port:
+            # The answer to one of our passive offers: the receiver is now listening.
+            transfer = self._find('send', nick, filename, '0', token)
+            if transfer is not None and transfer.state == 'waiting':
+                async def connect_and_send():
+                    await self._send(transfer, await open_dcc_connection(host, port, self.proxy))
+                self._spawn(transfer, connect_and_send())
+                return
+
+        transfer = self._new_transfer('recv', nick, filename, size)
+        transfer.host, transfer.port, transfer.token = host, port, token
+        self.console.info(f"DCC #{transfer.id}: {nick} offers {filename} ({size} bytes). "
+                          f"Type /dcc get {transfer.id} to accept.", event='dcc', id=transfer.id)
+        if self.auto_accept:
+            await self.accept(transfer.id)
+
+    async def _handle_resume(self, nick, filename, args):
+        port, position = args[0], int(args[1])
+        token = args[2] if len(args) > 2 else None
+        transfer = self._find('send', nick, filename, port, token)
+        if transfer is None or transfer.state != 'waiting' or not 0 <= position <= transfer.size:
+            return
+        transfer.position = position
+        await self.send_ctcp(nick, self._with_token(f"ACCEPT {quote_filename(filename)} {port} {position}", transfer))
+
+    def _handle_accept(self, nick, filename, args):
+        port, position = args[0], int(args[1])
+        token = args[2] if len(args) > 2 else None
+        transfer = self._find('recv', nick, filename, port, token)
+        if transfer is not None and transfer._resume is not None and not transfer._resume.done():
+            transfer._resume.set_result(position)
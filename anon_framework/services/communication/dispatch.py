@@ -0,0 +1,148 @@
+# Fast-path inbound handling for the IRC client. Lines are split out of the
+# receive buffer in one pass, parsed into a slotted `Line`, and dispatched
+# through a handler table built once per client class instead of pydle's
+# per-message string formatting and getattr lookup.
+
+TAG_CONVERSIONS = {':': ';', 's': ' ', '\\': '\\', 'r': '\r', 'n': '\n'}
+TAGGED_MESSAGE_LENGTH_LIMIT = 1024
+FALLBACK_ENCODING = 'iso-8859-1'
+
+# Informational numerics pydle has no handler for (connection "please wait"
+# notices, the displayed-host notice). They are discarded without formatting
+# instead of being echoed through on_unknown. Numerics pydle does handle are
+# never discarded, even if listed here: it treats LUSERS and friends as a
+# registration fallback for servers that skip or reorder 001.
+QUIET_COMMANDS = frozenset({20, 396})
+
+_tables = {}
+
+
+class Line:
+    """
+    A compact, parsed IRC line.
+
+    Exposes the attributes pydle's handlers read from its own message objects
+    (`command`, `params`, `source`, `tags`, `_raw`, `_valid`) without the
+    per-instance `__dict__`.
+    """
+    __slots__ = ('command', 'params', 'source', 'tags', '_raw', '_valid')
+
+    def __init__(self, command, params, source=None, tags=None, raw=None, valid=True):
+        self.command = command
+        self.params = params
+        self.source = source
+        self.tags = tags if tags is not None else {}
+        self._raw = raw
+        self._valid = valid
+
+    def __str__(self):
+        if self._raw is not None:
+            return self._raw
+        parts = [str(self.command)] + list(self.params)
+        if self.params and (' ' in parts[-1] or not parts[-1] or parts[-1][0] == ':'):
+            parts[-1] = ':' + parts[-1]
+        if self.source:
+            parts.insert(0, ':' + self.source)
+        return ' '.join(parts)
+
+    def __repr__(self):
+        return f"Line({self.command!r}, {self.params!r}, source={self.source!r})"
+
+
+def _unescape_tag(value):
+    if '\\' not in value:
+        return value
+    out = []
+    chars = iter(value)
+    for ch in chars:
+        if ch == '\\':
+            escaped = next(chars, '')
+            out.append(TAG_CONVERSIONS.get(escaped, escaped))
+        else:
+            out.append(ch)
+    return ''.join(out)
+
+
+def _parse_tags(raw_tags):
+    tags = {}
+    for raw_tag in raw_tags.split(';'):
+        tag, _, value = raw_tag.partition('=')
+        # Empty and missing values are equivalent per the spec.
+        tags[tag] = _unescape_tag(value) if value else True
+    return tags
+
+
+def parse_line(raw, encoding='utf-8'):
+    """
+    Parses a single line (without the trailing newline) into a `Line`.
+
+    Args:
+        raw (bytes): The line as received from the socket.
+        encoding (str): The primary encoding; latin-1 is used as a fallback.
+
+    Returns:
+        Line: The parsed line, or None if the line is blank or has no command.
+    """
+    try:
+        text = raw.decode(encoding)
+    except UnicodeDecodeError:
+        text = raw.decode(FALLBACK_ENCODING)
+    if text.endswith('\r'):
+        text = text[:-1]
+    if not text:
+        return None
+    raw_text = text
+    valid = len(text) <= TAGGED_MESSAGE_LENGTH_LIMIT
+
+    tags = None
+    if text[0] == '@':
+        raw_tags, _, text = text.partition(' ')
+        tags = _parse_tags(raw_tags[1:])
+        text = text.lstrip(' ')
+
+    source = None
+    if text[:1] == ':':
+        source, _, text = text[1:].partition(' ')
+        text = text.lstrip(' ')
+
+    if text[:1] == ':':
+        return None
+    head, sep, trailing = text.partition(' :')
+    params = head.split()
+    if not params:
+        return None
+    command = params.pop(0)
+    if sep:
+        params.append(trailing)
+    command = int(command) if command.isdigit() else command.upper()
+    return Line(command, params, source=source, tags=tags, raw=raw_text, valid=valid)
+
+
+def split_lines(buffer):
+    """
+    Splits every complete line out of `buffer` in a single pass.
+
+    Returns:
+        tuple: (list of complete raw lines, remaining partial bytes).
+    """
+    lines = buffer.split(b'\n')
+    rest = lines.pop()
+    return lines, rest
+
+
+def dispatch_table(cls):
+    """
+    Returns a mapping of command (str or int numeric) to raw handler function
+    for the given client class. The table is built once per class.
+    """
+    table = _tables.get(cls)
+    if table is None:
+        table = {}
+        for name in dir(cls):
+            if not name.startswith('on_raw_'):
+                continue
+            suffix = name[len('on_raw_'):]
+            key = int(suffix) if suffix.isdigit() else suffix.upper()
+            table[key] = getattr(cls, name)
+        _tables[cls] = table
+    return table
@@ -1,11 +1,26 @@
 import asyncio
-import sys
 import threading
 import traceback
 from .menu import Menu
-from anon_framework.config.servers import SERVERS
+from .dcc import DCCManager
+from .membership import MembershipStore
+from .plugins import PluginEngine
+from .dispatch import QUIET_COMMANDS, dispatch_table, parse_line, split_lines
+from anon_framework.config.settings import get_config
+from anon_framework.services.dns_resolver import ResolveError, get_resolver
+from anon_framework.services.sam import SAMError, get_sam_client
+from anon_framework.utils import metrics
+from anon_framework.utils.console import get_console
+from anon_framework.utils.runtime import get_runtime
 import pydle
 from pydle.features.tls import TLSSupport
+# Query token pydle's WHOX support sends with `WHO <channel> %tnurha,<token>`.
+from pydle.features.whox import WHOX_IDENTIFIER
+
+MESSAGES_RECEIVED = metrics.counter('anon_irc_messages_received', 'IRC lines received from the server.')
+MESSAGES_IGNORED = metrics.counter('anon_irc_messages_ignored', 'Quiet numerics discarded on the fast path.')
+MESSAGES_SENT = metrics.counter('anon_irc_messages_sent', 'IRC lines sent to the server.')
+RECONNECTS = metrics.counter('anon_irc_reconnects', 'Unexpected IRC disconnects that triggered a reconnect.')
 
 class PatchedTLSSupport(TLSSupport):
     """
@@ -26,23 +41,65 @@ class PatchedTLSSupport(TLSSupport):
         # Call the original _connect method from the parent class (TLSSupport)
         return await super()._connect(hostname, port, **kwargs)
 
+class ResolvedConnection(pydle.connection.Connection):
+    """
+    A pydle connection that dials an address resolved elsewhere (through Tor)
+    while keeping the server's hostname for TLS, so SNI is sent and the
+    certificate is checked against the name rather than the IP.
+    """
+
+    def __init__(self, address, hostname, port, **kwargs):
+        super().__init__(hostname, port, **kwargs)
+        self.address = address
+
+    async def connect(self):
+        self.tls_context = self.create_tls_context() if self.tls else None
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                host=self.address,
+                port=self.port,
+                local_addr=self.source_address,
+                ssl=self.tls_context,
+                server_hostname=self.hostname if self.tls else None,
+            ),
+            timeout=self.CONNECT_TIMEOUT,
+        )
+
 class IRCClient(pydle.Client):
     """
     An IRC client rebuilt using the 'pydle' library for modern,
     asynchronous, and robust communication. This client inherits our patched
     TLS support to ensure compatibility with Tor/proxy connections.
     """
-    def __init__(self, nickname, channel, use_tor=False):
+    def __init__(self, nickname, channel, use_tor=False, tui=False):
         # By inheriting from our PatchedTLSSupport, we get all the standard
         # features plus our specific connection fix.
         super().__init__(nickname, realname='Anon-Framework User')
         
         self.target_channel = channel
         self.use_tor = use_tor
+        self.tui = tui
         self.menu = Menu(self)
-        self.servers = SERVERS
+        self.servers = get_config()['irc']['servers']
         self.is_connected = False
         self.identities = {}
+        self.console = get_console()
+        # Channel membership lives here rather than in pydle's per-user dicts.
+        self.members = MembershipStore()
+
+        irc_config, tor_config = get_config()['irc'], get_config()['tor']
+        self.dcc = DCCManager(
+            self._send_dcc,
+            irc_config['dcc_dir'],
+            host=irc_config['dcc_host'],
+            proxy=(tor_config['socks_host'], tor_config['socks_port']) if use_tor else None,
+            passive=irc_config['dcc_passive'],
+            auto_accept=irc_config['dcc_auto_accept'],
+            timeout=irc_config['dcc_timeout'],
+            console=self.console,
+        )
+        # Keyword/regex triggers and event hooks registered by plugins.
+        self.plugins = PluginEngine(self, timeout=irc_config['plugin_timeout'], console=self.console)
         
         # Create a synchronization event to signal disconnection.
         self._disconnected_event = asyncio.Event()
@@ -51,54 +108,235 @@ class IRCClient(pydle.Client):
         self.encoding = 'utf-8'
         self._fallback_encodings = ['latin-1', 'cp1252']
 
-    async def on_raw_motd(self, message):
+        # Handler lookup table, shared by all instances of this class.
+        self._raw_handlers = dispatch_table(type(self))
+        # Address to dial instead of resolving the hostname with the system resolver.
+        self.connect_address = None
+
+    async def _connect(self, hostname, port, reconnect=False, **kwargs):
+        """Dials `connect_address` when one is set, keeping `hostname` for TLS."""
+        if self.connect_address is not None and not reconnect:
+            self.connection = ResolvedConnection(
+                self.connect_address, hostname, port,
+                source_address=kwargs.get('source_address'),
+                tls=kwargs.get('tls', False),
+                tls_verify=kwargs.get('tls_verify', False),
+                tls_certificate_file=self.tls_client_cert,
+                tls_certificate_keyfile=self.tls_client_cert_key,
+                tls_certificate_password=self.tls_client_cert_password,
+            )
+            self._autojoin_channels = kwargs.get('channels') or []
+            self.encoding = kwargs.get('encoding', pydle.protocol.DEFAULT_ENCODING)
+            # pydle reuses an existing connection object when reconnecting.
+            reconnect = True
+        await super()._connect(hostname, port, reconnect=reconnect, **kwargs)
+
+    async def on_data(self, data):
+        """Splits all complete lines out of the buffer at once and parses them on the fast path."""
+        lines, self._receive_buffer = split_lines(self._receive_buffer + data)
+        for raw in lines:
+            message = parse_line(raw, self.encoding)
+            if message is not None:
+                asyncio.create_task(self.on_raw(message))
+
+    async def on_raw(self, message):
+        """Dispatches an inbound line through the precomputed handler table."""
+        MESSAGES_RECEIVED.inc()
+        command = message.command
+        handler = self._raw_handlers.get(command)
+        if handler is None and command in QUIET_COMMANDS:
+            MESSAGES_IGNORED.inc()
+            return
+        try:
+            with metrics.span("irc receive", 'anon_irc_handler_seconds'):
+                if 'account' in message.tags:
+                    # IRCv3 account-tag, as pydle's ircv3_2 on_raw applies it (this method replaces that chain).
+                    await self._sync_account_tag(message)
+                if handler is None:
+                    await self.on_unknown(message)
+                else:
+                    await handler(self, message)
+        except Exception:
+            self.logger.exception("Failed to execute handler for %s.", command)
+
+    async def _sync_account_tag(self, message):
+        nick, _ = self._parse_user(message.source)
+        if nick in self.users:
+            await self._sync_user(nick, {'identified': True, 'account': message.tags['account']})
+        user = self.members.user(nick) if nick else None
+        if user is not None:
+            user.account = None if message.tags['account'] in ('*', '') else message.tags['account']
+
+    async def rawmsg(self, command, *args, **kwargs):
+        """Counts and times every outbound line."""
+        MESSAGES_SENT.inc()
+        with metrics.span("irc send", 'anon_irc_send_seconds'):
+            await super().rawmsg(command, *args, **kwargs)
+
+    async def on_raw_372(self, message):
         """Called for each line of the Message of the Day."""
-        print(message)
+        await super().on_raw_372(message)
+        self.console.noise(message.params[1], event='motd')
+
+    async def on_raw_353(self, message):
+        """NAMES reply line; applied straight to the membership store, bypassing pydle's user dicts."""
+        self.members.names(message.params[2], message.params[-1])
+
+    async def on_raw_366(self, message):
+        """End of NAMES."""
+        self.members.end_of_names(message.params[1])
+
+    async def on_raw_354(self, message):
+        """WHOX reply (token, user, host, nick, account, realname) for pydle's channel WHO query."""
+        params = message.params
+        if len(params) >= 7 and params[1] == WHOX_IDENTIFIER:
+            self.members.whox(params[4], username=params[2], host=params[3], account=params[5], realname=params[6])
+
+    async def on_raw_join(self, message):
+        """Records joins. Only our own joins go through pydle, which sets up its channel state."""
+        nick, _, userhost = (message.source or '').partition('!')
+        username, _, host = userhost.partition('@')
+        # extended-join adds the account name and realname.
+        account = message.params[1] if len(message.params) > 2 else None
+        realname = message.params[2] if len(message.params) > 2 else None
+        if self.is_same_nick(self.nickname, nick):
+            await super().on_raw_join(message)
+        for channel in message.params[0].split(','):
+            self.members.join(channel, nick, username or None, host or None, account, realname)
+            if not self.is_same_nick(self.nickname, nick):
+                await self.on_join(channel, nick)
+
+    async def on_raw_part(self, message):
+        await super().on_raw_part(message)
+        nick = (message.source or '').partition('!')[0]
+        for channel in message.params[0].split(','):
+            if self.is_same_nick(self.nickname, nick):
+                self.members.remove_channel(channel)
+            else:
+                self.members.part(channel, nick)
+
+    async def on_raw_kick(self, message):
+        await super().on_raw_kick(message)
+        channel, target = message.params[0], message.params[1]
+        if self.is_same_nick(self.nickname, target):
+            self.members.remove_channel(channel)
+        else:
+            self.members.part(channel, target)
+
+    async def on_raw_quit(self, message):
+        await super().on_raw_quit(message)
+        self.members.quit((message.source or '').partition('!')[0])
+
+    async def on_raw_nick(self, message):
+        await super().on_raw_nick(message)
+        self.members.rename((message.source or '').partition('!')[0], message.params[0])
 
     async def on_unknown(self, message):
         """Called for any server message that doesn't have a specific handler."""
         # This prevents raw numerics from looking like an error.
         # The `message` object may not have a `.raw` attribute, so we
-        # convert it to a string for a safe, generic representation.
-        print(f"[Server] {str(message)}")
+        # convert it to a string for a safe, generic representation. The
+        # conversion is deferred to the console writer, which skips it
+        # entirely if the line is dropped under backpressure.
+        self.console.noise(lambda: f"[Server] {message}", event='server', command=message.command)
 
     async def on_connect(self):
         """Called when the client has successfully connected to the server."""
         await super().on_connect()
         # Get a reference to the event loop for threadsafe operations.
         self.loop = asyncio.get_running_loop()
-        print(f"Successfully connected to {self.connection.hostname}.")
+        self.console.info(f"Successfully connected to {self.connection.hostname}.", event='connect')
         self.is_connected = True
+        if self.dcc.host is None and not self.use_tor:
+            # Advertise the address we reach the server from unless irc.dcc_host overrides it.
+            self.dcc.host = self.connection.writer.get_extra_info('sockname')[0]
         # Clear the event in case of reconnects.
         self._disconnected_event.clear()
         if self.target_channel:
-            print(f"Joining channel {self.target_channel}...")
+            self.console.info(f"Joining channel {self.target_channel}...")
             await self.join(self.target_channel)
 
     async def on_join(self, channel, user):
         """Called when a user (including us) joins a channel."""
         if user == self.nickname:
-            print(f"Joined {channel}. Type messages and press Enter.")
-            print("Type /menu to access options, or /raw to send a raw command.")
+            self.console.info(f"Joined {channel}. Type messages and press Enter.", event='join', channel=channel)
+            self.console.info("Type /menu to access options, /raw to send a raw command, or /dcc for file transfers.")
+        else:
+            self.plugins.dispatch('join', channel, user)
+
+    async def on_part(self, channel, user, message=None):
+        if user != self.nickname:
+            self.plugins.dispatch('part', channel, user, message)
+
+    async def on_quit(self, user, message=None):
+        self.plugins.dispatch('quit', None, user, message)
+
+    async def on_nick_change(self, old, new):
+        self.plugins.dispatch('nick', None, old, new)
 
     async def on_message(self, target, source, message):
         """Called when a message is received in a channel or private query."""
         if source != self.nickname:
-            sys.stdout.write('\r' + ' ' * 80 + '\r')
-            print(f"<{source}> {message}")
-            sys.stdout.write(f"[{target or ''}]> ")
-            sys.stdout.flush()
+            # The console writer clears and repaints the input prompt around each batch.
+            self.console.info(f"<{source}> {message}", event='message', target=target, nick=source)
+            self.plugins.dispatch('message', target, source, message)
+
+    async def on_notice(self, target, source, message):
+        self.plugins.dispatch('notice', target, source, message)
+
+    async def on_ctcp_action(self, source, target, contents):
+        """Called for /me actions."""
+        self.console.info(f"* {source} {contents}", event='action', target=target, nick=source)
+        self.plugins.dispatch('action', target, source, contents)
 
     async def on_nickname_in_use(self, nickname):
         """Called when the desired nickname is already taken."""
         new_nickname = nickname + '_'
-        print(f"Nickname '{nickname}' is in use. Trying '{new_nickname}'.")
+        self.console.info(f"Nickname '{nickname}' is in use. Trying '{new_nickname}'.")
         await self.set_nickname(new_nickname)
 
+    async def on_ctcp_dcc(self, by, target, contents):
+        """Called for CTCP DCC requests (file offers, RESUME and ACCEPT)."""
+        await self.dcc.handle(by, contents)
+
+    async def _send_dcc(self, nick, contents):
+        await self.ctcp(nick, 'DCC', contents)
+
+    async def _dcc_call(self, coro):
+        try:
+            await coro
+        except (OSError, KeyError, ConnectionError) as e:
+            self.console.error(f"DCC: {e}", event='dcc')
+
+    def handle_dcc_command(self, args):
+        """Handles '/dcc send <nick> <path>', '/dcc get <id>', '/dcc cancel <id>' and '/dcc list'."""
+        action = args[0] if args else 'list'
+        try:
+            if action == 'send' and len(args) == 3:
+                asyncio.run_coroutine_threadsafe(self._dcc_call(self.dcc.offer(args[1], args[2])), self.loop)
+            elif action == 'get' and len(args) == 2:
+                asyncio.run_coroutine_threadsafe(self._dcc_call(self.dcc.accept(int(args[1]))), self.loop)
+            elif action == 'cancel' and len(args) == 2:
+                self.loop.call_soon_threadsafe(self.dcc.cancel, int(args[1]))
+            elif action == 'list':
+                for transfer in self.dcc.list():
+                    self.console.info(
+                        f"#{transfer['id']} {transfer['direction']} {transfer['filename']} {transfer['nick']}: "
+                        f"{transfer['state']} {transfer['done']}/{transfer['size']} ({transfer['rate'] / 1e6:.1f} MB/s)",
+                        event='dcc')
+            else:
+                self.console.error("Usage: /dcc send <nick> <path> | /dcc get <id> | /dcc cancel <id> | /dcc list")
+        except ValueError:
+            self.console.error("DCC transfer ids are numbers.")
+
     async def on_disconnect(self, expected):
         """Called when the client disconnects from the server."""
+        if not expected:
+            RECONNECTS.inc()
         await super().on_disconnect(expected)
-        print("\nDisconnected from server.")
+        if expected:
+            await self.plugins.close()
+        self.console.error("Disconnected from server.", event='disconnect', expected=expected)
         self.is_connected = False
         # Signal that the client has disconnected.
         self._disconnected_event.set()
@@ -109,34 +347,34 @@ class IRCClient(pydle.Client):
         if self.is_connected and self.target_channel:
             asyncio.run_coroutine_threadsafe(self.message(self.target_channel, message), self.loop)
         else:
-            print("You are not in a channel.")
+            self.console.error("You are not in a channel.")
 
     def send_raw_command(self, command, *args):
         """Sends a raw command, scheduled on the event loop."""
         if self.is_connected:
-            print(f"--> {command} {' '.join(args)}")
+            self.console.info(f"--> {command} {' '.join(args)}", event='raw')
             asyncio.run_coroutine_threadsafe(self.raw(command, *args), self.loop)
         else:
-            print("You are not connected to a server.")
+            self.console.error("You are not connected to a server.")
 
     def list_channels(self):
-        print("Requesting channel list...")
+        self.console.info("Requesting channel list...")
         self.send_raw_command("LIST")
 
     def search_channels(self, query):
-        print(f"Searching for channels matching '{query}'...")
+        self.console.info(f"Searching for channels matching '{query}'...")
         self.send_raw_command("LIST", f"*{query}*")
 
     def join_channel(self, channel):
         if not channel.startswith("#"):
             channel = "#" + channel
         self.target_channel = channel
-        print(f"Joining {channel}...")
+        self.console.info(f"Joining {channel}...")
         asyncio.run_coroutine_threadsafe(self.join(channel), self.loop)
 
     def leave_channel(self):
         if self.target_channel:
-            print(f"Leaving {self.target_channel}...")
+            self.console.info(f"Leaving {self.target_channel}...")
             asyncio.run_coroutine_threadsafe(self.part(self.target_channel), self.loop)
             self.target_channel = None
 
@@ -155,12 +393,17 @@ class IRCClient(pydle.Client):
         try:
             while self.is_connected:
                 prompt = f"[{self.target_channel or 'No Channel'}]> "
+                self.console.set_prompt(prompt)
                 message = input(prompt)
 
                 if not self.is_connected:
                     break
 
                 if message == '/menu':
+                    # The menu prints directly, so let queued output land first
+                    # and stop repainting the channel prompt underneath it.
+                    self.console.set_prompt(None)
+                    self.console.flush()
                     self.menu.current_menu = "main"
                     while self.is_connected:
                         self.menu.display_menu()
@@ -168,23 +411,40 @@ class IRCClient(pydle.Client):
                         if not self.menu.handle_choice(choice):
                             print("\n--- Exited menu. You are back in the channel. ---")
                             break
+                elif message.startswith('/dcc'):
+                    self.handle_dcc_command(message.split(' ', 3)[1:] if message.startswith('/dcc send') else message.split()[1:])
+                elif message == '/plugins':
+                    self.console.info(
+                        f"Plugins: {', '.join(self.plugins.plugins) or 'none'} "
+                        f"({len(self.plugins.triggers)} triggers, {self.plugins.pending()} running)", event='plugin')
                 elif message.startswith('/raw '):
                     parts = message.split(' ', 1)
                     if len(parts) > 1:
                         self.send_raw_command(*parts[1].split(' '))
                 elif message.startswith('/'):
-                    print(f"Unknown command: '{message}'.")
+                    self.console.error(f"Unknown command: '{message}'.")
                 else:
                     self.send_message(message)
         except (EOFError, KeyboardInterrupt):
-            print("\nDisconnecting...")
+            self.console.set_prompt(None)
+            self.console.error("Disconnecting...")
             self.disconnect()
         
 
     async def start(self):
         """Configures and starts the IRC client."""
+        resolve_dns = not self.use_tor and get_config()['dns']['mode'] != 'off'
+        prefetch = None
+        if resolve_dns:
+            # Warm the Tor resolver cache for every known server while the user is still choosing.
+            prefetch = asyncio.ensure_future(get_resolver().prefetch(
+                [server['host'] for server in self.servers if not server['host'].endswith('.i2p')]))
+            # Retrieve any failure so it is never reported as "Task exception was never retrieved".
+            prefetch.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+        runtime = get_runtime()
         default_nickname = self.nickname or 'anon_framework_user'
-        custom_nickname = input(f"Enter your nickname (default: {default_nickname}): ").strip()
+        custom_nickname = (await runtime.to_thread(input, f"Enter your nickname (default: {default_nickname}): ")).strip()
         if custom_nickname:
             self.nickname = custom_nickname
 
@@ -195,7 +455,7 @@ class IRCClient(pydle.Client):
         server_info = None
         while not server_info:
             try:
-                choice = int(input("Enter your choice: "))
+                choice = int(await runtime.to_thread(input, "Enter your choice: "))
                 if 1 <= choice <= len(self.servers):
                     server_info = self.servers[choice - 1]
             except (ValueError, EOFError):
@@ -208,17 +468,55 @@ class IRCClient(pydle.Client):
         ssl = server_info.get("ssl", False)
         
         proxy = None
-        if self.use_tor:
+        forwarder = None
+        address = None
+        if host.endswith('.i2p'):
+            if prefetch is not None:
+                # No DNS is involved in reaching an eepsite.
+                prefetch.cancel()
+            # pydle can only dial TCP, so it connects to a local port forwarded over a SAM stream.
+            print("Connecting through the I2P SAM bridge (tunnels are built on first use)...")
+            try:
+                forwarder = await get_sam_client().forward(host, port)
+            except SAMError as e:
+                print(f"Could not reach {host} over I2P: {e}")
+                return
+            host, port = '127.0.0.1', forwarder.sockets[0].getsockname()[1]
+        elif self.use_tor:
             print("Configuring connection via Tor...")
-            proxy = pydle.protocol.SOCKS5Proxy('127.0.0.1', 9050)
+            tor_config = get_config()['tor']
+            proxy = pydle.protocol.SOCKS5Proxy(tor_config['socks_host'], tor_config['socks_port'])
+        elif resolve_dns:
+            # Resolve through Tor instead of the system resolver so the lookup does not leak.
+            await prefetch
+            try:
+                # Dial the resolved address, but keep the name for TLS (SNI and certificate checks).
+                address = (await get_resolver().resolve(host))[0]
+            except ResolveError as e:
+                print(f"Could not resolve {host} through Tor: {e}")
+                if get_config()['dns']['fail_closed']:
+                    print("Start Tor, or set dns.mode=off to use the system resolver.")
+                    return
+                print("Falling back to the system resolver (set dns.fail_closed=true to refuse instead).")
 
-        input_thread = threading.Thread(target=self.input_loop, daemon=True)
-        input_thread.start()
+        if not self.tui:
+            input_thread = threading.Thread(target=self.input_loop, daemon=True)
+            input_thread.start()
 
-        print(f"Connecting to {host}:{port}...")
+        print(f"Connecting to {host}:{port}" + (f" ({address})" if address else "") + "...")
+        terminal_ui = None
         try:
             # We instantiate our patched client here.
-            client_instance = IRCClient(self.nickname, self.target_channel)
+            client_instance = IRCClient(self.nickname, self.target_channel, use_tor=self.use_tor)
+            client_instance.connect_address = address
+            irc_config = get_config()['irc']
+            client_instance.plugins.load(irc_config['plugins'], irc_config['plugin_dir'])
+            if self.tui:
+                # The terminal UI reads keys and redraws from the event loop; no input thread.
+                # curses is imported only here since it is missing on some platforms (Windows).
+                from .tui import TerminalUI
+                terminal_ui = TerminalUI(client_instance)
+                terminal_ui.start()
             
             await client_instance.connect(
                 hostname=host,
@@ -231,11 +529,17 @@ class IRCClient(pydle.Client):
             # We just need to wait for our disconnection event to be set.
             await client_instance._disconnected_event.wait()
         except Exception as e:
+            if terminal_ui is not None:
+                terminal_ui.stop()
             print(f"Failed to connect: {e}")
             print("\n--- DETAILED ERROR ---")
             traceback.print_exc()
             print("----------------------\n")
         finally:
             # The loop is managed by asyncio.run(), so we don't need to stop it manually.
-            pass
+            if terminal_ui is not None:
+                terminal_ui.stop()
+            if forwarder is not None:
+                # Stop listening for local connections to the I2P forwarder.
+                forwarder.close()
 
@@ -0,0 +1,275 @@
+# Channel membership tracking for the IRC client. pydle keeps a dict per user
+# plus per-channel user sets; in channels with tens of thousands of members
+# that state dominates the client's memory. This store keeps one slotted
+# record per user, interned case-folded nick keys shared by every channel
+# set, and status prefixes only for the (few) members that have one.
+import sys
+
+# RFC 1459 casemapping: []\~ are the upper-case forms of {}|^.
+RFC1459_CASEMAP = str.maketrans('[]\\~', '{}|^')
+DEFAULT_PREFIXES = '~&@%+'
+
+
+def fold(name):
+    """Case-folds a nick or channel name using RFC 1459 casemapping."""
+    # str.translate is several times slower than str.lower, and most nicks
+    # contain none of the four special characters, so it only runs when needed.
+    name = name.lower()
+    if '[' in name or ']' in name or '\\' in name or '~' in name:
+        return name.translate(RFC1459_CASEMAP)
+    return name
+
+
+class User:
+    """One known user. `channels` counts shared channels; the record is dropped at zero."""
+    __slots__ = ('nick', 'username', 'host', 'account', 'realname', 'channels')
+
+    def __init__(self, nick):
+        self.nick = nick
+        self.username = None
+        self.host = None
+        self.account = None
+        self.realname = None
+        self.channels = 0
+
+    def __repr__(self):
+        return f"User({self.nick!r}, channels={self.channels})"
+
+
+class Channel:
+    """Members of one channel as a set of folded nick keys."""
+    __slots__ = ('name', 'members', 'prefixes', '_pending', '_pending_prefixes')
+
+    def __init__(self, name):
+        self.name = name
+        self.members = set()
+        # Only members with a status prefix (@, + ...) have an entry here.
+        self.prefixes = {}
+        # Membership being rebuilt by an in-progress NAMES reply (353 ... 366).
+        self._pending = None
+        self._pending_prefixes = None
+
+    def __len__(self):
+        return len(self.members)
+
+
+class MembershipStore:
+    """
+    Tracks who is in which channel.
+
+    Nick keys are case-folded and interned, so every channel set and the user
+    table share one string object per nick. NAMES replies are applied line by
+    line into a fresh set that replaces the old membership on 366, so a
+    refresh never holds the whole reply in memory and drops members that left
+    while it was out of date.
+    """
+
+    def __init__(self, prefixes=DEFAULT_PREFIXES):
+        """
+        Args:
+            prefixes (str): Status prefix characters the server uses in NAMES (ISUPPORT PREFIX).
+        """
+        self.prefixes = prefixes
+        self.users = {}
+        self.channels = {}
+        # Bumped on every visible membership change, so views (nick lists) know when to refresh.
+        self.changes = 0
+
+    def _key(self, nick):
+        return sys.intern(fold(nick))
+
+    def _add_member(self, channel, key, nick):
+        user = self.users.get(key)
+        if user is None:
+            user = self.users[key] = User(nick)
+        user.channels += 1
+        channel.members.add(key)
+        self.changes += 1
+
+    def _has(self, channel, key):
+        return key in channel.members or (channel._pending is not None and key in channel._pending)
+
+    def _drop_member(self, channel, key):
+        self.changes += 1
+        channel.members.discard(key)
+        channel.prefixes.pop(key, None)
+        if channel._pending is not None:
+            channel._pending.discard(key)
+            channel._pending_prefixes.pop(key, None)
+        user = self.users.get(key)
+        if user is not None:
+            user.channels -= 1
+            if user.channels <= 0:
+                del self.users[key]
+
+    def channel(self, name, create=False):
+        key = fold(name)
+        channel = self.channels.get(key)
+        if channel is None and create:
+            channel = self.channels[key] = Channel(name)
+        return channel
+
+    # Events
+
+    def join(self, channel_name, nick, username=None, host=None, account=None, realname=None):
+        """Records `nick` joining a channel (extended-join fields are optional)."""
+        channel = self.channel(channel_name, create=True)
+        key = self._key(nick)
+        if not self._has(channel, key):
+            self._add_member(channel, key, nick)
+        if channel._pending is not None:
+            channel._pending.add(key)
+        user = self.users[key]
+        if username is not None:
+            user.username, user.host = username, host
+        if account is not None:
+            user.account = None if account == '*' else account
+        if realname is not None:
+            user.realname = realname
+
+    def part(self, channel_name, nick):
+        """Records `nick` leaving a channel (PART or KICK)."""
+        channel = self.channel(channel_name)
+        if channel is not None:
+            key = fold(nick)
+            if self._has(channel, key):
+                self._drop_member(channel, key)
+
+    def quit(self, nick):
+        """Removes `nick` from every channel."""
+        key = fold(nick)
+        for channel in self.channels.values():
+            if self._has(channel, key):
+                self._drop_member(channel, key)
+
+    def rename(self, old, new):
+        """Applies a NICK change everywhere."""
+        old_key, new_key = fold(old), self._key(new)
+        user = self.users.pop(old_key, None)
+        if user is None:
+            return
+        user.nick = new
+        self.users[new_key] = user
+        self.changes += 1
+        if old_key == new_key:
+            return
+        for channel in self.channels.values():
+            if old_key in channel.members:
+                channel.members.remove(old_key)
+                channel.members.add(new_key)
+                if old_key in channel.prefixes:
+                    channel.prefixes[new_key] = channel.prefixes.pop(old_key)
+            if channel._pending is not None and old_key in channel._pending:
+                channel._pending.remove(old_key)
+                channel._pending.add(new_key)
+                if old_key in channel._pending_prefixes:
+                    channel._pending_prefixes[new_key] = channel._pending_prefixes.pop(old_key)
+
+    def remove_channel(self, channel_name):
+        """Forgets a channel we left, releasing users who are in no other tracked channel."""
+        channel = self.channels.pop(fold(channel_name), None)
+        if channel is None:
+            return
+        self.changes += 1
+        keys = channel.members if channel._pending is None else channel.members | channel._pending
+        for key in keys:
+            user = self.users.get(key)
+            if user is not None:
+                user.channels -= 1
+                if user.channels <= 0:
+                    del self.users[key]
+
+    def names(self, channel_name, entries):
+        """
+        Applies one RPL_NAMREPLY (353) line.
+
+        Args:
+            channel_name (str): The channel the reply is for.
+            entries (str): The space-separated names parameter, e.g. '@alice +bob carol!c@host'.
+        """
+        channel = self.channel(channel_name, create=True)
+        if channel._pending is None:
+            channel._pending = set()
+            channel._pending_prefixes = {}
+        pending, pending_prefixes, members = channel._pending, channel._pending_prefixes, channel.members
+        prefixes = self.prefixes
+        users = self.users
+        for entry in entries.split():
+            nick = entry.lstrip(prefixes)
+            status = entry[:len(entry) - len(nick)]
+            nick, _, userhost = nick.partition('!')
+            key = sys.intern(fold(nick))
+            if key not in members and key not in pending:
+                user = users.get(key)
+                if user is None:
+                    user = users[key] = User(nick)
+                user.channels += 1
+            pending.add(key)
+            if status:
+                pending_prefixes[key] = status
+            if userhost:
+                user = users[key]
+                user.username, _, user.host = userhost.partition('@')
+
+    def end_of_names(self, channel_name):
+        """Applies RPL_ENDOFNAMES (366): the collected reply becomes the channel's membership."""
+        channel = self.channel(channel_name)
+        if channel is None or channel._pending is None:
+            return
+        pending = channel._pending
+        for key in channel.members:
+            if key not in pending:
+                user = self.users.get(key)
+                if user is not None:
+                    user.channels -= 1
+                    if user.channels <= 0:
+                        del self.users[key]
+        channel.members = pending
+        channel.prefixes = channel._pending_prefixes
+        self.changes += 1
+        channel._pending = channel._pending_prefixes = None
+
+    def whox(self, nick, username=None, host=None, account=None, realname=None):
+        """Fills in user details from a WHOX (354) reply. Unknown nicks are ignored."""
+        user = self.users.get(fold(nick))
+        if user is None:
+            return
+        user.username, user.host = username, host
+        user.account = None if account in (None, '0') else account
+        user.realname = realname
+
+    # Queries
+
+    def user(self, nick):
+        return self.users.get(fold(nick))
+
+    def is_member(self, channel_name, nick):
+        channel = self.channel(channel_name)
+        return channel is not None and fold(nick) in channel.members
+
+    def members(self, channel_name):
+        """Returns the display nicks of a channel's members."""
+        channel = self.channel(channel_name)
+        if channel is None:
+            return []
+        users = self.users
+        return [users[key].nick for key in channel.members if key in users]
+
+    def prefix(self, channel_name, nick):
+        """Returns the status prefix of `nick` in a channel ('' if none)."""
+        channel = self.channel(channel_name)
+        return channel.prefixes.get(fold(nick), '') if channel is not None else ''
+
+    def channels_of(self, nick):
+        key = fold(nick)
+        return [channel.name for channel in self.channels.values() if key in channel.members]
+
+    def complete(self, channel_name, partial, limit=None):
+        """Returns members whose nick starts with `partial` (case-insensitive), sorted."""
+        channel = self.channel(channel_name)
+        if channel is None:
+            return []
+        start = fold(partial)
+        users = self.users
+        matches = sorted(users[key].nick for key in channel.members if key.startswith(start) and key in users)
+        return matches[:limit] if limit else matches
@@ -0,0 +1,470 @@
+# Plugin engine for the IRC client. Plugins register keyword and regex
+# triggers plus plain event hooks; every line is matched against all
+# triggers at once and matching handlers run as independent tasks with a
+# timeout, so a slow or stuck plugin never delays the receive loop.
+import asyncio
+import importlib
+import importlib.util
+import inspect
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from anon_framework.utils import metrics
+from anon_framework.utils.console import get_console
+
+EVENTS = ('message', 'notice', 'action', 'join', 'part', 'quit', 'nick')
+TEXT_EVENTS = ('message', 'notice', 'action')
+DEFAULT_TIMEOUT = 5
+# Threads for plain-function handlers. They are the plugins' own, so handlers that
+# never return cannot starve the runtime's executor used for VPN, torrent and DNS calls.
+PLUGIN_WORKERS = 4
+# Regex triggers are grouped into alternations of at most this many patterns;
+# a line only reaches the individual patterns of a group whose alternation matched.
+GROUP_SIZE = 32
+
+WORD = re.compile(r'\w+')
+
+PLUGIN_RUNS = metrics.counter('anon_irc_plugin_runs', 'Plugin handler invocations.')
+PLUGIN_TIMEOUTS = metrics.counter('anon_irc_plugin_timeouts', 'Plugin handlers cancelled for exceeding their timeout.')
+PLUGIN_ERRORS = metrics.counter('anon_irc_plugin_errors', 'Plugin handlers that raised an exception.')
+PLUGIN_REFUSED = metrics.counter('anon_irc_plugin_refused',
+                                 'Plain-function handlers skipped because timed-out handlers held every plugin thread.')
+
+
+class Event:
+    """What a handler receives: the event kind, where it happened, and what matched."""
+    __slots__ = ('kind', 'target', 'source', 'text', 'match')
+
+    def __init__(self, kind, target, source, text=None, match=None):
+        self.kind = kind
+        self.target = target
+        self.source = source
+        self.text = text
+        # The matched keyword (str) for keyword triggers, the re.Match for regex triggers.
+        self.match = match
+
+    def __repr__(self):
+        return f"Event({self.kind!r}, {self.target!r}, {self.source!r}, {self.text!r})"
+
+
+class Trigger:
+    """
+    A handler bound to events, optionally filtered by a keyword or regex.
+
+    Keywords match whole words case-insensitively. A trigger without a
+    pattern is a hook and runs for every event of its kinds.
+    """
+    __slots__ = ('name', 'handler', 'events', 'pattern', 'regex', 'ignore_case', 'timeout', 'compiled')
+
+    def __init__(self, handler, pattern=None, regex=False, ignore_case=True, events=('message',), timeout=None,
+                 name=None):
+        """
+        Args:
+            handler (callable): `async def handler(client, event)`. Plain functions run on the
+                engine's thread pool; a timeout stops waiting for them but cannot interrupt the thread.
+            pattern (str): Keyword or regular expression; None for a hook.
+            regex (bool): Treat `pattern` as a regular expression.
+            ignore_case (bool): Case-insensitive matching.
+            events (iterable): Event kinds from EVENTS.
+            timeout (int): Seconds the handler may run (defaults to the engine's timeout).
+            name (str): Display name; defaults to the handler's qualified name.
+        """
+        unknown = set(events) - set(EVENTS)
+        if unknown:
+            raise ValueError(f"Unknown event(s) {sorted(unknown)}. Choices are {list(EVENTS)}.")
+        self.name = name or getattr(handler, '__qualname__', repr(handler))
+        self.handler = handler
+        self.events = tuple(events)
+        self.pattern = pattern
+        self.regex = regex
+        self.ignore_case = ignore_case
+        self.timeout = timeout
+        self.compiled = None
+        if pattern is not None:
+            if regex:
+                self.compiled = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+            elif not self.is_word:
+                # Keywords with punctuation or spaces are matched as bounded literal regexes.
+                self.compiled = re.compile(self.expression, re.IGNORECASE if ignore_case else 0)
+
+    @property
+    def is_word(self):
+        """True for keywords that are a single word, which are matched by lookup instead of regex."""
+        return self.pattern is not None and not self.regex and self.ignore_case and WORD.fullmatch(self.pattern) is not None
+
+    @property
+    def expression(self):
+        """The trigger's regular expression source (keywords are escaped and word-bounded)."""
+        if self.regex:
+            return self.pattern
+        return rf'(?<!\w){re.escape(self.pattern)}(?!\w)'
+
+    def __repr__(self):
+        return f"Trigger({self.name!r}, {self.pattern!r}, events={self.events!r})"
+
+
+# Escapes whose meaning does not change when the text is lower-cased.
+_FOLD_SAFE_ESCAPES = frozenset('wWdDsSbBAZ.\\^$*+?()[]{}|/-#&~:!=<>\'"@%, ')
+
+
+def _fold_safe(pattern):
+    """
+    True if an ignore-case `pattern` can be tested case-sensitively against the
+    lower-cased (ASCII) text instead: it is ASCII, has no upper-case letters,
+    only escapes that are unaffected by case, and only a-z or 0-9 ranges.
+    """
+    if not pattern.isascii():
+        return False
+    class_start = None
+    i, end = 0, len(pattern)
+    while i < end:
+        ch = pattern[i]
+        if ch == '\\':
+            if pattern[i + 1:i + 2] not in _FOLD_SAFE_ESCAPES:
+                return False
+            i += 1
+        elif ch.isupper():
+            return False
+        elif class_start is None:
+            if ch == '[':
+                class_start = i + 2 if pattern[i + 1:i + 2] == '^' else i + 1
+        elif ch == ']' and i > class_start:
+            class_start = None
+        elif ch == '-' and class_start < i < end - 1 and pattern[i + 1] != ']':
+            low, high = pattern[i - 1], pattern[i + 1]
+            if not (('a' <= low <= high <= 'z') or ('0' <= low <= high <= '9')):
+                return False
+        i += 1
+    return True
+
+
+def _alternation(triggers, flags):
+    """Returns the triggers' expressions as one pattern, or None if they cannot be combined (e.g. global inline flags)."""
+    try:
+        return re.compile('|'.join(f'(?:{trigger.expression})' for trigger in triggers), flags)
+    except re.error:
+        return None
+
+
+def _lead(trigger):
+    """Groups patterns by how they start: the regex engine can skip ahead quickly in an
+    alternation whose branches all begin with a literal, but not in a mixed one."""
+    expression = trigger.expression
+    return '' if expression[:1].isalnum() else expression[:2]
+
+
+class _Bank:
+    """
+    Regex triggers that share a case mode, split into alternations of up to
+    GROUP_SIZE patterns that start alike. A line is only tested against the
+    individual patterns of a group whose alternation matched.
+
+    A folded bank holds ignore-case triggers whose gates are compiled
+    case-sensitively and run on the lower-cased line, which the regex engine
+    scans several times faster than an IGNORECASE alternation. Non-ASCII
+    lines (where lower-casing can change lengths) use IGNORECASE gates.
+    """
+
+    def __init__(self, triggers, folded=False, ignore_case=False):
+        self.folded = folded
+        by_lead = {}
+        for trigger in triggers:
+            by_lead.setdefault(_lead(trigger), []).append(trigger)
+        self.groups = []
+        for similar in by_lead.values():
+            for start in range(0, len(similar), GROUP_SIZE):
+                group = similar[start:start + GROUP_SIZE]
+                self.groups.append((self._gates(group, ignore_case), group))
+
+    def _gates(self, triggers, ignore_case):
+        """Returns (gate for lower-cased ASCII lines, gate for the original line)."""
+        if self.folded:
+            return _alternation(triggers, 0), _alternation(triggers, re.IGNORECASE)
+        gate = _alternation(triggers, re.IGNORECASE if ignore_case else 0)
+        return gate, gate
+
+    def match(self, text, lowered, found):
+        if lowered is not None and self.folded:
+            subject, which = lowered, 0
+        else:
+            subject, which = text, 1
+        for gates, group in self.groups:
+            gate = gates[which]
+            if gate is not None and gate.search(subject) is None:
+                continue
+            for trigger in group:
+                match = trigger.compiled.search(text)
+                if match is not None:
+                    found.append((trigger, match))
+
+
+class Matcher:
+    """
+    All the text triggers of one event kind, compiled together.
+
+    Single-word keywords are folded into one dict and matched with a single
+    word scan of the line. Regex (and multi-word keyword) triggers are joined
+    into gate alternations that reject non-matching lines in a single pass
+    (see `_Bank`), so a line is only tested against individual patterns
+    whose group matched.
+    """
+
+    def __init__(self, triggers):
+        self.keywords = {}
+        self.hooks = []
+        folded, ignore_case, exact = [], [], []
+        for trigger in triggers:
+            if trigger.pattern is None:
+                self.hooks.append(trigger)
+            elif trigger.is_word:
+                self.keywords.setdefault(trigger.pattern.lower(), []).append(trigger)
+            elif trigger.ignore_case and _fold_safe(trigger.expression):
+                folded.append(trigger)
+            elif trigger.ignore_case:
+                ignore_case.append(trigger)
+            else:
+                exact.append(trigger)
+        self.banks = []
+        if folded:
+            self.banks.append(_Bank(folded, folded=True))
+        if ignore_case:
+            self.banks.append(_Bank(ignore_case, ignore_case=True))
+        if exact:
+            self.banks.append(_Bank(exact))
+
+    def match(self, text):
+        """Returns (trigger, match) pairs for every trigger that matches `text`, hooks included."""
+        found = [(trigger, None) for trigger in self.hooks]
+        if text is None:
+            return found
+        lowered = text.lower()
+        if self.keywords:
+            keywords = self.keywords
+            for word in keywords.keys() & set(WORD.findall(lowered)):
+                found.extend((trigger, word) for trigger in keywords[word])
+        if self.banks:
+            if not text.isascii():
+                lowered = None
+            for bank in self.banks:
+                bank.match(text, lowered, found)
+        return found
+
+
+class PluginEngine:
+    """
+    Registers triggers and runs their handlers for IRC client events.
+
+    Matchers are rebuilt lazily after triggers change, so registering many
+    triggers costs one compile. Each handler runs in its own task and is
+    cancelled once it exceeds its timeout; errors and timeouts are reported
+    and counted but never propagate into the client.
+
+    Plain-function handlers run on a small pool of the engine's own. A thread
+    cannot be cancelled, so one that outlives its timeout is tracked as
+    abandoned until it returns; while abandoned handlers hold every thread,
+    further plain-function handlers are skipped instead of queued.
+    """
+
+    def __init__(self, client, timeout=DEFAULT_TIMEOUT, console=None, workers=PLUGIN_WORKERS):
+        """
+        Args:
+            client: The IRCClient handlers receive as their first argument.
+            timeout (int): Default per-handler timeout in seconds.
+            console: Where handler failures are reported (defaults to the shared console).
+            workers (int): Threads available to plain-function handlers.
+        """
+        self.client = client
+        self.timeout = timeout
+        self.console = console or get_console()
+        self.workers = workers
+        self.triggers = []
+        self.plugins = []
+        self._matchers = None
+        # Running handler task -> its timeout timer.
+        self._tasks = {}
+        self._executor = None
+        # Thread futures of handlers that timed out but are still running.
+        self._abandoned = set()
+
+    # Registration
+
+    def add(self, trigger):
+        self.triggers.append(trigger)
+        self._matchers = None
+        return trigger
+
+    def remove(self, name):
+        """Removes every trigger called `name`. Returns how many were removed."""
+        before = len(self.triggers)
+        self.triggers = [trigger for trigger in self.triggers if trigger.name != name]
+        self._matchers = None
+        return before - len(self.triggers)
+
+    def trigger(self, pattern, regex=False, ignore_case=True, events=('message',), timeout=None, name=None):
+        """
+        Decorator registering a keyword or regex trigger.
+
+        Example:
+            @engine.trigger(r'https?://\\S+', regex=True)
+            async def log_url(client, event):
+                ...
+        """
+        def decorator(handler):
+            self.add(Trigger(handler, pattern, regex, ignore_case, events, timeout, name))
+            return handler
+        return decorator
+
+    def hook(self, *events, timeout=None, name=None):
+        """Decorator registering a handler for every event of the given kinds (default: messages)."""
+        def decorator(handler):
+            self.add(Trigger(handler, events=events or ('message',), timeout=timeout, name=name))
+            return handler
+        return decorator
+
+    def load(self, module_names=(), plugin_dir=None):
+        """
+        Imports plugins and calls their `setup(engine)` function.
+
+        Args:
+            module_names (iterable): Importable module names.
+            plugin_dir (str): Directory whose *.py files are loaded as plugins.
+
+        Returns:
+            list: The names of the plugins that loaded.
+        """
+        modules = []
+        for module_name in module_names:
+            modules.append((module_name, lambda name=module_name: importlib.import_module(name)))
+        if plugin_dir:
+            plugin_dir = os.path.expanduser(plugin_dir)
+            for filename in sorted(os.listdir(plugin_dir)) if os.path.isdir(plugin_dir) else ():
+                if filename.endswith('.py') and not filename.startswith('_'):
+                    path = os.path.join(plugin_dir, filename)
+                    modules.append((filename[:-3], lambda path=path: self._import_file(path)))
+
+        loaded = []
+        for name, importer in modules:
+            try:
+                module = importer()
+                setup = getattr(module, 'setup', None)
+                if setup is None:
+                    raise AttributeError("plugin has no setup(engine) function")
+                setup(self)
+            except Exception as e:
+                self.console.error(f"Could not load plugin '{name}': {e!r}", event='plugin', plugin=name)
+                continue
+            self.plugins.append(name)
+            loaded.append(name)
+        return loaded
+
+    @staticmethod
+    def _import_file(path):
+        name = f"anon_framework_plugin_{os.path.splitext(os.path.basename(path))[0]}"
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    # Dispatch
+
+    def _matcher(self, kind):
+        if self._matchers is None:
+            self._matchers = {
+                event: Matcher([trigger for trigger in self.triggers if event in trigger.events])
+                for event in EVENTS
+            }
+        return self._matchers[kind]
+
+    def dispatch(self, kind, target, source, text=None):
+        """
+        Matches an event against the triggers and starts a task per matching handler.
+
+        Must be called on the event loop. Returns the number of handlers started.
+        """
+        matches = self._matcher(kind).match(text if kind in TEXT_EVENTS else None)
+        if not matches:
+            return 0
+        loop = asyncio.get_running_loop()
+        for trigger, match in matches:
+            task = loop.create_task(self._run(trigger, Event(kind, target, source, text, match)))
+            timeout = trigger.timeout or self.timeout
+            # A timer rather than asyncio.wait_for, which would start a second task per handler.
+            # The dict also keeps the task referenced so it is not garbage collected mid-run.
+            self._tasks[task] = loop.call_later(timeout, self._expire, task, trigger, timeout)
+            task.add_done_callback(self._finished)
+        return len(matches)
+
+    async def _run(self, trigger, event):
+        threaded = not inspect.iscoroutinefunction(trigger.handler)
+        if threaded and len(self._abandoned) >= self.workers:
+            PLUGIN_REFUSED.inc()
+            self.console.error(f"Plugin handler '{trigger.name}' skipped: all {self.workers} plugin threads "
+                               f"are held by handlers that timed out.", event='plugin')
+            return
+        PLUGIN_RUNS.inc()
+        try:
+            with metrics.span(f"plugin: {trigger.name}", 'anon_irc_plugin_seconds'):
+                if not threaded:
+                    await trigger.handler(self.client, event)
+                else:
+                    # Called inline, a slow plain function would stall IRC I/O and could not be timed out.
+                    result = await self._to_thread(trigger.handler, event)
+                    if inspect.isawaitable(result):
+                        await result
+        except Exception as e:
+            PLUGIN_ERRORS.inc()
+            self.console.error(f"Plugin handler '{trigger.name}' failed: {e!r}", event='plugin')
+
+    async def _to_thread(self, handler, event):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='anon-plugin')
+        future = self._executor.submit(handler, self.client, event)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if not future.cancel():
+                # Already running: the thread carries on without us until the handler returns.
+                self._abandon(future)
+            raise
+
+    def _abandon(self, future):
+        loop = asyncio.get_running_loop()
+        self._abandoned.add(future)
+
+        def release(_):
+            try:
+                loop.call_soon_threadsafe(self._abandoned.discard, future)
+            except RuntimeError:
+                pass  # the loop is gone; nothing will dispatch on it again
+
+        future.add_done_callback(release)
+
+    def _expire(self, task, trigger, timeout):
+        if not task.done():
+            PLUGIN_TIMEOUTS.inc()
+            self.console.error(f"Plugin handler '{trigger.name}' timed out after {timeout}s.", event='plugin')
+            task.cancel()
+
+    def _finished(self, task):
+        timer = self._tasks.pop(task, None)
+        if timer is not None:
+            timer.cancel()
+
+    def pending(self):
+        """Number of handler tasks still running."""
+        return len(self._tasks)
+
+    def abandoned(self):
+        """Number of timed-out plain-function handlers whose threads are still running."""
+        return len(self._abandoned)
+
+    async def close(self):
+        """Cancels handlers that are still running and releases the handler threads."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._abandoned = set()
@@ -0,0 +1,471 @@
+# Split-pane terminal UI for the IRC client: a scrollback buffer, a nick
+# list, a status line and an input line, all driven from the event loop.
+# Keys are read through loop.add_reader, console output arrives through the
+# console's sink, and every change only marks its pane dirty; panes are
+# redrawn together at most `frame_rate` times a second.
+import asyncio
+import curses
+import heapq
+import signal
+import sys
+import time
+from collections import deque
+from .membership import DEFAULT_PREFIXES
+from anon_framework.config.settings import get_config
+from anon_framework.utils import metrics
+from anon_framework.utils.console import HIGH, LOW, get_console
+
+NICKLIST_WIDTH = 18
+# A changing nick list is re-sorted at most this often (seconds); big channels churn constantly.
+NICKLIST_INTERVAL = 1.0
+HISTORY_SIZE = 200
+# Commands that talk to the server; they need the connection (and its loop) to exist.
+SERVER_COMMANDS = frozenset({'join', 'part', 'list', 'nick', 'msg', 'raw', 'dcc'})
+
+TUI_FRAMES = metrics.counter('anon_tui_frames', 'Frames drawn by the terminal UI.')
+TUI_COALESCED = metrics.counter('anon_tui_coalesced', 'Redraw requests folded into an already scheduled frame.')
+
+
+def wrap(text, width):
+    """Splits `text` into rows of at most `width` characters (hard wrap)."""
+    if width <= 0:
+        return []
+    rows = []
+    for line in text.split('\n'):
+        rows.extend(line[start:start + width] for start in range(0, max(len(line), 1), width))
+    return rows
+
+
+class TerminalUI:
+    """
+    Non-blocking curses front end for an IRCClient.
+
+    The buffer pane scrolls in place when lines arrive while it is at the
+    bottom, so a frame under heavy traffic writes only the new rows; curses
+    then sends only the cells that differ. Menu actions are plain /commands
+    (see /help) and never block the loop.
+    """
+
+    def __init__(self, client, frame_rate=None, scrollback=None, console=None):
+        """
+        Args:
+            client: The IRCClient to drive; it may not be connected yet.
+            frame_rate (int): Maximum frames per second (defaults to irc.tui_fps).
+            scrollback (int): Lines kept in the buffer (defaults to irc.tui_scrollback).
+        """
+        irc_config = get_config()['irc']
+        self.client = client
+        self.frame_interval = 1.0 / (frame_rate or irc_config['tui_fps'])
+        self.lines = deque(maxlen=scrollback or irc_config['tui_scrollback'])
+        self.console = console or get_console()
+        self.scroll = 0
+        self.input = ''
+        self.cursor = 0
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self._history_pos = None
+        self._completion = None
+        self._dirty = set()
+        self._new_lines = 0
+        self._frame = None
+        self._last_frame = 0.0
+        self._nicks = []
+        self._nick_changes = None
+        self._nick_channel = None
+        self._nick_time = 0.0
+        self.screen = None
+        self.loop = None
+        self.commands = {
+            'help': (self.cmd_help, "/help - list commands"),
+            'join': (self.cmd_join, "/join <#channel> - join and switch to a channel"),
+            'part': (self.cmd_part, "/part - leave the current channel"),
+            'list': (self.cmd_list, "/list [query] - list channels, optionally matching a query"),
+            'nick': (self.cmd_nick, "/nick <name> - change nickname"),
+            'msg': (self.cmd_msg, "/msg <target> <text> - send a private message"),
+            'raw': (self.cmd_raw, "/raw <command> [args] - send a raw IRC command"),
+            'dcc': (self.cmd_dcc, "/dcc send <nick> <path> | get <id> | cancel <id> | list"),
+            'plugins': (self.cmd_plugins, "/plugins - show loaded plugins"),
+            'clear': (self.cmd_clear, "/clear - clear the buffer"),
+            'quit': (self.cmd_quit, "/quit - disconnect"),
+        }
+        self.commands['menu'] = self.commands['help']
+
+    # Lifecycle
+
+    def start(self):
+        """Takes over the terminal. Must be called on the event loop."""
+        self.loop = asyncio.get_running_loop()
+        self.screen = curses.initscr()
+        curses.noecho()
+        curses.cbreak()
+        self.screen.keypad(True)
+        self.screen.nodelay(True)
+        self._layout()
+        self.loop.add_reader(sys.stdin.fileno(), self._on_keys)
+        self.loop.add_signal_handler(signal.SIGWINCH, self._on_resize)
+        self.console.set_sink(self.feed)
+        self.console.set_prompt(None)
+        self.request_redraw('all')
+
+    def stop(self):
+        """Gives the terminal back. Safe to call more than once."""
+        if self.screen is None:
+            return
+        self.console.set_sink(None)
+        self.loop.remove_reader(sys.stdin.fileno())
+        self.loop.remove_signal_handler(signal.SIGWINCH)
+        if self._frame is not None:
+            self._frame.cancel()
+            self._frame = None
+        self.screen.keypad(False)
+        curses.nocbreak()
+        curses.echo()
+        curses.endwin()
+        self.screen = None
+
+    def _layout(self):
+        height, width = self.screen.getmaxyx()
+        body = max(height - 2, 1)
+        nick_width = NICKLIST_WIDTH if width > NICKLIST_WIDTH * 3 else 0
+        self.buffer_width = width - nick_width - (1 if nick_width else 0)
+        self.buffer_win = curses.newwin(body, self.buffer_width, 0, 0)
+        self.buffer_win.scrollok(True)
+        self.nick_win = curses.newwin(body, nick_width, 0, width - nick_width) if nick_width else None
+        self.separator_x = self.buffer_width if nick_width else None
+        self.status_win = curses.newwin(1, width, body, 0)
+        self.input_win = curses.newwin(1, width, body + 1, 0)
+        self.body_height = body
+        self.width = width
+
+    def _on_resize(self):
+        curses.endwin()
+        self.screen.refresh()
+        self._layout()
+        self.request_redraw('all')
+
+    # Output
+
+    def feed(self, entries):
+        """Console sink: called on the console's writer thread with rendered lines."""
+        self.loop.call_soon_threadsafe(self.append, entries)
+
+    def append(self, entries):
+        """Adds (text, priority, fields) entries to the buffer."""
+        for text, priority, fields in entries:
+            attr = curses.A_BOLD if priority == HIGH else curses.A_DIM if priority == LOW else curses.A_NORMAL
+            self.lines.append((text, attr))
+        self._new_lines += len(entries)
+        if self.scroll:
+            # Keep a scrolled-back view where it is.
+            self.scroll = min(self.scroll + len(entries), len(self.lines))
+            self.request_redraw('status')
+        else:
+            self.request_redraw('buffer')
+
+    def request_redraw(self, *panes):
+        """Marks panes dirty and schedules a frame, no sooner than one frame interval after the last."""
+        self._dirty.update(panes)
+        if self._frame is not None:
+            TUI_COALESCED.inc()
+            return
+        delay = max(0.0, self._last_frame + self.frame_interval - time.monotonic())
+        self._frame = self.loop.call_later(delay, self._render)
+
+    def _render(self):
+        self._frame = None
+        self._last_frame = time.monotonic()
+        if self.screen is None:
+            return
+        dirty, self._dirty = self._dirty, set()
+        full = 'all' in dirty
+        if full:
+            self.screen.erase()
+            if self.separator_x is not None:
+                self.screen.vline(0, self.separator_x, curses.ACS_VLINE, self.body_height)
+            self.screen.noutrefresh()
+        if full or 'buffer' in dirty:
+            self._draw_buffer(full)
+        self._new_lines = 0
+        if self._nicklist_due(full):
+            self._draw_nicklist()
+            dirty.add('status')
+        if full or 'status' in dirty or 'buffer' in dirty:
+            self._draw_status()
+        # The input line is always refreshed last so the terminal cursor ends up in it.
+        self._draw_input()
+        curses.doupdate()
+        TUI_FRAMES.inc()
+
+    def _visible_rows(self):
+        rows = []
+        height, width = self.body_height, self.buffer_width
+        end = len(self.lines) - self.scroll
+        index = end - 1
+        while index >= 0 and len(rows) < height:
+            text, attr = self.lines[index]
+            rows[:0] = [(row, attr) for row in wrap(text, width)]
+            index -= 1
+        return rows[-height:]
+
+    def _draw_buffer(self, full):
+        win = self.buffer_win
+        height, width = self.body_height, self.buffer_width
+        new = self._new_lines
+        if not full and not self.scroll and 0 < new < height:
+            # Only new lines at the bottom: scroll the pane and write just those rows.
+            rows = []
+            for text, attr in list(self.lines)[-new:] if new < len(self.lines) else self.lines:
+                rows.extend((row, attr) for row in wrap(text, width))
+            rows = rows[-height:]
+            win.scroll(len(rows))
+            start = height - len(rows)
+        else:
+            rows = self._visible_rows()
+            win.erase()
+            start = height - len(rows)
+        for offset, (row, attr) in enumerate(rows):
+            try:
+                win.addstr(start + offset, 0, row, attr)
+                win.clrtoeol()
+            except curses.error:
+                # Writing the bottom-right cell moves the cursor off the window; the text is still drawn.
+                pass
+        win.noutrefresh()
+
+    def _nicklist_due(self, full):
+        if self.nick_win is None:
+            return False
+        channel = self.client.target_channel
+        changes = self.client.members.changes
+        if not full and changes == self._nick_changes and channel == self._nick_channel:
+            return False
+        now = time.monotonic()
+        if not full and channel == self._nick_channel and now - self._nick_time < NICKLIST_INTERVAL:
+            # Changed, but refreshed recently; try again on a later frame.
+            self.request_redraw('nicklist')
+            return False
+        self._nick_changes, self._nick_channel, self._nick_time = changes, channel, now
+        return True
+
+    def _draw_nicklist(self):
+        win = self.nick_win
+        win.erase()
+        store = self.client.members
+        channel = store.channel(self.client.target_channel) if self.client.target_channel else None
+        if channel is not None:
+            rank = {prefix: i for i, prefix in enumerate(DEFAULT_PREFIXES)}
+            prefixes, users = channel.prefixes, store.users
+            # Members are stored by folded nick, so the keys already sort case-insensitively.
+            entries = ((rank.get(prefixes.get(key, '')[:1], len(rank)), key) for key in channel.members)
+            # Only the rows that fit are sorted out of a possibly huge channel.
+            self._nicks = [prefixes.get(key, '')[:1] + users[key].nick
+                           for _, key in heapq.nsmallest(self.body_height, entries) if key in users]
+        else:
+            self._nicks = []
+        width = win.getmaxyx()[1]
+        for row, nick in enumerate(self._nicks):
+            try:
+                win.addnstr(row, 0, nick, width - 1)
+            except curses.error:
+                pass
+        win.noutrefresh()
+
+    def _draw_status(self):
+        win = self.status_win
+        channel = self.client.target_channel
+        members = self.client.members.channel(channel) if channel else None
+        parts = [f"[{self.client.nickname}]",
+                 f"[{channel} {len(members or ())} users]" if channel else "[no channel]"]
+        if not self.client.is_connected:
+            parts.append("[disconnected]")
+        if self.scroll:
+            parts.append(f"[-- {self.scroll} more below, PgDn --]")
+        win.erase()
+        try:
+            win.addnstr(0, 0, ' '.join(parts).ljust(self.width), self.width - 1, curses.A_REVERSE)
+        except curses.error:
+            pass
+        win.noutrefresh()
+
+    def _draw_input(self):
+        win = self.input_win
+        prompt = f"[{self.client.target_channel or '-'}] "
+        room = max(self.width - len(prompt) - 1, 1)
+        # Scroll the input horizontally so the cursor stays visible.
+        offset = max(0, self.cursor - room + 1)
+        win.erase()
+        try:
+            win.addstr(0, 0, prompt + self.input[offset:offset + room])
+            win.move(0, len(prompt) + self.cursor - offset)
+        except curses.error:
+            pass
+        win.noutrefresh()
+
+    def echo(self, text, priority=None):
+        self.append([(text, HIGH if priority is None else priority, {})])
+
+    # Input
+
+    def _on_keys(self):
+        while self.screen is not None:
+            try:
+                key = self.screen.get_wch()
+            except curses.error:
+                break
+            self._handle_key(key)
+        self.request_redraw('input')
+
+    def _handle_key(self, key):
+        if key != '\t':
+            self._completion = None
+        if key in ('\n', '\r', curses.KEY_ENTER):
+            line, self.input, self.cursor = self.input, '', 0
+            self._history_pos = None
+            if line.strip():
+                self.history.append(line)
+                self.submit(line)
+        elif key in (curses.KEY_BACKSPACE, '\x7f', '\b'):
+            if self.cursor:
+                self.input = self.input[:self.cursor - 1] + self.input[self.cursor:]
+                self.cursor -= 1
+        elif key == curses.KEY_DC:
+            self.input = self.input[:self.cursor] + self.input[self.cursor + 1:]
+        elif key == curses.KEY_LEFT:
+            self.cursor = max(0, self.cursor - 1)
+        elif key == curses.KEY_RIGHT:
+            self.cursor = min(len(self.input), self.cursor + 1)
+        elif key in (curses.KEY_HOME, '\x01'):
+            self.cursor = 0
+        elif key in (curses.KEY_END, '\x05'):
+            self.cursor = len(self.input)
+        elif key == '\x15':
+            self.input, self.cursor = '', 0
+        elif key in (curses.KEY_UP, curses.KEY_DOWN):
+            self._recall(-1 if key == curses.KEY_UP else 1)
+        elif key in (curses.KEY_PPAGE, curses.KEY_NPAGE):
+            page = max(self.body_height - 1, 1)
+            step = page if key == curses.KEY_PPAGE else -page
+            self.scroll = min(max(self.scroll + step, 0), max(len(self.lines) - 1, 0))
+            self.request_redraw('buffer', 'status')
+        elif key == '\t':
+            self._complete()
+        elif key == curses.KEY_RESIZE:
+            self._on_resize()
+        elif isinstance(key, str) and key.isprintable():
+            self.input = self.input[:self.cursor] + key + self.input[self.cursor:]
+            self.cursor += 1
+
+    def _recall(self, step):
+        if not self.history:
+            return
+        position = len(self.history) if self._history_pos is None else self._history_pos
+        position = min(max(position + step, 0), len(self.history))
+        self._history_pos = position
+        self.input = self.history[position] if position < len(self.history) else ''
+        self.cursor = len(self.input)
+
+    def _complete(self):
+        """Completes the word before the cursor: a /command, or a nick (Tab again cycles)."""
+        if self._completion is None:
+            start = self.input.rfind(' ', 0, self.cursor) + 1
+            word = self.input[start:self.cursor]
+            if not word:
+                return
+            if start == 0 and word.startswith('/'):
+                matches = ['/' + name for name in sorted(self.commands) if name.startswith(word[1:])]
+            elif self.client.target_channel:
+                matches = self.client.members.complete(self.client.target_channel, word, limit=50)
+                if start == 0:
+                    matches = [f"{nick}:" for nick in matches]
+            else:
+                matches = []
+            if not matches:
+                return
+            self._completion = [start, matches, -1, self.cursor]
+        completion = self._completion
+        start, matches, index, end = completion
+        index = (index + 1) % len(matches)
+        replacement = matches[index] + ' '
+        self.input = self.input[:start] + replacement + self.input[end:]
+        self.cursor = start + len(replacement)
+        completion[2], completion[3] = index, self.cursor
+
+    def submit(self, line):
+        """Runs a /command or sends the line to the current channel."""
+        if line.startswith('/') and not line.startswith('//'):
+            name, _, args = line[1:].partition(' ')
+            command = self.commands.get(name.lower())
+            if command is None:
+                self.echo(f"Unknown command: /{name}. Type /help for a list.")
+            elif name.lower() in SERVER_COMMANDS and not self.client.connected:
+                self.echo(f"/{name}: not connected.")
+            else:
+                command[0](args.strip())
+            return
+        if line.startswith('//'):
+            line = line[1:]
+        if not self.client.is_connected or not self.client.target_channel:
+            self.echo("You are not in a channel. Use /join <#channel>.")
+            return
+        self.client.send_message(line)
+        # The server does not echo our own messages back.
+        self.console.info(f"<{self.client.nickname}> {line}", event='message', target=self.client.target_channel)
+
+    # Commands (the menu's actions, without the modal prompts)
+
+    def cmd_help(self, args):
+        for _, usage in sorted(set(self.commands.values()), key=lambda command: command[1]):
+            self.echo(usage, LOW)
+
+    def cmd_join(self, args):
+        if not args:
+            self.echo("Usage: /join <#channel>")
+            return
+        self.client.join_channel(args.split()[0])
+        self.request_redraw('nicklist', 'status')
+
+    def cmd_part(self, args):
+        self.client.leave_channel()
+        self.request_redraw('nicklist', 'status')
+
+    def cmd_list(self, args):
+        if args:
+            self.client.search_channels(args)
+        else:
+            self.client.list_channels()
+
+    def cmd_nick(self, args):
+        if not args:
+            self.echo("Usage: /nick <name>")
+            return
+        self.client.change_nickname(args.split()[0])
+
+    def cmd_msg(self, args):
+        target, _, text = args.partition(' ')
+        if not target or not text:
+            self.echo("Usage: /msg <target> <text>")
+            return
+        asyncio.ensure_future(self.client.message(target, text))
+        self.console.info(f"-> *{target}* {text}", event='message', target=target)
+
+    def cmd_raw(self, args):
+        if not args:
+            self.echo("Usage: /raw <command> [args]")
+            return
+        self.client.send_raw_command(*args.split(' '))
+
+    def cmd_dcc(self, args):
+        self.client.handle_dcc_command(args.split(' ', 2)[:3] if args.startswith('send ') else args.split())
+
+    def cmd_plugins(self, args):
+        plugins = self.client.plugins
+        self.echo(f"Plugins: {', '.join(plugins.plugins) or 'none'} "
+                  f"({len(plugins.triggers)} triggers, {plugins.pending()} running)", LOW)
+
+    def cmd_clear(self, args):
+        self.lines.clear()
+        self.scroll = 0
+        self.request_redraw('all')
+
+    def cmd_quit(self, args):
+        self.echo("Disconnecting...")
+        self.client.disconnect()
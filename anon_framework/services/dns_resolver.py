@@ -0,0 +1,317 @@
+import asyncio
+import random
+import socket
+import struct
+import time
+from collections import OrderedDict
+from anon_framework.config.settings import get_config
+from anon_framework.utils import metrics
+
+QTYPE_A = 1
+QTYPE_CNAME = 5
+QTYPE_SOA = 6
+QTYPE_AAAA = 28
+
+RCODE_NOERROR = 0
+RCODE_NXDOMAIN = 3
+
+# Tor's SOCKS RESOLVE extension reports no TTL; answers are cached this long.
+SOCKS_TTL = 300
+# A hot entry is refreshed in the background once this fraction of its TTL remains.
+PREFETCH_FRACTION = 0.1
+PREFETCH_MIN_HITS = 2
+
+DNS_QUERIES = metrics.counter('anon_dns_queries', 'Lookups sent to the upstream resolver.')
+DNS_CACHE_HITS = metrics.counter('anon_dns_cache_hits', 'Lookups answered from the resolver cache.')
+DNS_COALESCED = metrics.counter('anon_dns_coalesced', 'Lookups that joined an identical in-flight query.')
+
+_resolver = None
+
+
+class ResolveError(OSError):
+    """Raised when a name cannot be resolved (NXDOMAIN, no data, or upstream failure)."""
+
+    def __init__(self, message, ttl=None):
+        super().__init__(message)
+        # How long the answer may be cached (the SOA negative-caching TTL), if the server said.
+        self.ttl = ttl
+
+
+def encode_name(name):
+    """IDNA-encodes `name`, raising ResolveError for names that cannot be (empty or over-long labels)."""
+    try:
+        return name.rstrip('.').encode('idna')
+    except UnicodeError as e:
+        raise ResolveError(f"{name!r}: invalid host name ({e})")
+
+
+def build_query(txid, name, qtype):
+    """Encodes a recursive DNS query for `name`."""
+    header = struct.pack('!HHHHHH', txid, 0x0100, 1, 0, 0, 0)
+    qname = b''.join(bytes((len(label),)) + label for label in encode_name(name).split(b'.'))
+    return header + qname + b'\x00' + struct.pack('!HH', qtype, 1)
+
+
+def _skip_name(data, offset):
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += 1 + length
+        if length == 0:
+            return offset
+
+
+def parse_response(data, qtype):
+    """
+    Decodes a DNS response.
+
+    Returns:
+        tuple: (txid, rcode, addresses, ttl). `ttl` is the smallest answer TTL,
+        or for empty answers the SOA negative-caching TTL (None if absent).
+    """
+    try:
+        txid, flags, qdcount, ancount, nscount, _ = struct.unpack_from('!HHHHHH', data)
+        offset = 12
+        for _ in range(qdcount):
+            offset = _skip_name(data, offset) + 4
+        addresses, ttl = [], None
+        for _ in range(ancount):
+            offset = _skip_name(data, offset)
+            rtype, _, rttl, rdlength = struct.unpack_from('!HHIH', data, offset)
+            offset += 10
+            if rtype == qtype:
+                family = socket.AF_INET if rtype == QTYPE_A else socket.AF_INET6
+                addresses.append(socket.inet_ntop(family, data[offset:offset + rdlength]))
+                ttl = rttl if ttl is None else min(ttl, rttl)
+            offset += rdlength
+        if not addresses:
+            for _ in range(nscount):
+                offset = _skip_name(data, offset)
+                rtype, _, rttl, rdlength = struct.unpack_from('!HHIH', data, offset)
+                offset += 10
+                if rtype == QTYPE_SOA:
+                    # The SOA MINIMUM field is the last 4 bytes of its rdata.
+                    minimum = struct.unpack_from('!I', data, offset + rdlength - 4)[0]
+                    ttl = min(rttl, minimum)
+                offset += rdlength
+    except (struct.error, IndexError, ValueError) as e:
+        raise ResolveError(f"Malformed DNS response: {e}")
+    return txid, flags & 0x000F, addresses, ttl
+
+
+class _CacheEntry:
+    __slots__ = ('addresses', 'error', 'expires', 'ttl', 'hits')
+
+    def __init__(self, addresses, error, ttl):
+        self.addresses = addresses
+        self.error = error
+        self.ttl = ttl
+        self.expires = time.monotonic() + ttl
+        self.hits = 0
+
+
+class _DnsProtocol(asyncio.DatagramProtocol):
+    """Routes UDP responses to the waiting query by transaction id."""
+
+    def __init__(self):
+        self.transport = None
+        self.pending = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < 2:
+            return
+        future = self.pending.pop(struct.unpack_from('!H', data)[0], None)
+        if future is not None and not future.done():
+            future.set_result(data)
+
+    def error_received(self, exc):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ResolveError(f"DNS upstream error: {exc}"))
+        self.pending.clear()
+
+    def connection_lost(self, exc):
+        self.error_received(exc or ConnectionError("transport closed"))
+
+
+class Resolver:
+    """
+    Asyncio DNS stub resolver that only talks to Tor.
+
+    Queries go to Tor's DNSPort over UDP ('dnsport' mode) or through the Tor
+    SOCKS port's RESOLVE extension ('socks' mode), so lookups never leave
+    through the system resolver ('off' is handled by callers, which then
+    use the system resolver). Answers are kept in an LRU cache bounded by
+    `cache_size` and honour the record TTL (clamped to `min_ttl`..`max_ttl`);
+    NXDOMAIN and empty answers are cached for the zone's SOA negative TTL
+    (clamped the same way), other failures for `negative_ttl`. Concurrent
+    lookups of the same name share one upstream query, and names that keep
+    getting hits are refreshed in the background shortly before they expire.
+    """
+
+    def __init__(self, mode=None, host=None, port=None, cache_size=None, min_ttl=None, max_ttl=None,
+                 negative_ttl=None, timeout=None, prefetch=None):
+        config = get_config()
+        dns_config, tor_config = config['dns'], config['tor']
+        self.mode = mode or dns_config['mode']
+        if self.mode not in ('dnsport', 'socks'):
+            raise ValueError(f"Unknown DNS mode '{self.mode}'. Choices are ['dnsport', 'socks'].")
+        self.host = host or tor_config['socks_host']
+        self.port = port or (tor_config['dns_port'] if self.mode == 'dnsport' else tor_config['socks_port'])
+        self.cache_size = cache_size or dns_config['cache_size']
+        self.min_ttl = dns_config['min_ttl'] if min_ttl is None else min_ttl
+        self.max_ttl = dns_config['max_ttl'] if max_ttl is None else max_ttl
+        self.negative_ttl = dns_config['negative_ttl'] if negative_ttl is None else negative_ttl
+        self.timeout = timeout or dns_config['timeout']
+        self.prefetch_enabled = dns_config['prefetch'] if prefetch is None else prefetch
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._protocol = None
+
+    async def resolve(self, name, family=socket.AF_INET):
+        """
+        Returns the addresses for `name`.
+
+        Args:
+            name (str): Host name to look up.
+            family: socket.AF_INET (A records) or socket.AF_INET6 (AAAA records).
+
+        Raises:
+            ResolveError: If the name does not exist or the upstream failed.
+        """
+        key = (name.lower().rstrip('.'), QTYPE_AAAA if family == socket.AF_INET6 else QTYPE_A)
+        entry = self._cache.get(key)
+        if entry is not None:
+            remaining = entry.expires - time.monotonic()
+            if remaining > 0:
+                self._cache.move_to_end(key)
+                entry.hits += 1
+                DNS_CACHE_HITS.inc()
+                if (self.prefetch_enabled and entry.error is None and entry.hits >= PREFETCH_MIN_HITS
+                        and remaining < entry.ttl * PREFETCH_FRACTION):
+                    self._lookup(key)
+                if entry.error is not None:
+                    raise ResolveError(entry.error)
+                return list(entry.addresses)
+            del self._cache[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            DNS_COALESCED.inc()
+        else:
+            task = self._lookup(key)
+        entry = await asyncio.shield(task)
+        if entry.error is not None:
+            raise ResolveError(entry.error)
+        return list(entry.addresses)
+
+    async def prefetch(self, names, family=socket.AF_INET):
+        """Warms the cache for `names` concurrently; failures are cached but not raised."""
+        await asyncio.gather(*(self.resolve(name, family) for name in names), return_exceptions=True)
+
+    def _lookup(self, key):
+        """Starts (or joins) the upstream query for `key` and returns its task."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._query_and_store(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def _query_and_store(self, key):
+        name, qtype = key
+        DNS_QUERIES.inc()
+        try:
+            with metrics.span("dns upstream query", 'anon_dns_upstream_seconds'):
+                if self.mode == 'socks':
+                    addresses, ttl = await self._query_socks(name, qtype)
+                else:
+                    addresses, ttl = await self._query_dnsport(name, qtype)
+            entry = _CacheEntry(addresses, None, min(max(ttl, self.min_ttl), self.max_ttl))
+        except ResolveError as e:
+            ttl = self.negative_ttl if e.ttl is None else min(max(e.ttl, self.min_ttl), self.max_ttl)
+            entry = _CacheEntry((), str(e), ttl)
+        except (OSError, asyncio.TimeoutError) as e:
+            entry = _CacheEntry((), f"Could not reach the Tor resolver at {self.host}:{self.port}: {e!r}", self.negative_ttl)
+
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return entry
+
+    async def _query_dnsport(self, name, qtype):
+        if self._protocol is None or self._protocol.transport is None or self._protocol.transport.is_closing():
+            loop = asyncio.get_running_loop()
+            _, self._protocol = await loop.create_datagram_endpoint(_DnsProtocol, remote_addr=(self.host, self.port))
+        protocol = self._protocol
+        txid = random.getrandbits(16)
+        while txid in protocol.pending:
+            txid = random.getrandbits(16)
+        future = asyncio.get_running_loop().create_future()
+        protocol.pending[txid] = future
+        protocol.transport.sendto(build_query(txid, name, qtype))
+        try:
+            data = await asyncio.wait_for(future, self.timeout)
+        finally:
+            protocol.pending.pop(txid, None)
+
+        _, rcode, addresses, ttl = parse_response(data, qtype)
+        if rcode == RCODE_NXDOMAIN:
+            raise ResolveError(f"{name}: no such domain", ttl)
+        if rcode != RCODE_NOERROR:
+            raise ResolveError(f"{name}: resolver returned rcode {rcode}")
+        if not addresses:
+            raise ResolveError(f"{name}: no {'AAAA' if qtype == QTYPE_AAAA else 'A'} records", ttl)
+        return addresses, ttl
+
+    async def _query_socks(self, name, qtype):
+        if qtype != QTYPE_A:
+            raise ResolveError(f"{name}: SOCKS RESOLVE only supports IPv4 lookups")
+        encoded = encode_name(name)
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        try:
+            # SOCKS5 greeting (no auth), then Tor's RESOLVE command (0xF0) for a domain name.
+            writer.write(b'\x05\x01\x00' + b'\x05\xf0\x00\x03' + bytes((len(encoded),)) + encoded + b'\x00\x00')
+            greeting = await asyncio.wait_for(reader.readexactly(2), self.timeout)
+            if greeting != b'\x05\x00':
+                raise ResolveError("Tor SOCKS port refused the handshake")
+            _, reply, _, atyp = await asyncio.wait_for(reader.readexactly(4), self.timeout)
+            if reply != 0:
+                raise ResolveError(f"{name}: Tor could not resolve the name (SOCKS reply {reply})")
+            if atyp == 1:
+                address = socket.inet_ntop(socket.AF_INET, await reader.readexactly(4))
+            elif atyp == 4:
+                address = socket.inet_ntop(socket.AF_INET6, await reader.readexactly(16))
+            else:
+                raise ResolveError(f"{name}: unexpected SOCKS address type {atyp}")
+            return [address], SOCKS_TTL
+        except asyncio.IncompleteReadError:
+            raise ResolveError(f"{name}: Tor closed the SOCKS connection early")
+        finally:
+            writer.close()
+
+    def cache_info(self):
+        """Returns (entries, negative_entries, in_flight) counts."""
+        negative = sum(1 for entry in self._cache.values() if entry.error is not None)
+        return len(self._cache), negative, len(self._inflight)
+
+    def clear(self):
+        self._cache.clear()
+
+    def close(self):
+        if self._protocol is not None and self._protocol.transport is not None:
+            self._protocol.transport.close()
+        self._protocol = None
+
+
+def get_resolver():
+    """Returns the process-wide resolver, creating it from the config on first use."""
+    global _resolver
+    if _resolver is None:
+        _resolver = Resolver()
+    return _resolver
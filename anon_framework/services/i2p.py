@@ -1,4 +1,7 @@
-from anon_framework.utils.helpers import run_command, get_os
+from anon_framework.utils.helpers import get_os, status_record
+from anon_framework.utils import metrics
+from anon_framework.utils.systemd import ServiceError, get_service_manager
+from anon_framework.config.settings import get_config
 import psutil
 
 class I2PService:
@@ -11,47 +14,48 @@ class I2PService:
         os_type = get_os()
         if os_type == 'linux':
             # Assumes a systemd service is set up
-            return 'i2p'
+            return get_config()['i2p']['service']
         # Add other OS-specific service names here
         else:
             raise NotImplementedError(f"I2P service management not supported on {os_type}")
 
     def _is_process_running(self):
         """Check if the i2prouter process is running."""
-        for proc in psutil.process_iter(['name', 'cmdline']):
-            # Check for 'i2prouter' in name or if 'i2prouter' is in the command line
-            if 'i2prouter' in proc.info['name'] or ('java' in proc.info['name'] and any('i2prouter' in s for s in proc.info['cmdline'])):
-                return True
-        return False
+        with metrics.span("process scan: i2p", 'anon_process_scan_seconds'):
+            for proc in psutil.process_iter(['name', 'cmdline']):
+                # Check for 'i2prouter' in name or if 'i2prouter' is in the command line
+                if 'i2prouter' in proc.info['name'] or ('java' in proc.info['name'] and any('i2prouter' in s for s in proc.info['cmdline'])):
+                    return True
+            return False
 
-    def start(self):
-        """Starts the I2P service."""
+    async def start(self):
+        """Starts the I2P service and returns once it is running."""
         os_type = get_os()
         print(f"Attempting to start I2P service on {os_type}...")
         if os_type == 'linux':
-            stdout, stderr, code = run_command(['sudo', 'systemctl', 'start', self._get_service_name()])
-            if code == 0:
-                print("I2P service started successfully.")
-                return True
-            else:
-                print(f"Error starting I2P service:\n{stderr}")
+            try:
+                await get_service_manager().start(self._get_service_name())
+            except ServiceError as e:
+                print(f"Error starting I2P service:\n{e}")
                 return False
+            print("I2P service started successfully.")
+            return True
         else:
             print(f"Unsupported OS: {os_type}")
             return False
 
-    def stop(self):
+    async def stop(self):
         """Stops the I2P service."""
         os_type = get_os()
         print(f"Attempting to stop I2P service on {os_type}...")
         if os_type == 'linux':
-            stdout, stderr, code = run_command(['sudo', 'systemctl', 'stop', self._get_service_name()])
-            if code == 0:
-                print("I2P service stopped successfully.")
-                return True
-            else:
-                print(f"Error stopping I2P service:\n{stderr}")
+            try:
+                await get_service_manager().stop(self._get_service_name())
+            except ServiceError as e:
+                print(f"Error stopping I2P service:\n{e}")
                 return False
+            print("I2P service stopped successfully.")
+            return True
         else:
             print(f"Unsupported OS: {os_type}")
             return False
@@ -63,6 +67,10 @@ class I2PService:
         else:
             return "Status: Disconnected (I2P process is not running)"
 
+    def get_status_info(self):
+        """Returns the status as a provider-independent record."""
+        return status_record('i2p', self.get_status())
+
     def search_torrents(self, query):
         """
         Searches for torrents on the I2P network.
@@ -74,8 +82,9 @@ class I2PService:
         # **Implementation Notes:**
         # This is a non-trivial task. It would likely involve:
         # 1. Knowing the addresses of one or more I2P torrent search eepsites (e.g., Postman's tracker).
-        # 2. Making an HTTP request through the local I2P proxy (e.g., localhost:4444).
-        # 3. The `requests` library can be configured to use this proxy.
+        # 2. Opening a stream to the eepsite over a warm SAM session
+        #    (`get_sam_client().open_connection(host)`) and sending the HTTP request on it.
+        # 3. Alternatively, the `requests` library can use the HTTP proxy on localhost:4444.
         # 4. Scraping the HTML response from the eepsite to extract magnet links and other info.
         #
         # Example:
@@ -1,5 +1,10 @@
+import sys
 import requests
 import time
+from anon_framework.utils import metrics
+
+HTTP_REQUESTS = metrics.counter('anon_qbittorrent_requests', 'HTTP requests sent to the qBittorrent Web API.')
+HTTP_ERRORS = metrics.counter('anon_qbittorrent_request_errors', 'qBittorrent Web API requests that failed.')
 
 class QBittorrentClient:
     """
@@ -11,23 +16,32 @@ class QBittorrentClient:
         if username and password:
             self._login(username, password)
 
+    def _request(self, method, path, **kwargs):
+        """Sends a timed request to the Web API and returns the response."""
+        HTTP_REQUESTS.inc()
+        try:
+            with metrics.span(f"http {method} {path}", 'anon_qbittorrent_request_seconds'):
+                return self.session.request(method, f"{self.base_url}{path}", **kwargs)
+        except requests.RequestException:
+            HTTP_ERRORS.inc()
+            raise
+
     def _login(self, username, password):
         """Logs into the qBittorrent Web UI."""
-        login_url = f"{self.base_url}/api/v2/auth/login"
         try:
-            response = self.session.post(login_url, data={'username': username, 'password': password})
+            response = self._request('POST', '/api/v2/auth/login', data={'username': username, 'password': password})
             response.raise_for_status()
             if response.text == "Ok.":
-                print("Successfully logged into qBittorrent.")
+                print("Successfully logged into qBittorrent.", file=sys.stderr)
                 return True
             else:
-                print("Failed to log into qBittorrent: Invalid credentials.")
+                print("Failed to log into qBittorrent: Invalid credentials.", file=sys.stderr)
                 return False
         except requests.RequestException as e:
-            print(f"Error connecting to qBittorrent: {e}")
+            print(f"Error connecting to qBittorrent: {e}", file=sys.stderr)
             return False
 
-    def search(self, query, plugin='all', category='all'):
+    def search(self, query, plugin='all', category='all', limit=50):
         """
         Starts a search job and returns the results.
 
@@ -35,28 +49,27 @@ class QBittorrentClient:
             query (str): The search term.
             plugin (str): The search plugin to use (e.g., 'enabled', 'all').
             category (str): The category to search in.
+            limit (int): Maximum number of results to fetch (0 for no limit).
 
         Returns:
             list: A list of dictionaries, where each dictionary is a search result.
         """
-        search_url = f"{self.base_url}/api/v2/search/start"
         try:
             # Start the search job
-            response = self.session.post(search_url, data={'pattern': query, 'plugins': plugin, 'category': category})
+            response = self._request('POST', '/api/v2/search/start', data={'pattern': query, 'plugins': plugin, 'category': category})
             response.raise_for_status()
             job = response.json()
             job_id = job.get('id')
             if job_id is None:
-                print("Failed to start search job.")
+                print("Failed to start search job.", file=sys.stderr)
                 return []
 
-            print(f"Search job started with ID: {job_id}")
+            print(f"Search job started with ID: {job_id}", file=sys.stderr)
 
             # Poll for results
-            results_url = f"{self.base_url}/api/v2/search/results"
             while True:
                 time.sleep(1)
-                status_response = self.session.get(f"{self.base_url}/api/v2/search/status", params={'id': job_id})
+                status_response = self._request('GET', '/api/v2/search/status', params={'id': job_id})
                 status_response.raise_for_status()
                 status = status_response.json()[0]
 
@@ -64,15 +77,140 @@ class QBittorrentClient:
                     continue
                 
                 if status['status'] == 'Stopped':
-                    results_response = self.session.get(results_url, params={'id': job_id, 'limit': 50}) # Limit to 50 results
+                    results_response = self._request('GET', '/api/v2/search/results', params={'id': job_id, 'limit': limit})
                     results_response.raise_for_status()
                     results = results_response.json()
-                    print(f"Found {results.get('total')} results.")
+                    print(f"Found {results.get('total')} results.", file=sys.stderr)
                     
                     # Stop the job
-                    self.session.post(f"{self.base_url}/api/v2/search/delete", data={'id': job_id})
+                    self._request('POST', '/api/v2/search/delete', data={'id': job_id})
                     return results.get('results', [])
         
         except requests.RequestException as e:
-            print(f"An error occurred during search: {e}")
+            print(f"An error occurred during search: {e}", file=sys.stderr)
             return []
+
+    def iter_search(self, query, plugin='all', category='all', limit=0, page_size=500, poll_interval=0.5):
+        """
+        Starts a search job and yields each result as soon as qBittorrent reports it.
+
+        Results are fetched in pages using the `offset` parameter while the job
+        is still running, so memory use is bounded by one page no matter how
+        many results there are. Errors are reported on stderr so they never mix
+        with streamed records on stdout.
+
+        Args:
+            query (str): The search term.
+            plugin (str): The search plugin to use (e.g., 'enabled', 'all').
+            category (str): The category to search in.
+            limit (int): Maximum number of results to yield (0 for no limit).
+            page_size (int): Results fetched per request.
+            poll_interval (float): Seconds between polls while the job is running.
+
+        Yields:
+            dict: One search result.
+        """
+        try:
+            response = self._request('POST', '/api/v2/search/start', data={'pattern': query, 'plugins': plugin, 'category': category})
+            response.raise_for_status()
+            job_id = response.json().get('id')
+        except (requests.RequestException, ValueError) as e:
+            print(f"An error occurred during search: {e}", file=sys.stderr)
+            return
+        if job_id is None:
+            print("Failed to start search job.", file=sys.stderr)
+            return
+
+        offset = 0
+        try:
+            while True:
+                status_response = self._request('GET', '/api/v2/search/status', params={'id': job_id})
+                status_response.raise_for_status()
+                running = status_response.json()[0]['status'] == 'Running'
+
+                # Drain everything reported so far before deciding whether to wait.
+                while True:
+                    page_limit = page_size if not limit else min(page_size, limit - offset)
+                    if page_limit <= 0:
+                        return
+                    results_response = self._request('GET', '/api/v2/search/results', params={'id': job_id, 'limit': page_limit, 'offset': offset})
+                    results_response.raise_for_status()
+                    results = results_response.json().get('results', [])
+                    for res in results:
+                        yield res
+                    offset += len(results)
+                    if len(results) < page_limit:
+                        break
+
+                if not running:
+                    return
+                time.sleep(poll_interval)
+        except (requests.RequestException, ValueError) as e:
+            print(f"An error occurred during search: {e}", file=sys.stderr)
+        finally:
+            try:
+                self._request('POST', '/api/v2/search/delete', data={'id': job_id})
+            except requests.RequestException:
+                pass
+
+    def sync_maindata(self, rid=0):
+        """
+        Fetches the torrent state changes since response id `rid`.
+
+        Args:
+            rid (int): The `rid` from the previous response, or 0 for a full snapshot.
+
+        Returns:
+            dict: The partial update (with `full_update` set when the server sent
+            everything), or None if the request failed.
+        """
+        try:
+            response = self._request('GET', '/api/v2/sync/maindata', params={'rid': rid})
+            response.raise_for_status()
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"Error fetching qBittorrent sync data: {e}", file=sys.stderr)
+            return None
+
+    def _torrents_action(self, action, hashes, **data):
+        """Applies `action` to all `hashes` in a single request."""
+        data['hashes'] = hashes if isinstance(hashes, str) else '|'.join(hashes)
+        try:
+            response = self._request('POST', f'/api/v2/torrents/{action}', data=data)
+            response.raise_for_status()
+            return True
+        except requests.RequestException as e:
+            print(f"Error running qBittorrent '{action}': {e}", file=sys.stderr)
+            return False
+
+    def pause_torrents(self, hashes):
+        """Pauses every torrent in `hashes` (or 'all') with one request."""
+        return self._torrents_action('pause', hashes)
+
+    def resume_torrents(self, hashes):
+        """Resumes every torrent in `hashes` (or 'all') with one request."""
+        return self._torrents_action('resume', hashes)
+
+    def delete_torrents(self, hashes, delete_files=False):
+        """Removes every torrent in `hashes` with one request."""
+        return self._torrents_action('delete', hashes, deleteFiles='true' if delete_files else 'false')
+
+    def add_torrents(self, urls, **options):
+        """
+        Adds several magnet links or torrent URLs with one request.
+
+        Args:
+            urls (list): Magnet links or HTTP(S) URLs.
+            **options: Extra form fields such as `savepath`, `category` or `paused`.
+
+        Returns:
+            bool: True if qBittorrent accepted the request.
+        """
+        data = dict(options, urls='\n'.join(urls))
+        try:
+            response = self._request('POST', '/api/v2/torrents/add', data=data)
+            response.raise_for_status()
+            return response.text.strip() != "Fails."
+        except requests.RequestException as e:
+            print(f"Error adding torrents to qBittorrent: {e}", file=sys.stderr)
+            return False
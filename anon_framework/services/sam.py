@@ -0,0 +1,314 @@
+import asyncio
+import itertools
+import os
+import shlex
+import time
+from collections import OrderedDict
+from anon_framework.config.settings import get_config
+from anon_framework.utils import metrics
+
+SAM_VERSION_MIN = '3.1'
+SAM_VERSION_MAX = '3.3'
+# Ed25519, the signature type every current router supports and recommends.
+SIGNATURE_TYPE = 7
+LOOKUP_CACHE_SIZE = 512
+
+SAM_STREAMS = metrics.counter('anon_sam_streams', 'Streams opened through SAM sessions.')
+SAM_SESSIONS = metrics.counter('anon_sam_sessions', 'SAM sessions created (each one builds its own tunnels).')
+SAM_LOOKUP_HITS = metrics.counter('anon_sam_lookup_hits', 'I2P destination lookups answered from the cache.')
+
+_client = None
+
+
+class SAMError(ConnectionError):
+    """Raised when the SAM bridge refuses a command or cannot be reached."""
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        # The bridge's RESULT code (e.g. 'CANT_REACH_PEER', 'INVALID_ID'), if it sent one.
+        self.result = result
+
+
+def parse_reply(line):
+    """
+    Splits a SAM reply line into its topic and KEY=VALUE pairs.
+
+    Returns:
+        tuple: (topic, fields), e.g. ('STREAM STATUS', {'RESULT': 'OK'}).
+    """
+    words = shlex.split(line.strip())
+    head = []
+    fields = {}
+    for word in words:
+        key, sep, value = word.partition('=')
+        if sep:
+            fields[key] = value
+        elif not fields:
+            head.append(word)
+    return ' '.join(head), fields
+
+
+def _check(topic, fields, expected):
+    if topic != expected:
+        raise SAMError(f"Unexpected SAM reply '{topic}' (wanted '{expected}')")
+    if fields.get('RESULT', 'OK') != 'OK':
+        message = fields.get('MESSAGE')
+        raise SAMError(f"{expected}: {fields['RESULT']}" + (f" ({message})" if message else ""), fields['RESULT'])
+    return fields
+
+
+async def _command(reader, writer, line, expected, timeout):
+    writer.write(line.encode('utf-8') + b'\n')
+    reply = await asyncio.wait_for(reader.readline(), timeout)
+    if not reply:
+        raise SAMError(f"SAM bridge closed the connection after '{line.split(' ', 2)[:2]}'")
+    return _check(*parse_reply(reply.decode('utf-8', 'replace')), expected)
+
+
+async def _handshake(host, port, timeout):
+    """Opens a socket to the bridge and negotiates the protocol version."""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError) as e:
+        raise SAMError(f"Cannot reach the SAM bridge at {host}:{port}: {e!r}. Is the I2P router running with SAM enabled?")
+    try:
+        await _command(reader, writer, f"HELLO VERSION MIN={SAM_VERSION_MIN} MAX={SAM_VERSION_MAX}", 'HELLO REPLY', timeout)
+    except BaseException:
+        writer.close()
+        raise
+    return reader, writer
+
+
+async def lookup_name(host, port, name, timeout):
+    """Resolves `name` (host.i2p or a .b32.i2p address) to a base64 destination through the bridge."""
+    reader, writer = await _handshake(host, port, timeout)
+    try:
+        fields = await _command(reader, writer, f"NAMING LOOKUP NAME={name}", 'NAMING REPLY', timeout)
+    finally:
+        writer.close()
+    return fields['VALUE']
+
+
+_session_ids = itertools.count(1)
+
+
+class SAMSession:
+    """
+    One STREAM session on the bridge.
+
+    Creating the session builds its inbound and outbound tunnels, which takes
+    seconds; after that every stream opened through it reuses them. The
+    session lives as long as its control socket, which is kept open and
+    answers the bridge's keepalive PINGs.
+    """
+
+    def __init__(self, name, host, port, options=(), timeout=60):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.options = list(options)
+        self.timeout = timeout
+        self.id = f"anon-{name}-{os.getpid()}-{next(_session_ids)}"
+        self.destination = None
+        self._writer = None
+        self._keepalive = None
+
+    @property
+    def alive(self):
+        return self._writer is not None and not self._writer.is_closing() and not self._keepalive.done()
+
+    async def open(self):
+        SAM_SESSIONS.inc()
+        reader, writer = await _handshake(self.host, self.port, self.timeout)
+        options = ' '.join(self.options)
+        try:
+            with metrics.span("sam session create", 'anon_sam_session_seconds'):
+                fields = await _command(
+                    reader, writer,
+                    f"SESSION CREATE STYLE=STREAM ID={self.id} DESTINATION=TRANSIENT "
+                    f"SIGNATURE_TYPE={SIGNATURE_TYPE} {options}".rstrip(),
+                    'SESSION STATUS', self.timeout)
+        except BaseException:
+            writer.close()
+            raise
+        self.destination = fields.get('DESTINATION')
+        self._writer = writer
+        self._keepalive = asyncio.ensure_future(self._serve_control(reader, writer))
+        return self
+
+    async def _serve_control(self, reader, writer):
+        """Answers PING on the control socket until the bridge closes it, which ends the session."""
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b'PING'):
+                writer.write(b'PONG' + line[4:])
+        writer.close()
+
+    async def connect(self, destination, port=None):
+        """
+        Opens a stream to `destination` (a base64 destination or a name the bridge can resolve).
+
+        Returns:
+            tuple: (StreamReader, StreamWriter) for the stream.
+        """
+        reader, writer = await _handshake(self.host, self.port, self.timeout)
+        ports = f" TO_PORT={port}" if port else ""
+        try:
+            with metrics.span("sam stream connect", 'anon_sam_connect_seconds'):
+                await _command(reader, writer, f"STREAM CONNECT ID={self.id} DESTINATION={destination} SILENT=false{ports}",
+                               'STREAM STATUS', self.timeout)
+        except BaseException:
+            writer.close()
+            raise
+        SAM_STREAMS.inc()
+        # From here on the socket carries the stream's bytes.
+        return reader, writer
+
+    def close(self):
+        if self._keepalive is not None:
+            self._keepalive.cancel()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class SAMClient:
+    """
+    Asyncio client for the I2P router's SAM v3 bridge.
+
+    Sessions are created once per name and kept, so their tunnels are
+    already built when a stream is needed; dead sessions (router restart)
+    are recreated on next use. Name lookups are cached for `lookup_ttl`
+    seconds and concurrent lookups or session creations of the same name
+    share one request.
+    """
+
+    def __init__(self, host=None, port=None, options=None, timeout=None, lookup_ttl=None):
+        config = get_config()['i2p']
+        self.host = host or config['sam_host']
+        self.port = port or config['sam_port']
+        self.options = config['sam_options'] if options is None else options
+        self.timeout = timeout or config['sam_timeout']
+        self.lookup_ttl = config['sam_lookup_ttl'] if lookup_ttl is None else lookup_ttl
+        self._sessions = {}
+        self._creating = {}
+        self._lookups = OrderedDict()
+        self._resolving = {}
+
+    async def session(self, name='default'):
+        """Returns the live session called `name`, creating it (and its tunnels) if needed."""
+        session = self._sessions.get(name)
+        if session is not None:
+            if session.alive:
+                return session
+            session.close()
+        task = self._creating.get(name)
+        if task is None:
+            task = self._creating[name] = asyncio.ensure_future(
+                SAMSession(name, self.host, self.port, self.options, self.timeout).open())
+            task.add_done_callback(lambda _: self._creating.pop(name, None))
+        session = await asyncio.shield(task)
+        self._sessions[name] = session
+        return session
+
+    async def warm(self, *names):
+        """Builds sessions ahead of time so the first stream does not wait for tunnels."""
+        await asyncio.gather(*(self.session(name) for name in names or ('default',)))
+
+    async def lookup(self, name):
+        """Returns the base64 destination for an .i2p name, from the cache when possible."""
+        if not name.endswith('.i2p'):
+            # Already a full destination.
+            return name
+        entry = self._lookups.get(name)
+        if entry is not None and entry[1] > time.monotonic():
+            self._lookups.move_to_end(name)
+            SAM_LOOKUP_HITS.inc()
+            return entry[0]
+        task = self._resolving.get(name)
+        if task is None:
+            task = self._resolving[name] = asyncio.ensure_future(self._lookup(name))
+            task.add_done_callback(lambda _: self._resolving.pop(name, None))
+        return await asyncio.shield(task)
+
+    async def _lookup(self, name):
+        destination = await lookup_name(self.host, self.port, name, self.timeout)
+        self._lookups[name] = (destination, time.monotonic() + self.lookup_ttl)
+        self._lookups.move_to_end(name)
+        while len(self._lookups) > LOOKUP_CACHE_SIZE:
+            self._lookups.popitem(last=False)
+        return destination
+
+    async def open_connection(self, host, port=None, session='default'):
+        """
+        Opens a stream to an I2P host, like `asyncio.open_connection`.
+
+        Args:
+            host (str): A .i2p name, .b32.i2p address or base64 destination.
+            port (int): Virtual port on the destination (most services ignore it).
+            session (str): Name of the session whose tunnels carry the stream.
+
+        Returns:
+            tuple: (StreamReader, StreamWriter).
+        """
+        destination, stream_session = await asyncio.gather(self.lookup(host), self.session(session))
+        try:
+            return await stream_session.connect(destination, port)
+        except SAMError as e:
+            if e.result != 'INVALID_ID':
+                raise
+            # The router dropped the session under us; build a new one and retry once.
+            # Close it so its control socket and keepalive task do not linger.
+            stream_session.close()
+            if self._sessions.get(session) is stream_session:
+                del self._sessions[session]
+            return await (await self.session(session)).connect(destination, port)
+
+    async def forward(self, host, port=None, session='default', listen_host='127.0.0.1'):
+        """
+        Listens on a local port and forwards each accepted connection to `host`
+        over its own stream, for code that can only dial TCP (such as pydle).
+
+        Returns:
+            asyncio.AbstractServer: The listening server; its socket's port is the local
+            endpoint. The caller closes it when done.
+        """
+        await asyncio.gather(self.lookup(host), self.session(session))
+
+        async def pipe(reader, writer):
+            try:
+                while True:
+                    data = await reader.read(65536)
+                    if not data:
+                        break
+                    writer.write(data)
+                    await writer.drain()
+            except (OSError, asyncio.CancelledError):
+                pass
+            finally:
+                writer.close()
+
+        async def handle(local_reader, local_writer):
+            try:
+                remote_reader, remote_writer = await self.open_connection(host, port, session)
+            except SAMError:
+                local_writer.close()
+                return
+            await asyncio.gather(pipe(local_reader, remote_writer), pipe(remote_reader, local_writer))
+
+        return await asyncio.start_server(handle, listen_host, 0)
+
+    def close(self):
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+
+
+def get_sam_client():
+    """Returns the process-wide SAM client, creating it from the config on first use."""
+    global _client
+    if _client is None:
+        _client = SAMClient()
+    return _client
@@ -0,0 +1,203 @@
+import heapq
+import re
+from array import array
+
+_BTIH_PATTERN = re.compile(r'urn:btih:([0-9a-zA-Z]+)')
+_NAME_NOISE = re.compile(r'[^0-9a-z]+')
+
+SORT_KEYS = ('seeds', 'leechers', 'size', 'name', 'score')
+
+
+def infohash_from_url(url):
+    """Extracts the upper-cased BTIH infohash from a magnet link, or returns None."""
+    if not url:
+        return None
+    match = _BTIH_PATTERN.search(url)
+    return match.group(1).upper() if match else None
+
+
+def normalize_name(name):
+    """Lower-cases a release name and collapses punctuation so mirrors of one release compare equal."""
+    return _NAME_NOISE.sub(' ', (name or '').lower()).strip()
+
+
+class ResultSet:
+    """
+    Column-oriented storage for search results.
+
+    Numeric columns live in 64-bit (`'q'`) `array`s and text columns in plain
+    lists, so a 100k-row result set costs a handful of containers instead of
+    100k dicts. Filtering, sorting and ranking work on row indices and only
+    build a new set (via `take`) at the end of each step. The steps are not
+    vectorized: filters, scores and dedup are per-row Python loops (list
+    comprehensions), which measured faster here than `map`/`compress`
+    pipelines; sorting and top-N use `sorted` and `heapq` keyed on the columns.
+    """
+
+    def __init__(self, names=None, sizes=None, seeders=None, leechers=None, infohashes=None, sources=None, urls=None):
+        self.names = names if names is not None else []
+        self.sizes = sizes if sizes is not None else array('q')
+        self.seeders = seeders if seeders is not None else array('q')
+        self.leechers = leechers if leechers is not None else array('q')
+        self.infohashes = infohashes if infohashes is not None else []
+        self.sources = sources if sources is not None else []
+        self.urls = urls if urls is not None else []
+
+    @classmethod
+    def from_results(cls, results):
+        """
+        Builds a result set from qBittorrent search result dicts.
+
+        Args:
+            results (iterable): Dicts with fileName, fileSize, nbSeeders, nbLeechers,
+                fileUrl and siteUrl keys, as returned by QBittorrentClient.search.
+        """
+        results = results if isinstance(results, list) else list(results)
+        urls = [res.get('fileUrl') for res in results]
+        return cls(
+            names=[res.get('fileName') or '' for res in results],
+            sizes=array('q', [max(int(res.get('fileSize') or 0), 0) for res in results]),
+            seeders=array('q', [max(int(res.get('nbSeeders') or 0), 0) for res in results]),
+            leechers=array('q', [max(int(res.get('nbLeechers') or 0), 0) for res in results]),
+            infohashes=[infohash_from_url(url) for url in urls],
+            sources=[res.get('siteUrl') or res.get('engineName') or '' for res in results],
+            urls=urls,
+        )
+
+    def append(self, res):
+        """Appends one qBittorrent search result dict."""
+        url = res.get('fileUrl')
+        self.names.append(res.get('fileName') or '')
+        self.sizes.append(max(int(res.get('fileSize') or 0), 0))
+        self.seeders.append(max(int(res.get('nbSeeders') or 0), 0))
+        self.leechers.append(max(int(res.get('nbLeechers') or 0), 0))
+        self.infohashes.append(infohash_from_url(url))
+        self.sources.append(res.get('siteUrl') or res.get('engineName') or '')
+        self.urls.append(url)
+
+    def __len__(self):
+        return len(self.names)
+
+    def take(self, indices):
+        """Returns a new result set containing only the rows at `indices`, in that order."""
+        names, infohashes, sources, urls = self.names, self.infohashes, self.sources, self.urls
+        sizes, seeders, leechers = self.sizes, self.seeders, self.leechers
+        return ResultSet(
+            names=[names[i] for i in indices],
+            sizes=array('q', [sizes[i] for i in indices]),
+            seeders=array('q', [seeders[i] for i in indices]),
+            leechers=array('q', [leechers[i] for i in indices]),
+            infohashes=[infohashes[i] for i in indices],
+            sources=[sources[i] for i in indices],
+            urls=[urls[i] for i in indices],
+        )
+
+    def filter(self, min_seeds=None, min_size=None, max_size=None, name_contains=None):
+        """
+        Keeps only the rows that satisfy every given condition.
+
+        Args:
+            min_seeds (int): Minimum number of seeders.
+            min_size (int): Minimum size in bytes.
+            max_size (int): Maximum size in bytes.
+            name_contains (str): Case-insensitive substring of the name.
+        """
+        indices = range(len(self))
+        if min_seeds is not None:
+            seeders = self.seeders
+            indices = [i for i in indices if seeders[i] >= min_seeds]
+        if min_size is not None:
+            sizes = self.sizes
+            indices = [i for i in indices if sizes[i] >= min_size]
+        if max_size is not None:
+            sizes = self.sizes
+            indices = [i for i in indices if sizes[i] <= max_size]
+        if name_contains:
+            needle = name_contains.lower()
+            names = self.names
+            indices = [i for i in indices if needle in names[i].lower()]
+        if isinstance(indices, range):
+            return self
+        return self.take(indices)
+
+    def scores(self, seeds_weight=1.0, leechers_weight=0.25, size_weight=0.0):
+        """
+        Computes a linear ranking score per row.
+
+        Returns:
+            array: One float per row, `seeds*w1 + leechers*w2 + GiB*w3`.
+        """
+        gib = float(1 << 30)
+        return array('d', [
+            s * seeds_weight + l * leechers_weight + (z / gib) * size_weight
+            for s, l, z in zip(self.seeders, self.leechers, self.sizes)
+        ])
+
+    def _sort_column(self, key, **weights):
+        if key == 'seeds':
+            return self.seeders
+        if key == 'leechers':
+            return self.leechers
+        if key == 'size':
+            return self.sizes
+        if key == 'name':
+            return [name.lower() for name in self.names]
+        if key == 'score':
+            return self.scores(**weights)
+        raise ValueError(f"Unknown sort key '{key}'. Choices are {list(SORT_KEYS)}.")
+
+    def sort(self, key='seeds', descending=True, **weights):
+        """Returns the rows ordered by `key` (one of SORT_KEYS)."""
+        column = self._sort_column(key, **weights)
+        return self.take(sorted(range(len(self)), key=column.__getitem__, reverse=descending))
+
+    def top(self, n, key='seeds', **weights):
+        """Returns the `n` best rows by `key` without sorting the whole set."""
+        column = self._sort_column(key, **weights)
+        if key == 'name':
+            indices = heapq.nsmallest(n, range(len(self)), key=column.__getitem__)
+        else:
+            indices = heapq.nlargest(n, range(len(self)), key=column.__getitem__)
+        return self.take(indices)
+
+    def dedup(self, by='infohash'):
+        """
+        Collapses duplicate rows, keeping the best-seeded copy of each.
+
+        Args:
+            by (str): 'infohash' (rows without a hash are kept as-is) or 'name'
+                (normalized release name).
+        """
+        if by == 'infohash':
+            keys = self.infohashes
+        elif by == 'name':
+            keys = [normalize_name(name) for name in self.names]
+        else:
+            raise ValueError(f"Unknown dedup key '{by}'. Choices are ['infohash', 'name'].")
+
+        seeders = self.seeders
+        best = {}
+        unkeyed = []
+        for i, key in enumerate(keys):
+            if not key:
+                unkeyed.append(i)
+                continue
+            current = best.get(key)
+            if current is None or seeders[i] > seeders[current]:
+                best[key] = i
+        return self.take(sorted(unkeyed + list(best.values())))
+
+    def rows(self):
+        """Yields each row as a dict using the qBittorrent result field names."""
+        for i in range(len(self)):
+            yield {
+                'fileName': self.names[i],
+                'fileSize': self.sizes[i],
+                'nbSeeders': self.seeders[i],
+                'nbLeechers': self.leechers[i],
+                'infohash': self.infohashes[i],
+                'siteUrl': self.sources[i],
+                'fileUrl': self.urls[i],
+            }
+
+    __iter__ = rows
@@ -0,0 +1,254 @@
+import getpass
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+import threading
+from anon_framework.config.settings import get_config
+from anon_framework.utils.helpers import get_os
+from anon_framework.utils import metrics
+
+# Profile files Tor Browser never modifies in place. These are hardlinked into
+# a session instead of copied; everything else (sqlite databases, prefs.js,
+# session state) is copied so the template stays pristine.
+IMMUTABLE_SUFFIXES = ('.xpi', '.jar', '.ja', '.so', '.dll', '.dylib', '.png', '.ico')
+STAMP_NAME = '.anon-template-stamp'
+
+
+def _default_ram_dir():
+    """
+    Returns a RAM-backed directory where one is available, preferring the
+    per-user runtime directory over the shared /dev/shm.
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and _is_private(runtime_dir):
+        return runtime_dir
+    if get_os() == 'linux' and os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def _is_private(path):
+    """True if `path` is a real directory (not a symlink) owned by this user and closed to everyone else."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    if not stat.S_ISDIR(st.st_mode):
+        return False
+    if not hasattr(os, 'getuid'):
+        # Windows: the temp directory is already per-user.
+        return True
+    return st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+
+def clone_profile(template_dir, target_dir):
+    """
+    Clones a profile template into `target_dir`.
+
+    Immutable files are hardlinked (falling back to a copy across filesystems)
+    and all other files are copied, so sessions never write into the template.
+    """
+    for root, dirs, files in os.walk(template_dir):
+        rel = os.path.relpath(root, template_dir)
+        dest_root = target_dir if rel == '.' else os.path.join(target_dir, rel)
+        os.makedirs(dest_root, exist_ok=True)
+        for name in files:
+            if name == STAMP_NAME:
+                continue
+            src = os.path.join(root, name)
+            dst = os.path.join(dest_root, name)
+            if name.endswith(IMMUTABLE_SUFFIXES):
+                try:
+                    os.link(src, dst)
+                    continue
+                except OSError:
+                    pass
+            shutil.copy2(src, dst)
+
+
+def _terminate(process, timeout=5):
+    """Stops a browser process, killing it if it ignores SIGTERM for `timeout` seconds."""
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+class BrowserSession:
+    """A running, disposable Tor Browser instance backed by a RAM profile directory."""
+
+    def __init__(self, process, profile_dir):
+        self.process = process
+        self.profile_dir = profile_dir
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def wait(self):
+        """Blocks until the browser exits, then wipes the session."""
+        if self.process is not None:
+            self.process.wait()
+        self.close()
+
+    def close(self, timeout=5):
+        """Stops the browser (if still running) and discards its profile directory."""
+        with metrics.span("tor browser teardown", 'anon_tor_browser_teardown_seconds'):
+            _terminate(self.process, timeout)
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class TorBrowserService:
+    """
+    Launches disposable Tor Browser sessions.
+
+    A pristine template profile is staged once into RAM (tmpfs on Linux).
+    Each session gets its own clone of that staged copy, so startup avoids
+    unpacking from disk, and teardown is a single directory removal.
+    Optionally the next session's profile (and browser process) is prepared
+    in the background while the current one is in use.
+    """
+
+    def __init__(self, binary=None, template_profile=None, ram_dir=None, prewarm=None):
+        config = get_config()['tor_browser']
+        bundle_dir = os.path.expanduser(config['bundle_dir'])
+        self.binary = binary or config['binary'] or os.path.join(bundle_dir, 'Browser', 'firefox')
+        self.template_profile = template_profile or config['template_profile'] or \
+            os.path.join(bundle_dir, 'Browser', 'TorBrowser', 'Data', 'Browser', 'profile.default')
+        self.ram_dir = ram_dir or config['ram_dir'] or _default_ram_dir()
+        self.prewarm_enabled = config['prewarm'] if prewarm is None else prewarm
+        self._warm = None
+        self._warm_lock = threading.Lock()
+        self._prewarm_thread = None
+        # Private staging directory used when the shared name is taken by someone else.
+        self._staged_fallback = None
+
+    def _staged_path(self):
+        return self._staged_fallback or os.path.join(self.ram_dir, f"anon-tb-template-{getpass.getuser()}")
+
+    def _stage_template(self):
+        """
+        Copies the template profile into RAM once and returns the staged path.
+
+        The staged copy outlives this process (until reboot for tmpfs) and is
+        refreshed whenever the template directory's mtime changes. It is only
+        reused if it is a directory owned by this user with mode 0700; a
+        directory of that name planted by anyone else is never trusted, and
+        this process stages into a fresh private directory instead.
+        """
+        try:
+            source_stamp = str(os.stat(self.template_profile).st_mtime_ns)
+        except OSError:
+            raise FileNotFoundError(f"Tor Browser template profile not found: {self.template_profile}")
+        staged = self._staged_path()
+        private = _is_private(staged)
+        if private:
+            try:
+                with open(os.path.join(staged, STAMP_NAME)) as f:
+                    if f.read() == source_stamp:
+                        return staged
+            except OSError:
+                pass
+
+        with metrics.span("tor browser stage template", 'anon_tor_browser_stage_seconds'):
+            if private:
+                shutil.rmtree(staged)
+            try:
+                os.mkdir(staged, 0o700)
+            except FileExistsError:
+                staged = self._staged_fallback = tempfile.mkdtemp(
+                    prefix=f"anon-tb-template-{getpass.getuser()}-", dir=self.ram_dir)
+            clone_profile(self.template_profile, staged)
+            with open(os.path.join(staged, STAMP_NAME), 'w') as f:
+                f.write(source_stamp)
+        return staged
+
+    def _new_profile(self):
+        template = self._stage_template()
+        with metrics.span("tor browser clone profile", 'anon_tor_browser_clone_seconds'):
+            profile_dir = tempfile.mkdtemp(prefix='anon-tb-session-', dir=self.ram_dir)
+            clone_profile(template, profile_dir)
+        return profile_dir
+
+    def _spawn(self, profile_dir, extra_args=()):
+        command = [self.binary, '--no-remote', '--profile', profile_dir] + list(extra_args)
+        with metrics.span("tor browser spawn", 'anon_tor_browser_spawn_seconds'):
+            return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def prewarm(self, spawn=False):
+        """
+        Prepares the next session in the background.
+
+        Only one prewarm thread runs at a time; while one is still preparing,
+        it is returned instead of starting another, so `shutdown()` can always
+        join every thread that might publish a session.
+
+        Args:
+            spawn (bool): Also start the browser process, not just clone the profile.
+        """
+        def prepare():
+            profile_dir = self._new_profile()
+            process = self._spawn(profile_dir) if spawn else None
+            with self._warm_lock:
+                if self._warm is None:
+                    self._warm = (profile_dir, process)
+                    return
+            # Someone else already prepared a session; discard ours.
+            BrowserSession(process, profile_dir).close()
+
+        with self._warm_lock:
+            if self._prewarm_thread is not None and self._prewarm_thread.is_alive():
+                return self._prewarm_thread
+            thread = self._prewarm_thread = threading.Thread(target=prepare, name='tor-browser-prewarm', daemon=True)
+            thread.start()
+        return thread
+
+    def launch(self, extra_args=()):
+        """
+        Starts a disposable session, reusing a pre-warmed one when available.
+
+        Returns:
+            BrowserSession: The running session. Call `close()` to wipe it.
+        """
+        with metrics.span("tor browser launch", 'anon_tor_browser_launch_seconds'):
+            with self._warm_lock:
+                warm, self._warm = self._warm, None
+            if warm is not None:
+                profile_dir, process = warm
+                if process is not None and extra_args:
+                    # The pre-spawned browser was started without these arguments; restart it on the same profile.
+                    _terminate(process)
+                    process = None
+                if process is None:
+                    process = self._spawn(profile_dir, extra_args)
+            else:
+                profile_dir = self._new_profile()
+                process = self._spawn(profile_dir, extra_args)
+        session = BrowserSession(process, profile_dir)
+        if self.prewarm_enabled:
+            self.prewarm()
+        return session
+
+    def shutdown(self, clear_template=False):
+        """
+        Discards any pre-warmed session.
+
+        Args:
+            clear_template (bool): Also remove the staged template from RAM.
+        """
+        with self._warm_lock:
+            thread, self._prewarm_thread = self._prewarm_thread, None
+        if thread is not None:
+            thread.join()
+        with self._warm_lock:
+            warm, self._warm = self._warm, None
+        if warm is not None:
+            profile_dir, process = warm
+            BrowserSession(process, profile_dir).close()
+        if clear_template and _is_private(self._staged_path()):
+            shutil.rmtree(self._staged_path(), ignore_errors=True)
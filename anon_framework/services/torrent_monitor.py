@@ -0,0 +1,163 @@
+import asyncio
+from anon_framework.utils import metrics
+from anon_framework.utils.runtime import get_runtime
+
+SYNC_POLLS = metrics.counter('anon_torrent_sync_polls', 'sync/maindata requests made by the torrent mirror.')
+SYNC_CHANGES = metrics.counter('anon_torrent_sync_changes', 'Torrent entries added, changed or removed by sync deltas.')
+
+
+class TorrentState:
+    """Compact local record of one torrent. Only the fields below are kept."""
+    FIELDS = (
+        'name', 'state', 'progress', 'size', 'dlspeed', 'upspeed',
+        'num_seeds', 'num_leechs', 'ratio', 'eta', 'category', 'added_on',
+    )
+    __slots__ = ('hash',) + FIELDS
+
+    def __init__(self, torrent_hash):
+        self.hash = torrent_hash
+        for field in self.FIELDS:
+            setattr(self, field, None)
+
+    def update(self, changes):
+        """Applies a partial diff; returns True if any tracked field changed."""
+        changed = False
+        for field, value in changes.items():
+            if field in self.FIELDS and getattr(self, field) != value:
+                setattr(self, field, value)
+                changed = True
+        return changed
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in ('hash',) + self.FIELDS}
+
+    def __repr__(self):
+        return f"TorrentState({self.hash!r}, name={self.name!r}, state={self.state!r})"
+
+
+class TorrentMirror:
+    """
+    Keeps a local copy of qBittorrent's torrent list up to date by applying
+    the incremental diffs from /api/v2/sync/maindata instead of re-fetching
+    /api/v2/torrents/info in full.
+
+    Subscribers are called with `(added, changed, removed)` lists of hashes
+    after every poll that changed something, on the thread that applied the
+    delta: the event loop under `watch()`, the caller's thread under `poll()`.
+    """
+
+    def __init__(self, client):
+        """
+        Args:
+            client (QBittorrentClient): The Web API client used for polling and bulk actions.
+        """
+        self.client = client
+        self.rid = 0
+        self.torrents = {}
+        self.server_state = {}
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """
+        Registers `callback(added, changed, removed)`.
+
+        Returns:
+            A zero-argument function that removes the subscription.
+        """
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def apply(self, delta):
+        """
+        Applies one sync/maindata response to the local model.
+
+        Returns:
+            tuple: (added, changed, removed) lists of torrent hashes.
+        """
+        added, changed, removed = [], [], []
+        if delta.get('full_update'):
+            removed.extend(self.torrents)
+            self.torrents.clear()
+
+        for torrent_hash, changes in delta.get('torrents', {}).items():
+            state = self.torrents.get(torrent_hash)
+            if state is None:
+                state = self.torrents[torrent_hash] = TorrentState(torrent_hash)
+                state.update(changes)
+                added.append(torrent_hash)
+            elif state.update(changes):
+                changed.append(torrent_hash)
+
+        for torrent_hash in delta.get('torrents_removed', ()):
+            if self.torrents.pop(torrent_hash, None) is not None:
+                removed.append(torrent_hash)
+
+        if delta.get('full_update'):
+            # A hash present before and after a full refresh is a change, not a remove/add pair.
+            readded = set(removed) & set(added)
+            removed = [h for h in removed if h not in readded]
+            added = [h for h in added if h not in readded]
+            changed.extend(readded)
+            self.server_state = {}
+        self.server_state.update(delta.get('server_state', {}))
+
+        self.rid = delta.get('rid', self.rid)
+        SYNC_CHANGES.inc(len(added) + len(changed) + len(removed))
+        if added or changed or removed:
+            for callback in list(self._subscribers):
+                callback(added, changed, removed)
+        return added, changed, removed
+
+    def fetch(self):
+        """Requests the delta since the last applied one without applying it; None if the request failed."""
+        SYNC_POLLS.inc()
+        return self.client.sync_maindata(self.rid)
+
+    def poll(self):
+        """Fetches and applies the next delta. Returns False if the request failed."""
+        delta = self.fetch()
+        if delta is None:
+            return False
+        self.apply(delta)
+        return True
+
+    async def watch(self, interval=2.0, stop_event=None):
+        """
+        Polls on the shared runtime every `interval` seconds until `stop_event` is set.
+
+        Only the HTTP request runs on the runtime's executor; the delta is
+        applied and subscribers are called on the event loop, so they may
+        touch loop-bound state (tasks, the TUI, IRC clients) directly.
+
+        Args:
+            interval (float): Seconds between polls.
+            stop_event (asyncio.Event): Optional event that ends the loop.
+        """
+        runtime = get_runtime()
+        while stop_event is None or not stop_event.is_set():
+            delta = await runtime.to_thread(self.fetch)
+            if delta is not None:
+                self.apply(delta)
+            try:
+                if stop_event is None:
+                    await asyncio.sleep(interval)
+                else:
+                    await asyncio.wait_for(stop_event.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def select(self, predicate):
+        """Returns the hashes of all mirrored torrents matching `predicate(state)`."""
+        return [torrent_hash for torrent_hash, state in self.torrents.items() if predicate(state)]
+
+    def pause(self, hashes):
+        """Pauses all `hashes` in one batched request."""
+        return self.client.pause_torrents(hashes)
+
+    def resume(self, hashes):
+        """Resumes all `hashes` in one batched request."""
+        return self.client.resume_torrents(hashes)
+
+    def add(self, urls, **options):
+        """Adds all `urls` in one batched request."""
+        return self.client.add_torrents(urls, **options)
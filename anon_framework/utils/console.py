@@ -0,0 +1,214 @@
+import atexit
+import json
+import sys
+import threading
+import time
+from collections import deque
+from anon_framework.utils import metrics
+
+# Line priorities. LOW lines (server noise, MOTD, LIST floods) are the first
+# to be dropped when the writer falls behind; HIGH lines are never dropped.
+LOW = 0
+NORMAL = 1
+HIGH = 2
+PRIORITY_NAMES = {LOW: 'low', NORMAL: 'normal', HIGH: 'high'}
+
+LINES_WRITTEN = metrics.counter('anon_console_lines_written', 'Lines written by the console pipeline.')
+LINES_DROPPED = metrics.counter('anon_console_lines_dropped', 'Low-priority lines dropped under backpressure.')
+
+
+class _Record:
+    """A single pending output line. `message` may be a callable for lazy formatting."""
+    __slots__ = ('ts', 'priority', 'message', 'fields')
+
+    def __init__(self, ts, priority, message, fields):
+        self.ts = ts
+        self.priority = priority
+        self.message = message
+        self.fields = fields
+
+    def text(self):
+        message = self.message
+        return message() if callable(message) else str(message)
+
+
+class Console:
+    """
+    A queue-backed output pipeline.
+
+    Callers (usually coroutines on the event loop) only append a record to an
+    in-memory queue. A background writer thread drains the queue in batches,
+    renders them as plain text or JSON lines and issues a single write and
+    flush per batch, so terminal I/O never blocks the caller.
+    """
+
+    def __init__(self, stream=None, json_mode=False, capacity=2000, batch_interval=0.02):
+        """
+        Args:
+            stream: The file-like object to write to (defaults to sys.stdout).
+            json_mode (bool): Emit one JSON object per line instead of plain text.
+            capacity (int): Pending lines after which LOW lines are dropped.
+                NORMAL lines are dropped at four times this size.
+            batch_interval (float): Seconds the writer waits to coalesce lines.
+        """
+        self.stream = stream
+        self.json_mode = json_mode
+        self.capacity = capacity
+        self.batch_interval = batch_interval
+        self.prompt = None
+        self.sink = None
+        self.dropped = 0
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='console-writer', daemon=True)
+        self._thread.start()
+
+    def emit(self, message, priority=NORMAL, **fields):
+        """
+        Queues a line for output without blocking.
+
+        Args:
+            message: The text, or a zero-argument callable producing it. Callables
+                are only invoked if the line is actually written.
+            priority (int): LOW, NORMAL or HIGH.
+            **fields: Extra structured data included in JSON mode.
+
+        Returns:
+            bool: False if the line was dropped because of backpressure.
+        """
+        with self._cond:
+            backlog = len(self._pending)
+            if (priority == LOW and backlog >= self.capacity) or \
+                    (priority == NORMAL and backlog >= self.capacity * 4):
+                self.dropped += 1
+                LINES_DROPPED.inc()
+                return False
+            self._pending.append(_Record(time.time(), priority, message, fields))
+            self._idle.clear()
+            self._cond.notify()
+        return True
+
+    def info(self, message, **fields):
+        self.emit(message, NORMAL, **fields)
+
+    def noise(self, message, **fields):
+        self.emit(message, LOW, **fields)
+
+    def error(self, message, **fields):
+        self.emit(message, HIGH, level='error', **fields)
+
+    def set_prompt(self, prompt):
+        """Sets the input prompt repainted after each batch (text mode only)."""
+        self.prompt = prompt
+
+    def set_sink(self, sink):
+        """
+        Hands each rendered batch to `sink(entries)` instead of writing it to the
+        stream (None restores the stream). `entries` is a list of
+        (text, priority, fields); the sink is called on the writer thread.
+        """
+        self.sink = sink
+
+    def flush(self, timeout=2.0):
+        """Blocks until every queued line has been written."""
+        with self._cond:
+            self._cond.notify()
+        self._idle.wait(timeout)
+
+    def close(self):
+        """Flushes pending output and stops the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(2.0)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._idle.set()
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    self._idle.set()
+                    return
+            # Give the producer a moment to add more lines so they share one write.
+            if self.batch_interval and not self._closed:
+                time.sleep(self.batch_interval)
+            with self._cond:
+                batch = self._pending
+                self._pending = deque()
+                dropped, self.dropped = self.dropped, 0
+            self._write(batch, dropped)
+
+    def _write(self, batch, dropped):
+        sink = self.sink
+        if sink is not None:
+            entries = [(record.text(), record.priority, record.fields) for record in batch]
+            if dropped:
+                entries.append((f"[console] {dropped} low-priority lines suppressed", HIGH, {}))
+            try:
+                sink(entries)
+            except RuntimeError:
+                # The sink's event loop is gone (shutting down).
+                return
+            LINES_WRITTEN.inc(len(entries))
+            return
+        stream = self.stream or sys.stdout
+        if self.json_mode:
+            out = [self._render_json(record) for record in batch]
+            if dropped:
+                out.append(json.dumps({'ts': time.time(), 'priority': 'high', 'event': 'dropped', 'count': dropped}))
+        else:
+            out = [record.text() for record in batch]
+            if dropped:
+                out.append(f"[console] {dropped} low-priority lines suppressed")
+        text = "\n".join(out) + "\n"
+        interactive = not self.json_mode and self.prompt is not None and stream.isatty()
+        if interactive:
+            # Clear whatever prompt is on the current line, then repaint it below the batch.
+            text = "\r\x1b[K" + text + self.prompt
+        try:
+            stream.write(text)
+            stream.flush()
+        except (OSError, ValueError):
+            return
+        LINES_WRITTEN.inc(len(out))
+
+    @staticmethod
+    def _render_json(record):
+        entry = {'ts': record.ts, 'priority': PRIORITY_NAMES[record.priority], 'message': record.text()}
+        entry.update(record.fields)
+        return json.dumps(entry, default=str)
+
+
+_console = None
+_console_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    """Replaces the process-wide console with one built from `kwargs`."""
+    global _console
+    with _console_lock:
+        if _console is not None:
+            _console.close()
+        _console = Console(**kwargs)
+    return _console
+
+
+def get_console():
+    """Returns the process-wide console, creating a plain-text one on first use."""
+    global _console
+    if _console is None:
+        with _console_lock:
+            if _console is None:
+                _console = Console()
+    return _console
+
+
+@atexit.register
+def _flush_on_exit():
+    if _console is not None:
+        _console.close()
@@ -0,0 +1,120 @@
+import csv
+import json
+import sys
+
+FORMATS = ('text', 'ndjson', 'csv', 'json')
+
+
+class RecordWriter:
+    """
+    Base class for streaming record writers.
+
+    Each record is written and flushed as soon as `write()` is called and
+    nothing is retained afterwards, so memory use does not depend on how
+    many records pass through.
+    """
+
+    def __init__(self, stream=None, fields=None):
+        """
+        Args:
+            stream: The file-like object to write to (defaults to sys.stdout).
+            fields (list): Column order; required by formats with a header (CSV).
+        """
+        self.stream = stream or sys.stdout
+        self.fields = fields
+        self.count = 0
+
+    def write(self, record):
+        """Writes one record (a dict) and flushes it."""
+        if self.fields:
+            record = {key: record.get(key) for key in self.fields}
+        self._write(record)
+        self.count += 1
+        self.stream.flush()
+
+    def write_all(self, records):
+        """Writes every record from an iterable; returns the number written."""
+        for record in records:
+            self.write(record)
+        return self.count
+
+    def close(self):
+        """Finishes the output (closing brackets etc.)."""
+        self.stream.flush()
+
+    def _write(self, record):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class NdjsonWriter(RecordWriter):
+    """One JSON object per line."""
+
+    def _write(self, record):
+        self.stream.write(json.dumps(record, default=str) + "\n")
+
+
+class JsonWriter(RecordWriter):
+    """A single JSON array, streamed element by element."""
+
+    def _write(self, record):
+        self.stream.write(("[\n" if self.count == 0 else ",\n") + json.dumps(record, default=str))
+
+    def close(self):
+        self.stream.write("[]\n" if self.count == 0 else "\n]\n")
+        super().close()
+
+
+class CsvWriter(RecordWriter):
+    """CSV with a header row. Fields default to the keys of the first record."""
+
+    def __init__(self, stream=None, fields=None):
+        super().__init__(stream, fields)
+        self._writer = None
+
+    def _write(self, record):
+        if self._writer is None:
+            self.fields = self.fields or list(record)
+            self._writer = csv.DictWriter(self.stream, fieldnames=self.fields, extrasaction='ignore')
+            self._writer.writeheader()
+        self._writer.writerow(record)
+
+
+class TextWriter(RecordWriter):
+    """Human-readable blocks of 'Key: value' lines separated by '---'."""
+
+    def __init__(self, stream=None, fields=None, labels=None):
+        super().__init__(stream, fields)
+        self.labels = labels or {}
+
+    def _write(self, record):
+        keys = self.fields or list(record)
+        lines = [f"{self.labels.get(key, key)}: {record.get(key)}" for key in keys]
+        self.stream.write("\n".join(lines) + "\n---\n")
+
+
+def get_writer(fmt, stream=None, fields=None, labels=None):
+    """
+    Returns a record writer for `fmt` (one of FORMATS).
+
+    Args:
+        fmt (str): 'text', 'ndjson', 'csv' or 'json'.
+        stream: Output stream (defaults to sys.stdout).
+        fields (list): Keys to output, in order.
+        labels (dict): Display names for keys in text mode.
+    """
+    if fmt == 'text':
+        return TextWriter(stream, fields, labels)
+    if fmt == 'ndjson':
+        return NdjsonWriter(stream, fields)
+    if fmt == 'csv':
+        return CsvWriter(stream, fields)
+    if fmt == 'json':
+        return JsonWriter(stream, fields)
+    raise ValueError(f"Unknown output format '{fmt}'. Choices are {list(FORMATS)}.")
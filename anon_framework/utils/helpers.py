@@ -1,5 +1,9 @@
 import sys
 import subprocess
+from anon_framework.utils import metrics
+
+SUBPROCESS_CALLS = metrics.counter('anon_subprocess_calls', 'Subprocesses spawned by the framework.')
+SUBPROCESS_FAILURES = metrics.counter('anon_subprocess_failures', 'Subprocesses that exited non-zero or failed to start.')
 
 def get_os():
     """
@@ -17,25 +21,58 @@ def get_os():
     else:
         return sys.platform
 
-def run_command(command):
+def run_command(command, input=None):
     """
     Runs a shell command and returns its output.
 
     Args:
         command (list): The command to execute as a list of strings.
+        input (str): Optional data to write to the command's stdin.
 
     Returns:
         tuple: A tuple containing (stdout, stderr, returncode).
     """
+    SUBPROCESS_CALLS.inc()
     try:
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            check=False  # Set to False to handle non-zero exit codes manually
-        )
+        with metrics.span(f"subprocess: {' '.join(command[:3])}", 'anon_subprocess_seconds'):
+            result = subprocess.run(
+                command,
+                input=input,
+                capture_output=True,
+                text=True,
+                check=False  # Set to False to handle non-zero exit codes manually
+            )
+        if result.returncode != 0:
+            SUBPROCESS_FAILURES.inc()
         return (result.stdout.strip(), result.stderr.strip(), result.returncode)
     except FileNotFoundError as e:
+        SUBPROCESS_FAILURES.inc()
         return (None, f"Command not found: {e}", 1)
     except Exception as e:
-        return (None, f"An unexpected error occurred: {e}", 1)
\ No newline at end of file
+        SUBPROCESS_FAILURES.inc()
+        return (None, f"An unexpected error occurred: {e}", 1)
+
+def status_record(provider, status_text):
+    """
+    Builds the provider-independent status record used by all status commands.
+
+    Args:
+        provider (str): Short provider name (e.g. 'nord', 'tor', 'i2p').
+        status_text (str): The provider's human-readable status output.
+
+    Returns:
+        dict: {'provider', 'connected', 'status', 'details'}, where `details`
+        holds any 'Key: value' lines from the status text.
+    """
+    details = {}
+    for line in status_text.splitlines():
+        key, sep, value = line.partition(':')
+        if sep and value.strip():
+            details[key.strip().lower().replace(' ', '_')] = value.strip()
+    lowered = status_text.lower()
+    return {
+        'provider': provider,
+        'connected': 'connected' in lowered and 'disconnected' not in lowered,
+        'status': status_text,
+        'details': details,
+    }
@@ -0,0 +1,283 @@
+import threading
+import time
+from functools import wraps
+
+# Global switch checked by every recording call. While it is False the
+# instrumentation is reduced to a single attribute lookup and branch.
+_enabled = False
+_lock = threading.Lock()
+_registry = {}
+# phase -> [calls, total seconds], aggregated in place so hot spans don't grow memory.
+_phases = {}
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def enable():
+    """Turns on metric collection for the current process."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Turns off metric collection. Already recorded values are kept."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    """Returns True if metrics are currently being recorded."""
+    return _enabled
+
+
+def reset():
+    """Clears all recorded values and the phase log."""
+    with _lock:
+        for metric in _registry.values():
+            metric._reset()
+        _phases.clear()
+
+
+class Counter:
+    """A monotonically increasing counter."""
+    __slots__ = ('name', 'help', 'value')
+    kind = 'counter'
+
+    def __init__(self, name, help=''):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount=1):
+        """Adds `amount` to the counter if metrics are enabled."""
+        if _enabled:
+            self.value += amount
+
+    def _reset(self):
+        self.value = 0
+
+    def _render(self):
+        return [f"{self.name}_total {self.value}"]
+
+
+class Histogram:
+    """A cumulative histogram of observed values (usually seconds)."""
+    __slots__ = ('name', 'help', 'buckets', 'counts', 'sum', 'count')
+    kind = 'histogram'
+
+    def __init__(self, name, help='', buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._reset()
+
+    def observe(self, value):
+        """Records a single observation if metrics are enabled."""
+        if not _enabled:
+            return
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def time(self):
+        """Returns a context manager that observes the elapsed wall time."""
+        if not _enabled:
+            return _NULL_SPAN
+        return _Span(self.name, self)
+
+    def _reset(self):
+        # One extra slot for observations above the largest bucket (+Inf).
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def _render(self):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum:.6f}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class _Span:
+    """Times a block of code and records it as a histogram observation and a phase."""
+    __slots__ = ('phase', 'histogram', 'start')
+
+    def __init__(self, phase, histogram):
+        self.phase = phase
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        if self.histogram is not None:
+            self.histogram.observe(elapsed)
+        with _lock:
+            entry = _phases.get(self.phase)
+            if entry is None:
+                _phases[self.phase] = [1, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+        return False
+
+
+class _NullSpan:
+    """Shared no-op context manager handed out while metrics are disabled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _get_or_create(cls, name, help, **kwargs):
+    metric = _registry.get(name)
+    if metric is None:
+        with _lock:
+            metric = _registry.get(name)
+            if metric is None:
+                metric = cls(name, help, **kwargs)
+                _registry[name] = metric
+    elif not isinstance(metric, cls):
+        raise ValueError(f"Metric '{name}' is already registered as a {metric.kind}.")
+    return metric
+
+
+def counter(name, help=''):
+    """Returns the counter registered under `name`, creating it if needed."""
+    return _get_or_create(Counter, name, help)
+
+
+def histogram(name, help='', buckets=DEFAULT_BUCKETS):
+    """Returns the histogram registered under `name`, creating it if needed."""
+    return _get_or_create(Histogram, name, help, buckets=buckets)
+
+
+def span(phase, metric=None):
+    """
+    Returns a context manager timing a named phase of work.
+
+    Args:
+        phase (str): The phase label used in the profile report.
+        metric (str): Optional histogram name that also receives the duration.
+
+    Returns:
+        A context manager. While metrics are disabled this is a shared no-op object.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(phase, histogram(metric) if metric else None)
+
+
+def timed(phase, metric=None):
+    """Decorator form of `span()`."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with span(phase, metric):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render_prometheus():
+    """
+    Renders every registered metric in the Prometheus text exposition format.
+
+    Returns:
+        str: The exposition text, terminated by a newline.
+    """
+    lines = []
+    with _lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    for metric in metrics:
+        if metric.help:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric._render())
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    """Writes the current metrics to `path`, replacing the file atomically."""
+    import os
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def serve_prometheus(port, host='127.0.0.1'):
+    """
+    Starts a background HTTP server exposing the metrics at /metrics.
+
+    Returns:
+        The running `http.server.HTTPServer`; call `shutdown()` to stop it.
+    """
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') not in ('', '/metrics'):
+                self.send_error(404)
+                return
+            body = render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def phase_report(total=None):
+    """
+    Builds a per-phase timing breakdown of everything recorded so far.
+
+    Args:
+        total (float): Wall time of the whole invocation in seconds. Shares are
+            computed against it when given, otherwise against the phase sum.
+
+    Returns:
+        str: A human-readable table with call count, total and share per phase.
+    """
+    with _lock:
+        totals = {phase: tuple(entry) for phase, entry in _phases.items()}
+    if not totals:
+        return "No timed phases were recorded."
+
+    grand_total = total or sum(elapsed for _, elapsed in totals.values()) or 1.0
+
+    width = max(len(phase) for phase in list(totals) + ['(wall time)'])
+    lines = [f"{'Phase':<{width}}  {'Calls':>6}  {'Total (ms)':>11}  {'Share':>6}"]
+    for phase, (count, elapsed) in sorted(totals.items(), key=lambda item: -item[1][1]):
+        lines.append(f"{phase:<{width}}  {count:>6}  {elapsed * 1000:>11.2f}  {elapsed / grand_total:>6.1%}")
+    if total:
+        lines.append(f"{'(wall time)':<{width}}  {'':>6}  {total * 1000:>11.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,105 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_WORKERS = 8
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+class Runtime:
+    """
+    Owns the framework's single event loop and a bounded thread pool for the
+    blocking calls (subprocesses, psutil scans, HTTP) that cannot be made
+    asynchronous. Every subsystem runs on this loop, so independent
+    operations overlap instead of running one after another.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='anon-blocking')
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.executor)
+
+    def run(self, coro):
+        """Runs `coro` to completion on the shared loop and returns its result."""
+        return self.loop.run_until_complete(coro)
+
+    async def to_thread(self, func, *args, **kwargs):
+        """Runs a blocking callable on the bounded executor without blocking the loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def gather(self, *aws):
+        """Runs awaitables concurrently and returns their results in order."""
+        return await asyncio.gather(*aws)
+
+    def close(self):
+        """Cancels leftover tasks, shuts down the executor and closes the loop."""
+        if self.loop.is_closed():
+            return
+        pending = [task for task in asyncio.all_tasks(self.loop) if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        self.executor.shutdown(wait=False)
+        self.loop.close()
+
+
+class AsyncFacade:
+    """
+    Async view of a blocking subsystem object (VPN providers, I2PService,
+    QBittorrentClient, ...). Calling any public method returns a coroutine
+    that runs the original method on the runtime's executor; coroutine
+    methods on the target are passed through unchanged.
+
+    Example:
+        vpn = AsyncFacade(NordVPN())
+        await vpn.connect()
+    """
+
+    def __init__(self, target, runtime=None):
+        self._target = target
+        self._runtime = runtime
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name.startswith('_') or not callable(attr) or asyncio.iscoroutinefunction(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            runtime = self._runtime or get_runtime()
+            return await runtime.to_thread(attr, *args, **kwargs)
+        return call
+
+    def __repr__(self):
+        return f"AsyncFacade({self._target!r})"
+
+
+def get_runtime():
+    """Returns the process-wide runtime, creating it on first use."""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = Runtime()
+    return _runtime
+
+
+def run(coro):
+    """Runs `coro` on the process-wide runtime. Entry point for sync CLI handlers."""
+    return get_runtime().run(coro)
+
+
+def shutdown():
+    """Closes the process-wide runtime if one was created."""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is not None:
+            _runtime.close()
+            _runtime = None
@@ -0,0 +1,318 @@
+import asyncio
+from collections import OrderedDict
+from anon_framework.config.settings import get_config
+from anon_framework.utils import metrics
+from anon_framework.utils.console import get_console
+from anon_framework.utils.helpers import run_command
+from anon_framework.utils.runtime import get_runtime
+
+try:
+    from dbus_next import BusType, Message, MessageType
+    from dbus_next.aio import MessageBus
+    from dbus_next.constants import MessageFlag
+    from dbus_next.errors import DBusError
+except ImportError:
+    # dbus-next is optional (pip install anon-framework[dbus]); without it the CLI backend is used.
+    MessageBus = None
+
+SYSTEMD = 'org.freedesktop.systemd1'
+SYSTEMD_PATH = '/org/freedesktop/systemd1'
+MANAGER = 'org.freedesktop.systemd1.Manager'
+UNIT = 'org.freedesktop.systemd1.Unit'
+PROPERTIES = 'org.freedesktop.DBus.Properties'
+
+# D-Bus errors that mean we may not manage units ourselves, so `sudo systemctl` is the way in.
+AUTH_ERRORS = frozenset({
+    'org.freedesktop.DBus.Error.AccessDenied',
+    'org.freedesktop.DBus.Error.InteractiveAuthorizationRequired',
+})
+# Job results (JobRemoved) are kept this long for jobs nobody is waiting on yet.
+FINISHED_JOBS = 64
+
+SERVICE_JOBS = metrics.counter('anon_service_jobs', 'Unit start/stop jobs issued to the service manager.')
+SERVICE_FALLBACKS = metrics.counter('anon_service_cli_fallbacks', 'Unit jobs that fell back from D-Bus to systemctl.')
+
+_manager = None
+
+
+class ServiceError(RuntimeError):
+    """Raised when a unit cannot be started or stopped."""
+
+
+class BusUnavailable(ServiceError):
+    """Raised when systemd cannot be reached (or may not be driven) over D-Bus."""
+
+
+class DBusBackend:
+    """
+    Drives systemd over one persistent system-bus connection.
+
+    Start/stop requests are queued as systemd jobs; completion is taken from
+    the Manager's JobRemoved signal, and the unit's ActiveState from
+    PropertiesChanged, so nothing is polled and the call returns once the
+    unit has actually reached the state that was asked for.
+    """
+
+    name = 'dbus'
+
+    def __init__(self, bus_address=None, timeout=None):
+        """
+        Args:
+            bus_address (str): D-Bus address to connect to; defaults to the system bus
+                (DBUS_SYSTEM_BUS_ADDRESS is honoured).
+            timeout (int): Seconds to wait for a job and the unit state (defaults to systemd.timeout).
+        """
+        if MessageBus is None:
+            raise BusUnavailable("dbus-next is not installed")
+        self.bus_address = bus_address
+        self.timeout = timeout or get_config()['systemd']['timeout']
+        self._bus = None
+        self._connecting = None
+        self._unit_paths = {}
+        self._jobs = {}
+        self._finished = OrderedDict()
+        # Unit object path -> [(wanted states, future)], resolved by PropertiesChanged.
+        self._state_waiters = {}
+
+    async def _connect(self):
+        if self._bus is not None and self._bus.connected:
+            return self._bus
+        if self._connecting is None:
+            self._connecting = asyncio.ensure_future(self._open())
+        connecting = self._connecting
+        try:
+            return await asyncio.shield(connecting)
+        finally:
+            # Every waiter gets here; only the first one to see the finished attempt clears it.
+            if connecting.done() and self._connecting is connecting:
+                self._connecting = None
+
+    async def _open(self):
+        try:
+            if self.bus_address:
+                bus = await MessageBus(bus_address=self.bus_address).connect()
+            else:
+                bus = await MessageBus(bus_type=BusType.SYSTEM).connect()
+        except (OSError, ValueError, DBusError) as e:
+            raise BusUnavailable(f"Cannot connect to the system bus: {e}")
+        bus.add_message_handler(self._on_message)
+        self._bus = bus
+        self._unit_paths.clear()
+        for rule in (
+            f"type='signal',sender='{SYSTEMD}',interface='{MANAGER}',member='JobRemoved'",
+            f"type='signal',sender='{SYSTEMD}',interface='{PROPERTIES}',member='PropertiesChanged',arg0='{UNIT}'",
+        ):
+            await self._call('org.freedesktop.DBus', '/org/freedesktop/DBus', 'org.freedesktop.DBus', 'AddMatch', 's', [rule])
+        # systemd only emits job and unit signals while at least one client is subscribed.
+        await self._call(SYSTEMD, SYSTEMD_PATH, MANAGER, 'Subscribe')
+        return bus
+
+    async def _call(self, destination, path, interface, member, signature='', body=()):
+        reply = await self._bus.call(Message(
+            destination=destination, path=path, interface=interface, member=member,
+            signature=signature, body=list(body), flags=MessageFlag.ALLOW_INTERACTIVE_AUTHORIZATION,
+        ))
+        if reply.message_type == MessageType.ERROR:
+            detail = reply.body[0] if reply.body else reply.error_name
+            if reply.error_name in AUTH_ERRORS:
+                raise BusUnavailable(f"Not authorized to call {member}: {detail}")
+            if reply.error_name == 'org.freedesktop.DBus.Error.ServiceUnknown':
+                raise BusUnavailable(f"systemd is not on the bus: {detail}")
+            raise ServiceError(f"{member} failed: {detail}")
+        return reply.body
+
+    def _on_message(self, message):
+        if message.message_type != MessageType.SIGNAL:
+            return
+        if message.member == 'JobRemoved' and message.interface == MANAGER:
+            _, job, _, result = message.body
+            future = self._jobs.pop(job, None)
+            if future is not None:
+                if not future.done():
+                    future.set_result(result)
+            else:
+                # The signal can overtake the StartUnit reply; keep it for the caller.
+                self._finished[job] = result
+                while len(self._finished) > FINISHED_JOBS:
+                    self._finished.popitem(last=False)
+        elif message.member == 'PropertiesChanged' and message.body[0] == UNIT:
+            state = message.body[1].get('ActiveState')
+            waiters = self._state_waiters.get(message.path)
+            if state is not None and waiters:
+                self._resolve_waiters(message.path, state.value)
+
+    def _resolve_waiters(self, path, state):
+        remaining = []
+        for wanted, future in self._state_waiters.get(path, ()):
+            if future.done():
+                continue
+            if state in wanted or state == 'failed':
+                future.set_result(state)
+            else:
+                remaining.append((wanted, future))
+        if remaining:
+            self._state_waiters[path] = remaining
+        else:
+            self._state_waiters.pop(path, None)
+
+    async def _unit_path(self, unit):
+        path = self._unit_paths.get(unit)
+        if path is None:
+            path = self._unit_paths[unit] = (await self._call(SYSTEMD, SYSTEMD_PATH, MANAGER, 'LoadUnit', 's', [unit]))[0]
+        return path
+
+    async def _active_state(self, path):
+        return (await self._call(SYSTEMD, path, PROPERTIES, 'Get', 'ss', [UNIT, 'ActiveState']))[0].value
+
+    async def active_state(self, unit):
+        """Returns the unit's ActiveState ('active', 'inactive', 'activating', 'failed', ...)."""
+        await self._connect()
+        return await self._active_state(await self._unit_path(unit))
+
+    async def _wait_state(self, path, wanted):
+        future = asyncio.get_running_loop().create_future()
+        # Register before reading the property so a change in between is not missed.
+        self._state_waiters.setdefault(path, []).append((wanted, future))
+        self._resolve_waiters(path, await self._active_state(path))
+        return await future
+
+    async def _job(self, method, unit, wanted):
+        await self._connect()
+        SERVICE_JOBS.inc()
+        with metrics.span(f"systemd job: {method} {unit}", 'anon_service_job_seconds'):
+            path = await self._unit_path(unit)
+            job = (await self._call(SYSTEMD, SYSTEMD_PATH, MANAGER, method, 'ss', [unit, 'replace']))[0]
+            try:
+                result = self._finished.pop(job, None)
+                if result is None:
+                    future = self._jobs[job] = asyncio.get_running_loop().create_future()
+                    result = await asyncio.wait_for(future, self.timeout)
+                if result != 'done':
+                    raise ServiceError(f"{method} {unit}: job {result}")
+                return await asyncio.wait_for(self._wait_state(path, wanted), self.timeout)
+            except asyncio.TimeoutError:
+                raise ServiceError(f"{method} {unit}: no result after {self.timeout}s")
+            finally:
+                self._jobs.pop(job, None)
+
+    async def start(self, unit):
+        """Starts `unit` and returns once it is active."""
+        state = await self._job('StartUnit', unit, {'active'})
+        if state != 'active':
+            raise ServiceError(f"{unit} failed to start (state: {state})")
+        return state
+
+    async def stop(self, unit):
+        """Stops `unit` and returns once it is inactive."""
+        return await self._job('StopUnit', unit, {'inactive'})
+
+    async def close(self):
+        if self._bus is not None:
+            self._bus.disconnect()
+            self._bus = None
+
+
+class CLIBackend:
+    """Drives systemd through `sudo systemctl`, which blocks until the job is done."""
+
+    name = 'cli'
+
+    def __init__(self, sudo=('sudo',)):
+        self.sudo = list(sudo)
+
+    async def _systemctl(self, *args, sudo=True):
+        command = (self.sudo if sudo else []) + ['systemctl'] + list(args)
+        return await get_runtime().to_thread(run_command, command)
+
+    async def active_state(self, unit):
+        stdout, stderr, code = await self._systemctl('is-active', unit, sudo=False)
+        if stdout is None:
+            raise ServiceError(stderr)
+        return stdout
+
+    async def start(self, unit):
+        SERVICE_JOBS.inc()
+        _, stderr, code = await self._systemctl('start', unit)
+        if code != 0:
+            raise ServiceError(stderr)
+        return 'active'
+
+    async def stop(self, unit):
+        SERVICE_JOBS.inc()
+        _, stderr, code = await self._systemctl('stop', unit)
+        if code != 0:
+            raise ServiceError(stderr)
+        return 'inactive'
+
+    async def close(self):
+        pass
+
+
+class ServiceManager:
+    """
+    Starts and stops systemd units.
+
+    With `backend='auto'` units are driven over D-Bus and the manager falls
+    back to `sudo systemctl` for good when D-Bus cannot be used (dbus-next
+    missing, no system bus, or polkit refusing the call).
+    """
+
+    def __init__(self, backend=None, bus_address=None, console=None):
+        """
+        Args:
+            backend (str): 'auto', 'dbus' or 'cli' (defaults to systemd.backend).
+            bus_address (str): D-Bus address for the D-Bus backend (defaults to the system bus).
+        """
+        self.backend_name = backend or get_config()['systemd']['backend']
+        if self.backend_name not in ('auto', 'dbus', 'cli'):
+            raise ValueError(f"Unknown service backend '{self.backend_name}'. Choices are ['auto', 'dbus', 'cli'].")
+        self.console = console or get_console()
+        self.cli = CLIBackend()
+        self.dbus = None
+        if self.backend_name != 'cli':
+            try:
+                self.dbus = DBusBackend(bus_address)
+            except BusUnavailable:
+                if self.backend_name == 'dbus':
+                    raise
+                self.console.noise("dbus-next is not installed; managing services with systemctl.", event='systemd')
+
+    @property
+    def backend(self):
+        return self.dbus or self.cli
+
+    async def _dispatch(self, action, unit):
+        if self.dbus is not None:
+            try:
+                return await getattr(self.dbus, action)(unit)
+            except BusUnavailable as e:
+                if self.backend_name == 'dbus':
+                    raise
+                SERVICE_FALLBACKS.inc()
+                self.console.noise(f"{e}; falling back to systemctl.", event='systemd')
+                await self.dbus.close()
+                self.dbus = None
+        return await getattr(self.cli, action)(unit)
+
+    async def start(self, unit):
+        """Starts `unit`; returns once it is active. Raises ServiceError on failure."""
+        return await self._dispatch('start', unit)
+
+    async def stop(self, unit):
+        """Stops `unit`; returns once it is inactive. Raises ServiceError on failure."""
+        return await self._dispatch('stop', unit)
+
+    async def active_state(self, unit):
+        return await self._dispatch('active_state', unit)
+
+    async def close(self):
+        if self.dbus is not None:
+            await self.dbus.close()
+
+
+def get_service_manager():
+    """Returns the process-wide service manager, creating it from the config on first use."""
+    global _manager
+    if _manager is None:
+        _manager = ServiceManager()
+    return _manager
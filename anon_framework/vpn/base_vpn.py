@@ -1,15 +1,21 @@
 from abc import ABC, abstractmethod
+from anon_framework.utils.helpers import status_record
 
 class BaseVPN(ABC):
     """Abstract base class for a VPN implementation."""
 
+    # Short provider name used in structured status output.
+    name = None
+    # Name prefixes of the network interfaces this provider's tunnel uses.
+    tunnel_interfaces = ()
+
     @abstractmethod
-    def connect(self):
-        """Connect to the VPN service."""
+    async def connect(self, server=None):
+        """Connect to the VPN service, optionally through a specific server (where supported)."""
         pass
 
     @abstractmethod
-    def disconnect(self):
+    async def disconnect(self):
         """Disconnect from the VPN service."""
         pass
 
@@ -17,3 +23,7 @@ class BaseVPN(ABC):
     def get_status(self):
         """Get the current connection status."""
         pass
+
+    def get_status_info(self):
+        """Get the current status as a provider-independent record."""
+        return status_record(self.name, self.get_status())
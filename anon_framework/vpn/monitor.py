@@ -0,0 +1,196 @@
+import asyncio
+import os
+import time
+from array import array
+
+PROC_NET_DEV = '/proc/net/dev'
+# Initial pread size; grown when /proc/net/dev is larger (hosts with hundreds of veths).
+READ_SIZE = 65536
+
+# Column positions in /proc/net/dev after the "iface:" prefix.
+RX_BYTES, RX_PACKETS, TX_BYTES, TX_PACKETS = 0, 1, 8, 9
+
+DEFAULT_RATE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+
+class RingBuffer:
+    """Fixed-size ring of floats. Appends never allocate once the buffer exists."""
+    __slots__ = ('size', 'data', 'index', 'count')
+
+    def __init__(self, size):
+        self.size = size
+        self.data = array('d', bytes(8 * size))
+        self.index = 0
+        self.count = 0
+
+    def append(self, value):
+        self.data[self.index] = value
+        self.index = (self.index + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def values(self):
+        """Returns the stored values, oldest first."""
+        if self.count < self.size:
+            return self.data[:self.count]
+        return self.data[self.index:] + self.data[:self.index]
+
+    def latest(self):
+        return self.data[self.index - 1] if self.count else 0.0
+
+    def mean(self):
+        return sum(self.values()) / self.count if self.count else 0.0
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0.0
+        ordered = sorted(self.values())
+        return ordered[min(int(len(ordered) * pct / 100.0), len(ordered) - 1)]
+
+    def histogram(self, buckets=DEFAULT_RATE_BUCKETS):
+        """Returns per-bucket counts (the last slot counts values above every bound)."""
+        counts = [0] * (len(buckets) + 1)
+        for value in self.values():
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+        return counts
+
+
+class InterfaceStats:
+    """Rolling receive/transmit rates for one network interface."""
+    __slots__ = ('name', 'rx_bytes', 'tx_bytes', 'rx_rate', 'tx_rate')
+
+    def __init__(self, name, window):
+        self.name = name
+        self.rx_bytes = None
+        self.tx_bytes = None
+        self.rx_rate = RingBuffer(window)
+        self.tx_rate = RingBuffer(window)
+
+    def as_dict(self):
+        return {
+            'interface': self.name,
+            'rx_bytes': self.rx_bytes,
+            'tx_bytes': self.tx_bytes,
+            'rx_rate': self.rx_rate.latest(),
+            'tx_rate': self.tx_rate.latest(),
+            'rx_rate_p95': self.rx_rate.percentile(95),
+            'tx_rate_p95': self.tx_rate.percentile(95),
+        }
+
+
+class BandwidthMonitor:
+    """
+    Samples interface counters from /proc/net/dev.
+
+    The file is opened once and re-read with `os.pread` at offset 0 on every
+    sample, so sampling costs one syscall and a parse with no process spawns
+    or re-opens. Rates are kept in fixed-size ring buffers per interface.
+    """
+
+    def __init__(self, interfaces=None, window=600, path=PROC_NET_DEV):
+        """
+        Args:
+            interfaces (iterable): Interface names or name prefixes to track.
+                Defaults to every non-loopback interface.
+            window (int): Samples kept per interface.
+            path (str): Location of the net/dev file (overridable for fixtures).
+        """
+        self.prefixes = tuple(interfaces) if interfaces else None
+        self.window = window
+        self.path = path
+        self.stats = {}
+        self._fd = os.open(path, os.O_RDONLY)
+        self._read_size = READ_SIZE
+        self._last_time = None
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _wanted(self, name):
+        if self.prefixes is None:
+            return name != 'lo'
+        return name.startswith(self.prefixes)
+
+    def read_counters(self):
+        """
+        Returns {interface: (rx_bytes, tx_bytes)}, normally from a single pread.
+
+        A read that fills the buffer may have been cut short, so the buffer is
+        doubled (and kept at that size) and the whole file re-read from offset 0.
+        """
+        data = os.pread(self._fd, self._read_size, 0)
+        while len(data) == self._read_size:
+            self._read_size *= 2
+            data = os.pread(self._fd, self._read_size, 0)
+        counters = {}
+        # The first two lines are headers.
+        for line in data.split(b'\n')[2:]:
+            name, sep, fields = line.partition(b':')
+            if not sep:
+                continue
+            name = name.strip().decode('ascii', 'replace')
+            if not self._wanted(name):
+                continue
+            values = fields.split()
+            counters[name] = (int(values[RX_BYTES]), int(values[TX_BYTES]))
+        return counters
+
+    def sample(self):
+        """
+        Takes one sample and updates the per-interface rate buffers.
+
+        Returns:
+            dict: {interface: InterfaceStats} for every tracked interface.
+        """
+        now = time.monotonic()
+        counters = self.read_counters()
+        elapsed = now - self._last_time if self._last_time is not None else None
+        self._last_time = now
+
+        for name, (rx_bytes, tx_bytes) in counters.items():
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = InterfaceStats(name, self.window)
+            elif elapsed:
+                # Counter resets (interface re-created) show up as negative deltas; skip them.
+                if rx_bytes >= stats.rx_bytes and tx_bytes >= stats.tx_bytes:
+                    stats.rx_rate.append((rx_bytes - stats.rx_bytes) / elapsed)
+                    stats.tx_rate.append((tx_bytes - stats.tx_bytes) / elapsed)
+            stats.rx_bytes = rx_bytes
+            stats.tx_bytes = tx_bytes
+
+        for name in [name for name in self.stats if name not in counters]:
+            del self.stats[name]
+        return self.stats
+
+    async def watch(self, interval=1.0):
+        """Async generator yielding `self.stats` after every sample."""
+        self.sample()
+        next_tick = time.monotonic()
+        while True:
+            next_tick += interval
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            yield self.sample()
+
+
+def format_rate(rate):
+    """Formats a byte rate for humans (e.g. '1.2 MB/s')."""
+    for unit in ('B/s', 'KB/s', 'MB/s'):
+        if rate < 1000:
+            return f"{rate:.1f} {unit}"
+        rate /= 1000.0
+    return f"{rate:.1f} GB/s"
@@ -1,23 +1,38 @@
 import subprocess
 from .base_vpn import BaseVPN
+from anon_framework.utils import metrics
+from anon_framework.utils.runtime import get_runtime
 
 class MullvadVPN(BaseVPN):
     """A wrapper for the Mullvad VPN command-line tool."""
 
-    def connect(self):
-        """Connects to Mullvad VPN."""
+    name = 'mullvad'
+    tunnel_interfaces = ('wg-mullvad', 'wg0-mullvad', 'tun')
+
+    async def connect(self, server=None):
+        """
+        Connects to Mullvad VPN.
+
+        Args:
+            server (str): Relay hostname such as 'se-got-wg-001'; the current
+                relay constraint is kept if omitted.
+        """
         try:
-            subprocess.run(["mullvad", "connect"], check=True)
+            with metrics.span("mullvad connect", 'anon_subprocess_seconds'):
+                if server:
+                    await get_runtime().to_thread(subprocess.run, ["mullvad", "relay", "set", "location", server], check=True)
+                await get_runtime().to_thread(subprocess.run, ["mullvad", "connect"], check=True)
             print("Mullvad VPN connected successfully.")
             return True
         except (subprocess.CalledProcessError, FileNotFoundError) as e:
             print(f"Error connecting to Mullvad VPN: {e}")
             return False
 
-    def disconnect(self):
+    async def disconnect(self):
         """Disconnects from Mullvad VPN."""
         try:
-            subprocess.run(["mullvad", "disconnect"], check=True)
+            with metrics.span("mullvad disconnect", 'anon_subprocess_seconds'):
+                await get_runtime().to_thread(subprocess.run, ["mullvad", "disconnect"], check=True)
             print("Mullvad VPN disconnected successfully.")
             return True
         except (subprocess.CalledProcessError, FileNotFoundError) as e:
@@ -27,12 +42,13 @@ class MullvadVPN(BaseVPN):
     def get_status(self):
         """Gets the connection status of Mullvad VPN."""
         try:
-            result = subprocess.run(
-                ["mullvad", "status"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
+            with metrics.span("mullvad status", 'anon_subprocess_seconds'):
+                result = subprocess.run(
+                    ["mullvad", "status"],
+                    capture_output=True,
+                    text=True,
+                    check=True
+                )
             return result.stdout.strip()
         except (subprocess.CalledProcessError, FileNotFoundError) as e:
             print(f"Error getting Mullvad VPN status: {e}")
@@ -1,23 +1,35 @@
 import subprocess
 from .base_vpn import BaseVPN
+from anon_framework.utils import metrics
+from anon_framework.utils.runtime import get_runtime
 
 class NordVPN(BaseVPN):
     """A wrapper for the NordVPN command-line tool."""
 
-    def connect(self):
-        """Connects to NordVPN."""
+    name = 'nord'
+    tunnel_interfaces = ('nordlynx', 'nordtun', 'tun')
+
+    async def connect(self, server=None):
+        """
+        Connects to NordVPN.
+
+        Args:
+            server (str): Server name such as 'us1234'; NordVPN picks one if omitted.
+        """
         try:
-            subprocess.run(["nordvpn", "connect"], check=True)
+            with metrics.span("nordvpn connect", 'anon_subprocess_seconds'):
+                await get_runtime().to_thread(subprocess.run, ["nordvpn", "connect"] + ([server] if server else []), check=True)
             print("NordVPN connected successfully.")
             return True
         except (subprocess.CalledProcessError, FileNotFoundError) as e:
             print(f"Error connecting to NordVPN: {e}")
             return False
 
-    def disconnect(self):
+    async def disconnect(self):
         """Disconnects from NordVPN."""
         try:
-            subprocess.run(["nordvpn", "disconnect"], check=True)
+            with metrics.span("nordvpn disconnect", 'anon_subprocess_seconds'):
+                await get_runtime().to_thread(subprocess.run, ["nordvpn", "disconnect"], check=True)
             print("NordVPN disconnected successfully.")
             return True
         except (subprocess.CalledProcessError, FileNotFoundError) as e:
@@ -27,12 +39,13 @@ class NordVPN(BaseVPN):
     def get_status(self):
         """Gets the connection status of NordVPN."""
         try:
-            result = subprocess.run(
-                ["nordvpn", "status"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
+            with metrics.span("nordvpn status", 'anon_subprocess_seconds'):
+                result = subprocess.run(
+                    ["nordvpn", "status"],
+                    capture_output=True,
+                    text=True,
+                    check=True
+                )
             return result.stdout.strip()
         except (subprocess.CalledProcessError, FileNotFoundError) as e:
             print(f"Error getting NordVPN status: {e}")
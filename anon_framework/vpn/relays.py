@@ -0,0 +1,253 @@
+import asyncio
+import json
+import os
+import random
+import time
+from collections import deque
+import requests
+from anon_framework.config.settings import CACHE_PATH, get_config
+from anon_framework.utils import metrics
+from anon_framework.utils.runtime import get_runtime
+
+NORD_RELAYS_URL = 'https://api.nordvpn.com/v1/servers?limit=10000'
+MULLVAD_RELAYS_URL = 'https://api.mullvad.net/www/relays/all/'
+SNAPSHOT_DIR = os.path.dirname(CACHE_PATH)
+
+RELAY_FETCHES = metrics.counter('anon_relay_list_fetches', 'Relay lists downloaded because the local snapshot was stale.')
+RELAY_PROBES = metrics.counter('anon_relay_probes', 'TCP handshake probes sent to VPN relays.')
+
+
+class Relay:
+    """One VPN server: where it is, how busy the provider says it is, and how fast it answered us."""
+    __slots__ = ('name', 'hostname', 'address', 'country', 'city', 'load', 'latency')
+
+    def __init__(self, name, hostname, address, country=None, city=None, load=None):
+        self.name = name
+        self.hostname = hostname
+        self.address = address
+        self.country = country
+        self.city = city
+        self.load = load
+        self.latency = None
+
+    def score(self, load_weight=1):
+        """Lower is better: handshake latency inflated by the reported load. Unreachable relays score None."""
+        if self.latency is None:
+            return None
+        return self.latency * (1 + load_weight * (self.load or 0) / 100.0)
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'hostname': self.hostname,
+            'address': self.address,
+            'country': self.country,
+            'city': self.city,
+            'load': self.load,
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+        }
+
+    def __repr__(self):
+        return f"Relay({self.name!r}, {self.address!r}, load={self.load!r}, latency={self.latency!r})"
+
+
+def parse_nord(data):
+    """Parses the NordVPN /v1/servers response into relays (named as `nordvpn connect` expects)."""
+    relays = []
+    for server in data:
+        if server.get('status', 'online') != 'online' or not server.get('station'):
+            continue
+        location = (server.get('locations') or [{}])[0].get('country', {})
+        relays.append(Relay(
+            name=server['hostname'].split('.')[0],
+            hostname=server['hostname'],
+            address=server['station'],
+            country=(location.get('code') or '').lower() or None,
+            city=location.get('city', {}).get('name'),
+            load=server.get('load'),
+        ))
+    return relays
+
+
+def parse_mullvad(data):
+    """Parses the Mullvad relay list into relays. Mullvad publishes no load figures."""
+    return [
+        Relay(
+            name=relay['hostname'],
+            hostname=relay['hostname'],
+            address=relay['ipv4_addr_in'],
+            country=relay.get('country_code'),
+            city=relay.get('city_name'),
+        )
+        for relay in data
+        if relay.get('active', True) and relay.get('ipv4_addr_in')
+    ]
+
+
+RELAY_SOURCES = {
+    'nord': (NORD_RELAYS_URL, parse_nord),
+    'mullvad': (MULLVAD_RELAYS_URL, parse_mullvad),
+}
+
+
+class RelayCatalog:
+    """
+    A provider's relay list, served from a local JSON snapshot.
+
+    The snapshot is re-downloaded only when it is older than `ttl` seconds;
+    if the download fails a stale snapshot is used rather than nothing.
+    """
+
+    def __init__(self, provider, ttl=None, snapshot_dir=SNAPSHOT_DIR, fetch=None):
+        """
+        Args:
+            provider (str): 'nord' or 'mullvad'.
+            ttl (int): Snapshot lifetime in seconds (defaults to relays.ttl).
+            snapshot_dir (str): Where snapshots are stored.
+            fetch (callable): Returns the raw relay list; defaults to an HTTPS download.
+        """
+        if provider not in RELAY_SOURCES:
+            raise ValueError(f"No relay list for provider '{provider}'. Choices are {list(RELAY_SOURCES)}.")
+        self.provider = provider
+        self.url, self.parse = RELAY_SOURCES[provider]
+        self.ttl = get_config()['relays']['ttl'] if ttl is None else ttl
+        self.snapshot_path = os.path.join(snapshot_dir, f"relays-{provider}.json")
+        self.fetch = fetch or self._download
+
+    def _download(self):
+        response = requests.get(self.url, timeout=15)
+        response.raise_for_status()
+        return response.json()
+
+    def _snapshot_age(self):
+        try:
+            return time.time() - os.stat(self.snapshot_path).st_mtime
+        except OSError:
+            return None
+
+    def _read_snapshot(self):
+        with open(self.snapshot_path) as f:
+            return json.load(f)
+
+    def _write_snapshot(self, data):
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError:
+            pass
+
+    def load(self, refresh=False):
+        """Returns the relay list, downloading a new snapshot if the current one is stale or missing."""
+        age = self._snapshot_age()
+        if refresh or age is None or age > self.ttl:
+            try:
+                with metrics.span(f"relay list fetch: {self.provider}", 'anon_relay_fetch_seconds'):
+                    data = self.fetch()
+                RELAY_FETCHES.inc()
+                self._write_snapshot(data)
+                return self.parse(data)
+            except (requests.RequestException, ValueError) as e:
+                if age is None:
+                    raise ConnectionError(f"Could not download the {self.provider} relay list: {e}")
+        return self.parse(self._read_snapshot())
+
+
+async def probe(relay, port, timeout, semaphore):
+    """Times a TCP handshake to the relay and stores it in `relay.latency` (None on failure)."""
+    async with semaphore:
+        RELAY_PROBES.inc()
+        start = time.perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(relay.address, port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            relay.latency = None
+            return relay
+        relay.latency = time.perf_counter() - start
+        writer.close()
+    return relay
+
+
+async def probe_all(relays, port=None, timeout=None, concurrency=None):
+    """Probes every relay concurrently, with at most `concurrency` handshakes in flight."""
+    config = get_config()['relays']
+    port = port or config['probe_port']
+    timeout = (timeout or config['probe_timeout_ms']) / 1000.0
+    semaphore = asyncio.Semaphore(concurrency or config['concurrency'])
+    with metrics.span("relay probing", 'anon_relay_probe_seconds'):
+        await asyncio.gather(*(probe(relay, port, timeout, semaphore) for relay in relays))
+    return relays
+
+
+def rank(relays, load_weight=None):
+    """Returns the reachable relays, best first."""
+    load_weight = get_config()['relays']['load_weight'] if load_weight is None else load_weight
+    reachable = [relay for relay in relays if relay.latency is not None]
+    return sorted(reachable, key=lambda relay: relay.score(load_weight))
+
+
+def spread(relays, count, rng=random):
+    """
+    Picks `count` relays spread evenly over countries, and over cities within
+    each country, in random order. Used when there is no load to sort by.
+    """
+    countries = {}
+    for relay in relays:
+        countries.setdefault(relay.country, {}).setdefault(relay.city, []).append(relay)
+    rotations = []
+    for cities in countries.values():
+        groups = list(cities.values())
+        for group in groups:
+            rng.shuffle(group)
+        rng.shuffle(groups)
+        rotations.append(deque(deque(group) for group in groups))
+    rng.shuffle(rotations)
+    picked = []
+    while rotations and len(picked) < count:
+        for rotation in list(rotations):
+            # Next relay from this country's next city, then move that city to the back.
+            group = rotation.popleft()
+            picked.append(group.popleft())
+            if group:
+                rotation.append(group)
+            if not rotation:
+                rotations.remove(rotation)
+            if len(picked) == count:
+                break
+    return picked
+
+
+def candidates(relays, country=None, limit=None, rng=random):
+    """
+    Narrows a full relay list down to the ones worth probing.
+
+    Relays outside `country` are dropped. Relays with a reported load are
+    taken least loaded first; relays without one (Mullvad publishes none)
+    are sampled across countries and cities rather than taken from the head
+    of the list, so probing stays bounded without favouring one region.
+    """
+    limit = limit or get_config()['relays']['candidates']
+    if country:
+        country = country.lower()
+        relays = [relay for relay in relays if (relay.country or '').lower() == country]
+    picked = sorted((relay for relay in relays if relay.load is not None), key=lambda relay: relay.load)[:limit]
+    if len(picked) < limit:
+        picked += spread([relay for relay in relays if relay.load is None], limit - len(picked), rng)
+    return picked
+
+
+async def rank_relays(provider, country=None, catalog=None):
+    """Loads, filters, probes and ranks the relays of `provider`."""
+    catalog = catalog or RelayCatalog(provider)
+    relays = await get_runtime().to_thread(catalog.load)
+    relays = candidates(relays, country)
+    await probe_all(relays)
+    return rank(relays)
+
+
+async def select_fastest(provider, country=None, catalog=None):
+    """Returns the best relay for `provider`, or None if none answered."""
+    ranked = await rank_relays(provider, country, catalog)
+    return ranked[0] if ranked else None
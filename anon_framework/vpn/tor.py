@@ -1,6 +1,10 @@
 import platform
 from .base_vpn import BaseVPN
 from anon_framework.utils.helpers import run_command, get_os
+from anon_framework.utils import metrics
+from anon_framework.utils.runtime import get_runtime
+from anon_framework.utils.systemd import ServiceError, get_service_manager
+from anon_framework.config.settings import get_config
 import psutil
 
 class TorVPN(BaseVPN):
@@ -10,72 +14,68 @@ class TorVPN(BaseVPN):
     Note: This assumes Tor is installed as a system service.
     """
 
+    name = 'tor'
+
     def _get_service_name(self):
         """Gets the service name for Tor based on the OS."""
         os_type = get_os()
-        if os_type == 'linux':
-            # Common on Debian/Ubuntu
-            return 'tor'
-        elif os_type == 'darwin':
-            # Common when installed with Homebrew
-            return 'tor'
-        elif os_type == 'windows':
-            # Default service name for the Tor expert bundle
-            return 'tor'
+        if os_type in ('linux', 'darwin', 'windows'):
+            # The default 'tor' matches Debian/Ubuntu, Homebrew and the Tor expert bundle.
+            return get_config()['tor']['service']
         else:
             raise NotImplementedError(f"Tor service management not supported on {os_type}")
 
     def _is_process_running(self):
         """Check if the tor process is running."""
-        for proc in psutil.process_iter(['name']):
-            if 'tor' in proc.info['name']:
-                return True
-        return False
+        with metrics.span("process scan: tor", 'anon_process_scan_seconds'):
+            for proc in psutil.process_iter(['name']):
+                if 'tor' in proc.info['name']:
+                    return True
+            return False
 
-    def connect(self):
-        """Starts the Tor system service."""
+    async def _service_command(self, action):
+        """Starts or stops the Tor service. On Linux this goes through the systemd service manager."""
         os_type = get_os()
         service = self._get_service_name()
-        
-        print(f"Attempting to start Tor service on {os_type}...")
         if os_type == 'linux':
-            stdout, stderr, code = run_command(['sudo', 'systemctl', 'start', service])
-        elif os_type == 'darwin':
-            stdout, stderr, code = run_command(['brew', 'services', 'start', service])
+            manager = get_service_manager()
+            try:
+                await (manager.start(service) if action == 'start' else manager.stop(service))
+            except ServiceError as e:
+                return str(e), 1
+            return None, 0
+        if os_type == 'darwin':
+            command = ['brew', 'services', action, service]
         elif os_type == 'windows':
-            stdout, stderr, code = run_command(['net', 'start', service])
+            command = ['net', action, service]
         else:
-            print(f"Unsupported OS: {os_type}")
-            return False
+            return f"Unsupported OS: {os_type}", 1
+        _, stderr, code = await get_runtime().to_thread(run_command, command)
+        return stderr, code
 
+    async def connect(self, server=None):
+        """
+        Starts the Tor system service and returns once it is running.
+        Tor picks its own relays, so `server` is ignored.
+        """
+        print(f"Attempting to start Tor service on {get_os()}...")
+        error, code = await self._service_command('start')
         if code == 0:
             print("Tor service started successfully.")
             return True
         else:
-            print(f"Error starting Tor service:\n{stderr}")
+            print(f"Error starting Tor service:\n{error}")
             return False
 
-    def disconnect(self):
+    async def disconnect(self):
         """Stops the Tor system service."""
-        os_type = get_os()
-        service = self._get_service_name()
-
-        print(f"Attempting to stop Tor service on {os_type}...")
-        if os_type == 'linux':
-            stdout, stderr, code = run_command(['sudo', 'systemctl', 'stop', service])
-        elif os_type == 'darwin':
-            stdout, stderr, code = run_command(['brew', 'services', 'stop', service])
-        elif os_type == 'windows':
-            stdout, stderr, code = run_command(['net', 'stop', service])
-        else:
-            print(f"Unsupported OS: {os_type}")
-            return False
-
+        print(f"Attempting to stop Tor service on {get_os()}...")
+        error, code = await self._service_command('stop')
         if code == 0:
             print("Tor service stopped successfully.")
             return True
         else:
-            print(f"Error stopping Tor service:\n{stderr}")
+            print(f"Error stopping Tor service:\n{error}")
             return False
 
     def get_status(self):
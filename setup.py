@@ -12,6 +12,10 @@ setup(
     install_requires=[
         'pysocks',
     ],
+    extras_require={
+        # Event-driven systemd control for Tor/I2P; falls back to `sudo systemctl` without it.
+        'dbus': ['dbus-next'],
+    },
     python_requires='>=3.6',
     author='Anon-Framework Contributors',
     description='A cross-platform framework for enhancing user anonymity and privacy.',
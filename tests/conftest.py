@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+from anon_framework.config import settings
+from anon_framework.utils import metrics
+
+
+def pytest_addoption(parser):
+    parser.addoption('--benchmarks', action='store_true', help="also run the performance benchmarks")
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', "benchmark: performance measurement that prints its figures (run with --benchmarks)")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmarks'):
+        return
+    skip = pytest.mark.skip(reason="benchmark; run with --benchmarks")
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(autouse=True)
+def config(tmp_path, monkeypatch):
+    """Loads the schema defaults only: no system/user files, no snapshot cache, no ANON_ variables."""
+    monkeypatch.setattr(settings, 'SYSTEM_CONFIG_PATH', str(tmp_path / 'system-config.json'))
+    monkeypatch.setattr(settings, 'USER_CONFIG_PATH', str(tmp_path / 'user-config.json'))
+    return settings.load(use_cache=False, environ={})
+
+
+@pytest.fixture
+def recording():
+    """Enables metrics for one test and leaves them disabled and empty afterwards."""
+    metrics.reset()
+    metrics.enable()
+    yield metrics
+    metrics.disable()
+    metrics.reset()
+
+
+def run(coro):
+    """Runs `coro` on a fresh event loop (the suite does not depend on pytest-asyncio)."""
+    return asyncio.run(coro)
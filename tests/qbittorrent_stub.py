@@ -0,0 +1,149 @@
+"""A local stand-in for the qBittorrent Web API, served over real HTTP."""
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+STATES = ('downloading', 'uploading', 'stalledUP', 'pausedDL', 'queuedDL')
+
+
+def make_torrent(i, rng):
+    return {
+        'name': f"Example.Release.{i:05d}.1080p", 'state': rng.choice(STATES),
+        'progress': rng.random(), 'size': rng.randrange(1 << 20, 1 << 34),
+        'dlspeed': rng.randrange(1 << 20), 'upspeed': rng.randrange(1 << 18),
+        'num_seeds': rng.randrange(200), 'num_leechs': rng.randrange(50),
+        'ratio': rng.random() * 3, 'eta': rng.randrange(8640000), 'category': 'linux',
+        'added_on': 1700000000 + i, 'save_path': '/srv/torrents', 'tracker': 'udp://tracker.example:1337',
+        'magnet_uri': f"magnet:?xt=urn:btih:{i:040x}", 'tags': '', 'amount_left': rng.randrange(1 << 30),
+    }
+
+
+def make_result(i):
+    """Search result number `i`; generated on demand so the stub holds no result list."""
+    return {
+        'fileName': f"Example Release {i % 50000} 1080p", 'fileSize': (i * 7919) % (1 << 33),
+        'nbSeeders': (i * 31) % 500, 'nbLeechers': (i * 17) % 100,
+        'fileUrl': f"magnet:?xt=urn:btih:{i % 60000:040x}", 'siteUrl': f"https://site{i % 4}.example",
+        'descrLink': f"https://site{i % 4}.example/{i}",
+    }
+
+
+class QBittorrentStub:
+    """
+    Serves torrents/info, sync/maindata, the search API and the bulk torrent actions.
+
+    `tick()` changes a fraction of the torrents the way a busy client would
+    (speeds, progress), and sync/maindata answers with just those changes.
+    """
+
+    def __init__(self, torrents=10000, search_results=0, search_polls=0, seed=1):
+        self.rng = random.Random(seed)
+        self.torrents = {f"{i:040x}": make_torrent(i, self.rng) for i in range(torrents)}
+        self.search_results = search_results
+        self.search_polls = search_polls
+        self.version = 1  # qBittorrent never hands out rid 0; it means "send everything"
+        self.changes = []  # (version, hash, partial dict); None marks a removal
+        self.bytes_sent = 0
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def tick(self, fraction=0.01):
+        with self.lock:
+            self.version += 1
+            for torrent_hash in self.rng.sample(sorted(self.torrents), int(len(self.torrents) * fraction)):
+                diff = {'dlspeed': self.rng.randrange(1 << 20), 'progress': self.rng.random()}
+                self.torrents[torrent_hash].update(diff)
+                self.changes.append((self.version, torrent_hash, diff))
+
+    def remove(self, torrent_hash):
+        with self.lock:
+            self.version += 1
+            del self.torrents[torrent_hash]
+            self.changes.append((self.version, torrent_hash, None))
+
+    def maindata(self, rid):
+        with self.lock:
+            if rid == 0:
+                return {'rid': self.version, 'full_update': True, 'torrents': self.torrents,
+                        'server_state': {'dl_info_speed': 0}}
+            torrents, removed = {}, []
+            for version, torrent_hash, diff in self.changes:
+                if version <= rid:
+                    continue
+                if diff is None:
+                    torrents.pop(torrent_hash, None)
+                    removed.append(torrent_hash)
+                else:
+                    torrents.setdefault(torrent_hash, {}).update(diff)
+            delta = {'rid': self.version, 'torrents': torrents}
+            if removed:
+                delta['torrents_removed'] = removed
+            return delta
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, body, content_type='application/json'):
+                data = body.encode() if isinstance(body, str) else json.dumps(body, separators=(',', ':')).encode()
+                with stub.lock:
+                    stub.bytes_sent += len(data)
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                stub.requests.append(('GET', url.path, query))
+                if url.path == '/api/v2/torrents/info':
+                    with stub.lock:
+                        body = [dict(torrent, hash=h) for h, torrent in stub.torrents.items()]
+                    self._reply(body)
+                elif url.path == '/api/v2/sync/maindata':
+                    self._reply(stub.maindata(int(query.get('rid', 0))))
+                elif url.path == '/api/v2/search/status':
+                    polls = sum(1 for request in stub.requests if request[1] == url.path)
+                    self._reply([{'id': 1, 'status': 'Running' if polls <= stub.search_polls else 'Stopped',
+                                  'total': stub.search_results}])
+                elif url.path == '/api/v2/search/results':
+                    offset, limit = int(query.get('offset', 0)), int(query.get('limit', 0))
+                    end = stub.search_results if not limit else min(stub.search_results, offset + limit)
+                    self._reply({'results': [make_result(i) for i in range(offset, end)],
+                                 'status': 'Stopped', 'total': stub.search_results})
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+                stub.requests.append(('POST', self.path, form))
+                if self.path == '/api/v2/search/start':
+                    self._reply({'id': 1})
+                elif self.path == '/api/v2/auth/login':
+                    self._reply('Ok.', 'text/plain')
+                else:
+                    self._reply('', 'text/plain')
+
+        return Handler
@@ -0,0 +1,101 @@
+"""
+A stand-in for systemd on a private D-Bus: Manager.LoadUnit/StartUnit/StopUnit/Subscribe,
+the JobRemoved signal and Unit.ActiveState with PropertiesChanged.
+
+Run as `python -m tests.systemd_stub <bus address> <delay>`. Units whose name starts
+with 'broken' fail. Each job reports JobRemoved after `delay` seconds and the unit
+settles `delay` seconds later, like a Type=simple service.
+"""
+import asyncio
+import sys
+from dbus_next.aio import MessageBus
+from dbus_next.service import PropertyAccess, ServiceInterface, dbus_property, method, signal
+
+
+class Unit(ServiceInterface):
+    def __init__(self):
+        super().__init__('org.freedesktop.systemd1.Unit')
+        self.state = 'inactive'
+
+    @dbus_property(access=PropertyAccess.READ)
+    def ActiveState(self) -> 's':
+        return self.state
+
+    def set_state(self, state):
+        self.state = state
+        self.emit_properties_changed({'ActiveState': state})
+
+
+class Manager(ServiceInterface):
+    def __init__(self, bus, delay):
+        super().__init__('org.freedesktop.systemd1.Manager')
+        self.bus = bus
+        self.delay = delay
+        self.units = {}
+        self.jobs = 0
+        self.running = 0
+        self.peak = 0
+
+    def unit(self, name):
+        if name not in self.units:
+            unit = Unit()
+            path = '/org/freedesktop/systemd1/unit/' + name.replace('.', '_2e').replace('-', '_2d')
+            self.bus.export(path, unit)
+            self.units[name] = (path, unit)
+        return self.units[name]
+
+    @dbus_property(access=PropertyAccess.READ)
+    def PeakJobs(self) -> 'u':
+        """Most jobs that were running at the same time (not a systemd property; for the tests)."""
+        return self.peak
+
+    @method()
+    def Subscribe(self):
+        pass
+
+    @method()
+    def LoadUnit(self, name: 's') -> 'o':
+        return self.unit(name)[0]
+
+    @method()
+    def StartUnit(self, name: 's', mode: 's') -> 'o':
+        return self.job(name, 'active')
+
+    @method()
+    def StopUnit(self, name: 's', mode: 's') -> 'o':
+        return self.job(name, 'inactive')
+
+    def job(self, name, target):
+        self.jobs += 1
+        job_id, job = self.jobs, f'/org/freedesktop/systemd1/job/{self.jobs}'
+        _, unit = self.unit(name)
+        failed = name.startswith('broken')
+
+        async def run():
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            unit.set_state('activating' if target == 'active' else 'deactivating')
+            await asyncio.sleep(self.delay)
+            self.running -= 1
+            self.JobRemoved(job_id, job, name, 'failed' if failed else 'done')
+            await asyncio.sleep(self.delay)
+            unit.set_state('failed' if failed else target)
+
+        asyncio.get_running_loop().create_task(run())
+        return job
+
+    @signal()
+    def JobRemoved(self, id: 'u', job: 'o', unit: 's', result: 's') -> 'uoss':
+        return [id, job, unit, result]
+
+
+async def main(address, delay):
+    bus = await MessageBus(bus_address=address).connect()
+    bus.export('/org/freedesktop/systemd1', Manager(bus, delay))
+    await bus.request_name('org.freedesktop.systemd1')
+    print('ready', flush=True)
+    await bus.wait_for_disconnect()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(sys.argv[1], float(sys.argv[2])))
@@ -0,0 +1,153 @@
+import asyncio
+import io
+import json
+import threading
+import time
+import pytest
+from anon_framework.utils.console import HIGH, LOW, NORMAL, Console
+from tests.conftest import run
+
+
+class SlowStream(io.StringIO):
+    """A terminal that takes `delay` seconds per write, like a congested tty or SSH session."""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+        self.writes = 0
+
+    def write(self, text):
+        time.sleep(self.delay)
+        self.writes += 1
+        return super().write(text)
+
+
+def test_flood_is_written_in_batches_off_the_event_loop():
+    stream = SlowStream(delay=0.05)
+    writers = set()
+    write = stream.write
+
+    def recording_write(text):
+        writers.add(threading.get_ident())
+        return write(text)
+
+    stream.write = recording_write
+    console = Console(stream=stream, capacity=500)
+
+    async def flood():
+        for i in range(20000):
+            console.noise(f":server 322 me #chan{i} 5 :topic")
+            if i % 200 == 0:
+                await asyncio.sleep(0)
+        await asyncio.sleep(0.1)
+        return threading.get_ident()
+
+    loop_thread = run(flood())
+    console.close()
+    # Terminal writes block; they happen on the console's writer thread, never the loop's.
+    assert writers and loop_thread not in writers
+    # 20k lines arrive as a handful of batched writes, not 20k writes.
+    assert stream.writes < 50
+
+
+@pytest.mark.benchmark
+def test_flood_does_not_stall_the_event_loop():
+    stream = SlowStream(delay=0.05)
+    console = Console(stream=stream, capacity=500)
+
+    async def flood():
+        gaps = []
+
+        async def ticker():
+            last = time.perf_counter()
+            while True:
+                await asyncio.sleep(0.001)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        tick = asyncio.ensure_future(ticker())
+        for i in range(20000):
+            console.noise(f":server 322 me #chan{i} 5 :topic")
+            if i % 200 == 0:
+                await asyncio.sleep(0)
+        await asyncio.sleep(0.1)
+        tick.cancel()
+        return max(gaps)
+
+    worst = run(flood())
+    console.close()
+    print(f"\nworst event loop gap during a 20k line flood: {worst * 1000:.1f} ms (terminal writes take 50 ms)")
+    assert worst < stream.delay
+
+
+def test_backpressure_drops_low_priority_lines_and_summarizes():
+    stream = io.StringIO()
+    console = Console(stream=stream, capacity=10, batch_interval=0)
+    gate = threading.Event()
+    # Hold the writer so the queue fills up.
+    console.sink = lambda entries: gate.wait()
+    console.info("warm-up")
+    time.sleep(0.05)
+    formatted = []
+    results = [console.emit(lambda i=i: formatted.append(i) or f"noise {i}", LOW) for i in range(100)]
+    assert console.emit("important", HIGH)
+    console.sink = None
+    gate.set()
+    console.close()
+    assert results.count(True) == 10 and results.count(False) == 90
+    # Dropped lines are never formatted.
+    assert len(formatted) == 10
+    output = stream.getvalue()
+    assert "important" in output
+    assert "90 low-priority lines suppressed" in output
+
+
+def test_normal_lines_survive_longer_than_low_ones():
+    console = Console(stream=io.StringIO(), capacity=5, batch_interval=0)
+    gate = threading.Event()
+    console.sink = lambda entries: gate.wait()
+    console.info("warm-up")
+    time.sleep(0.05)
+    low = [console.emit("low", LOW) for _ in range(10)]
+    normal = [console.emit("normal", NORMAL) for _ in range(30)]
+    gate.set()
+    console.close()
+    assert low.count(True) == 5
+    assert normal.count(True) == 15
+
+
+def test_json_mode_emits_one_object_per_line():
+    stream = io.StringIO()
+    console = Console(stream=stream, json_mode=True, batch_interval=0)
+    console.info("<nick> hello", event='message', target='#chan')
+    console.error("Disconnected from server.", event='disconnect')
+    console.close()
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert records[0]['message'] == "<nick> hello"
+    assert records[0]['event'] == 'message' and records[0]['target'] == '#chan'
+    assert records[0]['priority'] == 'normal'
+    assert records[1]['priority'] == 'high' and records[1]['level'] == 'error'
+
+
+def test_sink_receives_rendered_batches():
+    console = Console(stream=io.StringIO())
+    received = []
+    console.set_sink(received.extend)
+    console.info("one", event='message')
+    console.noise("two")
+    console.flush()
+    console.close()
+    assert [(text, priority) for text, priority, _ in received] == [("one", NORMAL), ("two", LOW)]
+
+
+def test_irc_messages_go_through_the_console(capsys):
+    from anon_framework.services.communication.irc import IRCClient
+    client = IRCClient('me', '#chan')
+    stream = io.StringIO()
+    client.console = Console(stream=stream)
+    run(client.on_message('#chan', 'bob', 'hello there'))
+    # Nothing is written synchronously on the event loop.
+    assert capsys.readouterr().out == ''
+    client.console.close()
+    assert stream.getvalue() == "<bob> hello there\n"
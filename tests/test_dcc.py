@@ -0,0 +1,173 @@
+import asyncio
+import os
+import time
+import pytest
+from anon_framework.services.communication.dcc import (
+    DCCManager, decode_address, encode_address, parse_dcc, quote_filename,
+)
+from tests.conftest import run
+
+BENCHMARK_SIZE = 512 * 1024 * 1024
+
+
+class RecordingConsole:
+    def __init__(self):
+        self.lines = []
+
+    def info(self, text, **fields):
+        self.lines.append(text)
+
+    error = noise = info
+
+
+def pair(tmp_path, sender_options=None, receiver_options=None):
+    """Two managers whose CTCP messages are delivered straight to each other, as the IRC server would."""
+    managers = {}
+
+    def ctcp_to(peer):
+        async def send_ctcp(nick, contents):
+            await managers[peer].handle('alice' if peer == 'bob' else 'bob', contents)
+        return send_ctcp
+
+    managers['alice'] = DCCManager(ctcp_to('bob'), str(tmp_path / 'alice'), host='127.0.0.1',
+                                   console=RecordingConsole(), timeout=5, **(sender_options or {}))
+    managers['bob'] = DCCManager(ctcp_to('alice'), str(tmp_path / 'bob'), host='127.0.0.1', auto_accept=True,
+                                 console=RecordingConsole(), timeout=5, **(receiver_options or {}))
+    return managers['alice'], managers['bob']
+
+
+async def finish(*managers):
+    while True:
+        tasks = [transfer._task for manager in managers for transfer in manager.transfers.values() if transfer._task]
+        if tasks and all(task.done() for task in tasks):
+            break
+        await asyncio.sleep(0.01)
+    for task in tasks:
+        task.result()
+
+
+def make_file(path, size):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = os.urandom(size)
+    path.write_bytes(data)
+    return data
+
+
+def test_protocol_helpers():
+    assert parse_dcc('SEND "my file.txt" 2130706433 5000 1024') == ('SEND', 'my file.txt', ['2130706433', '5000', '1024'])
+    assert parse_dcc('resume a.bin 5000 512 7') == ('RESUME', 'a.bin', ['5000', '512', '7'])
+    assert parse_dcc('CHAT chat 1 2') is None
+    assert quote_filename('a b') == '"a b"' and quote_filename('ab') == 'ab'
+    assert encode_address('127.0.0.1') == '2130706433' and decode_address('2130706433') == '127.0.0.1'
+    assert encode_address('::1') == '::1' and decode_address('::1') == '::1'
+
+
+@pytest.mark.parametrize('passive', [False, True])
+def test_send_and_receive(tmp_path, passive):
+    source = tmp_path / 'share' / 'notes with spaces.bin'
+    data = make_file(source, 3 * 1024 * 1024 + 17)
+    alice, bob = pair(tmp_path, sender_options={'passive': passive})
+
+    async def scenario():
+        sent = await alice.offer('bob', str(source))
+        await finish(alice, bob)
+        return sent
+
+    sent = run(scenario())
+    received, = bob.transfers.values()
+    assert (sent.state, received.state) == ('done', 'done')
+    assert (tmp_path / 'bob' / 'notes with spaces.bin').read_bytes() == data
+    assert not (tmp_path / 'bob' / 'notes with spaces.bin.part').exists()
+    assert received.as_dict()['done'] == len(data)
+
+
+def test_resume_continues_a_partial_download(tmp_path):
+    source = tmp_path / 'share' / 'image.iso'
+    data = make_file(source, 5 * 1024 * 1024)
+    half = len(data) // 2
+    (tmp_path / 'bob').mkdir()
+    (tmp_path / 'bob' / 'image.iso.part').write_bytes(data[:half])
+    alice, bob = pair(tmp_path)
+
+    async def scenario():
+        sent = await alice.offer('bob', str(source))
+        await finish(alice, bob)
+        return sent
+
+    sent = run(scenario())
+    received, = bob.transfers.values()
+    assert sent.position == received.position == half
+    assert sent.transferred == received.transferred == len(data) - half
+    assert (tmp_path / 'bob' / 'image.iso').read_bytes() == data
+
+
+def test_concurrent_transfers_share_the_loop(tmp_path):
+    files = {f"part{i}.bin": make_file(tmp_path / 'share' / f"part{i}.bin", (i + 1) * 1024 * 1024) for i in range(4)}
+    alice, bob = pair(tmp_path)
+
+    async def scenario():
+        for name in files:
+            await alice.offer('bob', str(tmp_path / 'share' / name))
+        await finish(alice, bob)
+
+    run(scenario())
+    assert all(transfer['state'] == 'done' for transfer in alice.list() + bob.list())
+    for name, data in files.items():
+        assert (tmp_path / 'bob' / name).read_bytes() == data
+
+
+def test_interrupted_receive_keeps_a_resumable_part_file(tmp_path):
+    source = tmp_path / 'share' / 'big.bin'
+    make_file(source, 8 * 1024 * 1024)
+    alice, bob = pair(tmp_path)
+
+    async def scenario():
+        await alice.offer('bob', str(source))
+        received, = bob.transfers.values()
+        while received.transferred == 0 and not received._task.done():
+            await asyncio.sleep(0)
+        alice.cancel(1)
+        await asyncio.gather(alice.transfers[1]._task, received._task, return_exceptions=True)
+        return received
+
+    received = run(scenario())
+    part = tmp_path / 'bob' / 'big.bin.part'
+    # Depending on timing the receiver sees a reset or an early close; either way the transfer fails.
+    assert received.state == 'failed' and received.error
+    assert 0 < part.stat().st_size < 8 * 1024 * 1024
+    assert part.stat().st_size == received.transferred
+
+
+def test_passive_offers_cannot_be_accepted_over_tor(tmp_path):
+    alice, bob = pair(tmp_path, sender_options={'passive': True}, receiver_options={'proxy': ('127.0.0.1', 9050)})
+    bob.auto_accept = False
+    source = tmp_path / 'share' / 'x.bin'
+    make_file(source, 10)
+
+    async def scenario():
+        await alice.offer('bob', str(source))
+        with pytest.raises(ConnectionError, match="not possible over Tor"):
+            await bob.accept(1)
+    run(scenario())
+
+
+@pytest.mark.benchmark
+def test_loopback_throughput(tmp_path):
+    source = tmp_path / 'share' / 'disk.img'
+    source.parent.mkdir()
+    with open(source, 'wb') as f:
+        f.truncate(BENCHMARK_SIZE)
+    alice, bob = pair(tmp_path)
+
+    async def scenario():
+        start = time.perf_counter()
+        await alice.offer('bob', str(source))
+        await finish(alice, bob)
+        return time.perf_counter() - start
+
+    elapsed = run(scenario())
+    received, = bob.transfers.values()
+    rate = BENCHMARK_SIZE / elapsed
+    print(f"\nDCC loopback: {BENCHMARK_SIZE >> 20} MiB in {elapsed:.2f} s ({rate / 1e6:.0f} MB/s)")
+    assert received.state == 'done'
+    assert os.path.getsize(tmp_path / 'bob' / 'disk.img') == BENCHMARK_SIZE
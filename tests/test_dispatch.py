@@ -0,0 +1,155 @@
+import random
+import time
+from types import SimpleNamespace
+import pytest
+from pydle.features.ircv3.tags import TaggedMessage
+from anon_framework.services.communication.dispatch import QUIET_COMMANDS, Line, dispatch_table, parse_line, split_lines
+from tests.conftest import run
+
+SAMPLES = [
+    b":nick!~user@host.example.org PRIVMSG #chan :hello there :)",
+    b":nick!~user@host.example.org JOIN #chan",
+    b":nick!~user@host.example.org PART #chan :see you",
+    b":irc.example.net 353 me = #chan :@op +voice plain",
+    b":irc.example.net 366 me #chan :End of /NAMES list.",
+    b"PING :irc.example.net",
+    b"@time=2024-01-01T00:00:00.000Z;account=nick;msgid=a\\sb :nick!u@h PRIVMSG #chan :tagged",
+    b":irc.example.net 005 me CHANTYPES=# PREFIX=(ov)@+ :are supported by this server",
+    b":nick!u@h PRIVMSG #chan ::starts with a colon",
+    b":nick!u@h NOTICE me :caf\xc3\xa9",
+]
+
+
+def busy_channel_capture(lines=50000, seed=7):
+    """A reproducible stand-in for a recorded capture of a busy channel during a join/part storm."""
+    rng = random.Random(seed)
+    capture = []
+    for i in range(lines):
+        nick = f"user{rng.randrange(5000)}"
+        prefix = f":{nick}!~{nick}@host{i % 97}.example.org"
+        kind = rng.random()
+        if kind < 0.45:
+            capture.append(f"{prefix} PRIVMSG #busy :message number {i} with a few words of text")
+        elif kind < 0.65:
+            capture.append(f"{prefix} JOIN #busy")
+        elif kind < 0.8:
+            capture.append(f"{prefix} PART #busy :Leaving")
+        elif kind < 0.9:
+            capture.append(f"{prefix} QUIT :Ping timeout: 240 seconds")
+        else:
+            capture.append(f":irc.example.net {rng.choice([251, 252, 254, 255, 265, 266])} me 3000 :users online")
+    return [line.encode() for line in capture]
+
+
+@pytest.mark.parametrize('raw', SAMPLES)
+def test_parse_matches_pydle(raw):
+    ours = parse_line(raw)
+    theirs = TaggedMessage.parse(raw)
+    assert ours.command == theirs.command
+    assert ours.params == list(theirs.params)
+    assert ours.source == theirs.source
+    assert ours.tags == (theirs.tags or {})
+
+
+def test_parse_edge_cases():
+    assert parse_line(b"") is None
+    assert parse_line(b"\r") is None
+    assert parse_line(b":source.only") is None
+    # Undecodable bytes fall back to latin-1 instead of failing.
+    assert parse_line(b":n!u@h PRIVMSG #c :\xe9t\xe9").params[-1] == "\xe9t\xe9"
+    assert str(parse_line(b":n!u@h PRIVMSG #c :hi\r")) == ":n!u@h PRIVMSG #c :hi"
+    assert not hasattr(Line('PING', []), '__dict__')
+
+
+def test_split_lines_keeps_the_partial_tail():
+    lines, rest = split_lines(b"PING :a\r\nPING :b\r\nPRIVMSG #c :par")
+    assert lines == [b"PING :a\r", b"PING :b\r"]
+    assert rest == b"PRIVMSG #c :par"
+
+
+def test_dispatch_table_is_built_once_per_class():
+    from anon_framework.services.communication.irc import IRCClient
+    table = dispatch_table(IRCClient)
+    assert dispatch_table(IRCClient) is table
+    assert table[353] is IRCClient.on_raw_353
+    assert table['PRIVMSG'] is IRCClient.on_raw_privmsg
+
+
+def test_quiet_numerics_are_never_formatted():
+    from anon_framework.services.communication.irc import IRCClient
+    client = IRCClient('me', '#chan')
+    unknown = []
+
+    async def on_unknown(message):
+        unknown.append(message)
+    client.on_unknown = on_unknown
+
+    async def replay():
+        for raw in (b":irc.example.net 396 me host.example :is now your displayed host",
+                    b":irc.example.net 020 * :Please wait while we process your connection.",
+                    b":irc.example.net 999 me :unhandled"):
+            await client.on_raw(parse_line(raw))
+    run(replay())
+    assert [message.command for message in unknown] == [999]
+
+
+def test_registration_fallback_numerics_reach_pydle():
+    from anon_framework.services.communication.irc import IRCClient
+    client = IRCClient('me', '#chan')
+    client.connection = SimpleNamespace(throttle=False)
+    # pydle completes registration on LUSERS output for servers that skip or reorder 001.
+    run(client.on_raw(parse_line(b":irc.example.net 251 me :There are 3000 users")))
+    assert client.registered and client.connection.throttle
+
+
+def test_account_tag_updates_both_user_stores():
+    from anon_framework.services.communication.irc import IRCClient
+    client = IRCClient('me', '#chan')
+    client.members.join('#chan', 'Alice', 'a', 'host.example')
+    client.users['Alice'] = {'nickname': 'Alice', 'username': 'a', 'hostname': 'host.example',
+                             'account': None, 'identified': False}
+
+    async def replay():
+        await client.on_raw(parse_line(b"@account=alice_acct :Alice!a@host.example AWAY :brb"))
+    run(replay())
+    assert client.members.user('alice').account == 'alice_acct'
+    assert client.users['alice']['account'] == 'alice_acct' and client.users['alice']['identified']
+
+
+def handled_lines(capture, table):
+    handled = 0
+    for raw in capture:
+        message = parse_line(raw)
+        if message.command in QUIET_COMMANDS:
+            continue
+        handled += table.get(message.command) is not None
+    return handled
+
+
+def test_replay_reaches_handlers():
+    from anon_framework.services.communication.irc import IRCClient
+    capture = busy_channel_capture()
+    assert handled_lines(capture, dispatch_table(IRCClient)) > len(capture) * 0.8
+
+
+@pytest.mark.benchmark
+def test_replay_throughput():
+    capture = busy_channel_capture()
+    from anon_framework.services.communication.irc import IRCClient
+    table = dispatch_table(IRCClient)
+
+    def pydle_path():
+        # pydle parses every line into its message object and formats unhandled ones via str().
+        for raw in capture:
+            message = TaggedMessage.parse(raw)
+            if isinstance(message.command, int) and message.command not in table:
+                str(message)
+
+    start = time.perf_counter()
+    handled_lines(capture, table)
+    fast = len(capture) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    pydle_path()
+    baseline = len(capture) / (time.perf_counter() - start)
+    print(f"\nfast path {fast:,.0f} lines/s, pydle parser {baseline:,.0f} lines/s")
+    assert fast > 2 * baseline
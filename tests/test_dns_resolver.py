@@ -0,0 +1,261 @@
+import asyncio
+import socket
+import struct
+import time
+import pytest
+from anon_framework.config import settings
+from anon_framework.services import dns_resolver
+from anon_framework.services.dns_resolver import (
+    QTYPE_A, QTYPE_SOA, RCODE_NXDOMAIN, ResolveError, Resolver, build_query, parse_response,
+)
+from tests.conftest import run
+
+
+def _name(name):
+    return b''.join(bytes((len(label),)) + label.encode() for label in name.split('.')) + b'\x00'
+
+
+def build_response(query, addresses=(), ttl=300, rcode=0, soa_minimum=None):
+    """Answers `query` with A/AAAA records, or an empty answer with an SOA record in the authority section."""
+    txid = struct.unpack_from('!H', query)[0]
+    question = query[12:]
+    qtype = struct.unpack_from('!H', question, len(question) - 4)[0]
+    answers = b''
+    for address in addresses:
+        family = socket.AF_INET6 if ':' in address else socket.AF_INET
+        rdata = socket.inet_pton(family, address)
+        answers += b'\xc0\x0c' + struct.pack('!HHIH', qtype, 1, ttl, len(rdata)) + rdata
+    authority = b''
+    if soa_minimum is not None:
+        rdata = _name('ns.example') + _name('hostmaster.example') + struct.pack('!IIIII', 1, 7200, 900, 1209600, soa_minimum)
+        authority = _name('example') + struct.pack('!HHIH', QTYPE_SOA, 1, 3600, len(rdata)) + rdata
+    header = struct.pack('!HHHHHH', txid, 0x8180 | rcode, 1, len(addresses), 1 if authority else 0, 0)
+    return header + question + answers + authority
+
+
+class FakeUpstream(asyncio.DatagramProtocol):
+    """
+    A Tor DNSPort stand-in: answers from `zone` after `delay` seconds and counts queries per name.
+    With `hold`, nothing is answered until that many queries have arrived.
+    """
+
+    def __init__(self, zone, delay=0.0, hold=0):
+        self.zone = zone
+        self.delay = delay
+        self.hold = hold
+        self.held = []
+        self.queries = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        labels, offset = [], 12
+        while data[offset]:
+            labels.append(data[offset + 1:offset + 1 + data[offset]].decode())
+            offset += 1 + data[offset]
+        name = '.'.join(labels)
+        self.queries.append(name)
+        answer = self.zone.get(name, {'rcode': RCODE_NXDOMAIN, 'soa_minimum': 900})
+        self.held.append((build_response(data, **answer), addr))
+        if len(self.queries) >= self.hold:
+            for response, addr in self.held:
+                asyncio.get_running_loop().call_later(self.delay, self.transport.sendto, response, addr)
+            self.held = []
+
+
+async def upstream(zone, delay=0.0, hold=0):
+    transport, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: FakeUpstream(zone, delay, hold), local_addr=('127.0.0.1', 0))
+    return protocol, transport.get_extra_info('sockname')[1]
+
+
+ZONE = {
+    'irc.example': {'addresses': ['192.0.2.10', '192.0.2.11'], 'ttl': 600},
+    'v6.example': {'addresses': ['2001:db8::1'], 'ttl': 120},
+    'short.example': {'addresses': ['192.0.2.20'], 'ttl': 1},
+    'empty.example': {'soa_minimum': 45},
+    'gone.example': {'rcode': RCODE_NXDOMAIN, 'soa_minimum': 7200},
+    'blip.example': {'rcode': RCODE_NXDOMAIN, 'soa_minimum': 5},
+}
+
+
+def resolver(port, **options):
+    options.setdefault('prefetch', False)
+    options.setdefault('mode', 'dnsport')
+    return Resolver(host='127.0.0.1', port=port, timeout=1, **options)
+
+
+def test_wire_format_round_trip():
+    query = build_query(0x1234, 'irc.example.', QTYPE_A)
+    assert parse_response(build_response(query, ['192.0.2.1'], ttl=42), QTYPE_A) == (0x1234, 0, ['192.0.2.1'], 42)
+    assert parse_response(build_response(query, soa_minimum=30), QTYPE_A) == (0x1234, 0, [], 30)
+    with pytest.raises(ResolveError, match="Malformed"):
+        parse_response(b'\x00\x01\x00', QTYPE_A)
+
+
+def test_socks_mode_is_the_default():
+    resolver = Resolver()
+    config = settings.get_config()
+    assert (resolver.mode, resolver.port) == ('socks', config['tor']['socks_port'])
+    assert config['dns']['fail_closed'] is False
+    with pytest.raises(ValueError, match="Unknown DNS mode"):
+        Resolver(mode='system')
+
+
+def test_cache_hits_skip_the_upstream():
+    async def scenario():
+        fake, port = await upstream(ZONE)
+        dns = resolver(port)
+        assert await dns.resolve('irc.example') == ['192.0.2.10', '192.0.2.11']
+        for _ in range(100):
+            assert await dns.resolve('IRC.example.') == ['192.0.2.10', '192.0.2.11']
+        assert await dns.resolve('v6.example', socket.AF_INET6) == ['2001:db8::1']
+        dns.close()
+        return fake.queries
+
+    assert run(scenario()) == ['irc.example', 'v6.example']
+
+
+@pytest.mark.benchmark
+def test_cache_hit_latency():
+    async def scenario():
+        fake, port = await upstream(ZONE, delay=0.02)
+        dns = resolver(port)
+        start = time.perf_counter()
+        await dns.resolve('irc.example')
+        miss = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(1000):
+            await dns.resolve('IRC.example.')
+        hit = (time.perf_counter() - start) / 1000
+        dns.close()
+        return miss, hit
+
+    miss, hit = run(scenario())
+    print(f"\nDNS lookup: {miss * 1000:.1f} ms upstream, {hit * 1e6:.1f} us from cache")
+    assert hit * 100 < miss
+
+
+def test_negative_answers_are_cached_for_the_soa_ttl():
+    async def scenario():
+        fake, port = await upstream(ZONE)
+        dns = resolver(port, min_ttl=30, max_ttl=3600)
+        for name in ('gone.example', 'blip.example', 'empty.example'):
+            for _ in range(3):
+                with pytest.raises(ResolveError):
+                    await dns.resolve(name)
+        ttls = {name: dns._cache[(name, QTYPE_A)].ttl for name in ('gone.example', 'blip.example', 'empty.example')}
+        dns.close()
+        return fake.queries, ttls, dns.cache_info()
+
+    queries, ttls, info = run(scenario())
+    assert queries == ['gone.example', 'blip.example', 'empty.example']
+    # 7200 is clamped to max_ttl, 5 is raised to min_ttl, 45 is used as is.
+    assert ttls == {'gone.example': 3600, 'blip.example': 30, 'empty.example': 45}
+    assert info == (3, 3, 0)
+
+
+def test_unreachable_upstream_uses_negative_ttl():
+    async def scenario():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        dns = resolver(port, negative_ttl=7)
+        with pytest.raises(ResolveError, match="Connection refused|Could not reach the Tor resolver"):
+            await dns.resolve('irc.example')
+        entry = dns._cache[('irc.example', QTYPE_A)]
+        dns.close()
+        return entry.ttl
+
+    assert run(scenario()) == 7
+
+
+@pytest.mark.parametrize('mode', ['dnsport', 'socks'])
+@pytest.mark.parametrize('name', ['irc..example', 'x' * 64 + '.example'])
+def test_invalid_names_raise_resolve_error(mode, name):
+    async def scenario():
+        fake, port = await upstream(ZONE)
+        dns = resolver(port, mode=mode)
+        with pytest.raises(ResolveError, match="invalid host name"):
+            await dns.resolve(name)
+        dns.close()
+        return fake.queries
+
+    assert run(scenario()) == []
+
+
+def test_concurrent_lookups_share_one_query():
+    async def scenario():
+        fake, port = await upstream(ZONE, delay=0.05)
+        dns = resolver(port)
+        results = await asyncio.gather(*(dns.resolve('irc.example') for _ in range(100)))
+        dns.close()
+        return fake.queries, results
+
+    queries, results = run(scenario())
+    assert queries == ['irc.example']
+    assert all(result == ['192.0.2.10', '192.0.2.11'] for result in results)
+
+
+def test_popular_names_are_refreshed_before_they_expire():
+    async def scenario():
+        fake, port = await upstream(ZONE)
+        dns = resolver(port, min_ttl=1, prefetch=True)
+        await dns.resolve('short.example')
+        entry = dns._cache[('short.example', QTYPE_A)]
+        await dns.resolve('short.example')
+        assert fake.queries == ['short.example']
+        # Pretend most of the TTL has gone by; the next hit answers from cache and refreshes in the background.
+        entry.expires = time.monotonic() + 0.05
+        assert await dns.resolve('short.example') == ['192.0.2.20']
+        await asyncio.sleep(0.05)
+        refreshed = dns._cache[('short.example', QTYPE_A)]
+        dns.close()
+        return fake.queries, refreshed is not entry
+
+    queries, refreshed = run(scenario())
+    assert queries == ['short.example', 'short.example'] and refreshed
+
+
+def test_prefetch_and_lru_bound():
+    async def scenario():
+        # The upstream answers only once all four queries are in flight, so a serial prefetch would time out.
+        fake, port = await upstream(ZONE, hold=4)
+        dns = resolver(port, cache_size=3)
+        await dns.prefetch(['irc.example', 'gone.example', 'empty.example', 'short.example'])
+        dns.close()
+        return sorted(fake.queries), [entry.error or '' for entry in dns._cache.values()]
+
+    queries, errors = run(scenario())
+    assert queries == ['empty.example', 'gone.example', 'irc.example', 'short.example']
+    assert len(errors) == 3 and not any('Could not reach' in error for error in errors)
+
+
+def test_socks_resolve():
+    async def handle(reader, writer):
+        await reader.readexactly(3)
+        head = await reader.readexactly(5)
+        name = (await reader.readexactly(head[4])).decode()
+        await reader.readexactly(2)
+        writer.write(b'\x05\x00')
+        if name == 'irc.example':
+            writer.write(b'\x05\x00\x00\x01' + socket.inet_aton('192.0.2.10') + b'\x00\x00')
+        else:
+            writer.write(b'\x05\x04\x00\x01' + bytes(6))
+        await writer.drain()
+        writer.close()
+
+    async def scenario():
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        dns = Resolver(mode='socks', host='127.0.0.1', port=server.sockets[0].getsockname()[1], prefetch=False)
+        found = await dns.resolve('irc.example')
+        with pytest.raises(ResolveError, match="SOCKS reply 4"):
+            await dns.resolve('gone.example')
+        with pytest.raises(ResolveError, match="only supports IPv4"):
+            await dns.resolve('irc.example', socket.AF_INET6)
+        server.close()
+        return found, dns._cache[('irc.example', QTYPE_A)].ttl
+
+    assert run(scenario()) == (['192.0.2.10'], dns_resolver.SOCKS_TTL)
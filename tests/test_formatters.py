@@ -0,0 +1,139 @@
+import argparse
+import csv
+import io
+import json
+import time
+import tracemalloc
+import pytest
+from anon_framework.config import settings
+from anon_framework.main import handle_services_command
+from anon_framework.services.i2p import I2PService
+from anon_framework.services.qbittorrent import QBittorrentClient
+from anon_framework.utils.formatters import FORMATS, get_writer
+from anon_framework.vpn.mullvad import MullvadVPN
+from anon_framework.vpn.nord import NordVPN
+from anon_framework.vpn.tor import TorVPN
+from tests.qbittorrent_stub import QBittorrentStub, make_result
+
+
+class TimedStream(io.TextIOBase):
+    """Discards output but remembers when the first record was flushed, how many result pages
+    had been fetched by then and how much was written."""
+
+    def __init__(self, stub):
+        self.stub = stub
+        self.first_flush = None
+        self.pages_at_first_flush = None
+        self.written = 0
+
+    def write(self, text):
+        self.written += len(text)
+        return len(text)
+
+    def flush(self):
+        if self.first_flush is None and self.written:
+            self.first_flush = time.perf_counter()
+            self.pages_at_first_flush = result_pages(self.stub)
+
+
+def result_pages(stub):
+    return sum(1 for request in stub.requests if request[1] == '/api/v2/search/results')
+
+
+def stream_search(stub, limit=0):
+    stream = TimedStream(stub)
+    client = QBittorrentClient(port=stub.port)
+    start = time.perf_counter()
+    with get_writer('ndjson', stream) as writer:
+        count = writer.write_all(client.iter_search('example', limit=limit, poll_interval=0.01))
+    return count, stream, stream.first_flush - start, time.perf_counter() - start
+
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_every_format_round_trips(fmt):
+    records = [make_result(i) for i in range(3)]
+    fields = ['fileName', 'nbSeeders', 'fileUrl']
+    out = io.StringIO()
+    with get_writer(fmt, out, fields=fields) as writer:
+        writer.write_all(records)
+    text = out.getvalue()
+    expected = [{key: record[key] for key in fields} for record in records]
+    if fmt == 'ndjson':
+        assert [json.loads(line) for line in text.splitlines()] == expected
+    elif fmt == 'json':
+        assert json.loads(text) == expected
+    elif fmt == 'csv':
+        assert [dict(row, nbSeeders=int(row['nbSeeders'])) for row in csv.DictReader(io.StringIO(text))] == expected
+    else:
+        assert text.count('---\n') == 3 and 'fileName: Example Release 0 1080p' in text
+
+
+def test_empty_json_is_still_valid():
+    out = io.StringIO()
+    with get_writer('json', out):
+        pass
+    assert json.loads(out.getvalue()) == []
+    with pytest.raises(ValueError, match="Unknown output format"):
+        get_writer('xml')
+
+
+def test_first_record_arrives_before_the_search_finishes():
+    with QBittorrentStub(torrents=0, search_results=50000, search_polls=2) as stub:
+        count, stream, _, _ = stream_search(stub)
+        assert count == 50000
+        # The first record is out after one page of 500; the rest are fetched afterwards.
+        assert stream.pages_at_first_flush == 1 and result_pages(stub) >= 100
+
+
+@pytest.mark.benchmark
+def test_first_record_latency():
+    with QBittorrentStub(torrents=0, search_results=50000, search_polls=2) as stub:
+        _, _, first, total = stream_search(stub)
+    print(f"\n50k results: first record after {first * 1000:.1f} ms, all after {total * 1000:.0f} ms")
+    assert first < total / 20
+
+
+def test_memory_does_not_grow_with_the_result_count():
+    def peak(results):
+        with QBittorrentStub(torrents=0, search_results=results) as stub:
+            tracemalloc.start()
+            try:
+                count, _, _, _ = stream_search(stub)
+                return count, tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+    small_count, small = peak(2000)
+    large_count, large = peak(20000)
+    assert (small_count, large_count) == (2000, 20000)
+    assert large < small * 1.5
+
+
+def test_search_streams_records_on_stdout_and_notices_on_stderr(capsys):
+    with QBittorrentStub(torrents=0, search_results=30) as stub:
+        settings.load(use_cache=False, environ={}, overrides=[f'qbittorrent.port={stub.port}'])
+        args = argparse.Namespace(service='qbittorrent', service_action='search', query=['example'], format='ndjson',
+                                  limit=0, min_seeds=None, sort='seeds', top=5, dedup=None)
+        handle_services_command(args)
+    out, err = capsys.readouterr()
+    records = [json.loads(line) for line in out.splitlines()]
+    assert len(records) == 5 and records[0]['nbSeeders'] >= records[-1]['nbSeeders']
+    assert 'Search job started with ID: 1' in err and 'Found 30 results.' in err
+
+
+def test_status_schema_is_the_same_for_every_provider(monkeypatch):
+    texts = {
+        NordVPN: "Status: Connected\nServer: Germany #1234\nCurrent technology: NORDLYNX",
+        MullvadVPN: "Disconnected",
+        TorVPN: "Tor service is running and connected.",
+        I2PService: "I2P router is not running.",
+    }
+    records = []
+    for cls, text in texts.items():
+        monkeypatch.setattr(cls, 'get_status', lambda self, text=text: text)
+        records.append(cls().get_status_info())
+    assert {frozenset(record) for record in records} == {frozenset({'provider', 'connected', 'status', 'details'})}
+    nord, mullvad, tor, i2p = records
+    assert nord['connected'] and nord['details']['server'] == 'Germany #1234'
+    assert not mullvad['connected'] and mullvad['provider'] == 'mullvad'
+    assert tor['connected'] and not i2p['connected']
@@ -0,0 +1,68 @@
+import asyncio
+import shutil
+import ssl
+import subprocess
+import pytest
+from anon_framework.services.communication.irc import IRCClient, ResolvedConnection
+from tests.conftest import run
+
+HOSTNAME = 'irc.example.net'
+
+
+@pytest.fixture
+def certificate(tmp_path):
+    if shutil.which('openssl') is None:
+        pytest.skip("openssl is needed to make a test certificate")
+    cert, key = tmp_path / 'cert.pem', tmp_path / 'key.pem'
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', f"/CN={HOSTNAME}", '-addext', f"subjectAltName=DNS:{HOSTNAME}",
+                    '-keyout', str(key), '-out', str(cert)], check=True, capture_output=True)
+    return str(cert), str(key)
+
+
+async def tls_server(certificate, names):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(*certificate)
+    context.sni_callback = lambda sock, name, ctx: names.append(name)
+
+    async def handle(reader, writer):
+        writer.write(b":irc.example.net NOTICE * :hello\r\n")
+        await writer.drain()
+        writer.close()
+    return await asyncio.start_server(handle, '127.0.0.1', 0, ssl=context)
+
+
+def test_resolved_address_keeps_the_hostname_for_tls(certificate, monkeypatch):
+    # pydle verifies against the default paths, which honour SSL_CERT_FILE.
+    monkeypatch.setenv('SSL_CERT_FILE', certificate[0])
+
+    async def scenario():
+        names = []
+        server = await tls_server(certificate, names)
+        client = IRCClient('me', '#chan')
+        client.connect_address = '127.0.0.1'
+        await client._connect(HOSTNAME, server.sockets[0].getsockname()[1], tls=True, tls_verify=True)
+        line = await client.connection.reader.readline()
+        connection = client.connection
+        connection.writer.close()
+        server.close()
+        return names, line, connection
+
+    names, line, connection = run(scenario())
+    assert isinstance(connection, ResolvedConnection)
+    assert names == [HOSTNAME] and connection.address == '127.0.0.1' and connection.hostname == HOSTNAME
+    assert line.startswith(b":irc.example.net NOTICE")
+
+
+def test_without_a_resolved_address_pydle_dials_the_name(certificate):
+    async def scenario():
+        server = await tls_server(certificate, [])
+        client = IRCClient('me', '#chan')
+        await client._connect('127.0.0.1', server.sockets[0].getsockname()[1], tls=True)
+        connection = client.connection
+        connection.writer.close()
+        server.close()
+        return connection
+
+    connection = run(scenario())
+    assert not isinstance(connection, ResolvedConnection) and connection.hostname == '127.0.0.1'
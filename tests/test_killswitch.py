@@ -0,0 +1,191 @@
+import fnmatch
+import ipaddress
+import json
+import subprocess
+import sys
+import pytest
+from anon_framework.privacy.killswitch import (
+    CHAIN, FAMILY, KillSwitch, KillSwitchError, Policy, compile_rules, compile_ruleset, diff_rulesets, normalize,
+    parse_endpoint,
+)
+
+# A stand-in for `nft` that keeps the loaded table in a JSON file and lists it
+# the way real nft does (metainfo, handles, one object per rule).
+FAKE_NFT = r'''
+import json, os, sys
+state, args = os.environ['FAKE_NFT_STATE'], sys.argv[1:]
+if os.environ.get('FAKE_NFT_DENY'):
+    sys.exit('sudo: a password is required')
+if args[:2] == ['-j', '-f']:
+    batch = json.load(sys.stdin)['nftables']
+    with open(state, 'w') as f:
+        json.dump([item['add'] for item in batch if 'add' in item][1:], f)
+elif args[:2] == ['-j', 'list'] or args[0] == 'delete':
+    if not os.path.exists(state):
+        sys.exit('Error: No such file or directory; did you mean table ‘anon_killswitch’ in family inet?')
+    if args[0] == 'delete':
+        os.remove(state)
+    else:
+        with open(state) as f:
+            objects = json.load(f)
+        listed = [{'metainfo': {'version': '1.0.9', 'json_schema_version': 1}}]
+        for handle, obj in enumerate(objects, 1):
+            kind, body = next(iter(obj.items()))
+            listed.append({kind: dict(body, handle=handle)})
+        print(json.dumps({'nftables': listed}))
+'''
+
+
+@pytest.fixture
+def nft(tmp_path, monkeypatch):
+    script = tmp_path / 'nft.py'
+    script.write_text(FAKE_NFT)
+    state = tmp_path / 'table.json'
+    monkeypatch.setenv('FAKE_NFT_STATE', str(state))
+    return (sys.executable, str(script)), state
+
+
+def policy(**overrides):
+    options = dict(interfaces=['wg*', 'tun0'], allowed_uids=[107, 107], allowed_ports=[51820],
+                   lan_ranges=['192.168.1.7/24', 'fe80::/10', '10.0.0.0/8'])
+    options.update(overrides)
+    return Policy(**options)
+
+
+def _matches(match, packet):
+    left, right = match['left'], match['right']
+    if 'meta' in left:
+        value = packet.get(left['meta']['key'])
+    else:
+        field = left['payload']
+        if field['field'] == 'daddr':
+            value = ipaddress.ip_address(packet['daddr'])
+            if (value.version == 4) != (field['protocol'] == 'ip'):
+                return False
+        elif packet['protocol'] != field['protocol']:
+            return False
+        else:
+            value = packet['dport']
+    for candidate in right['set'] if isinstance(right, dict) and 'set' in right else [right]:
+        if isinstance(candidate, dict):
+            network = ipaddress.ip_network(f"{candidate['prefix']['addr']}/{candidate['prefix']['len']}")
+            if value in network:
+                return True
+        elif isinstance(value, ipaddress._BaseAddress):
+            if value == ipaddress.ip_address(candidate):
+                return True
+        elif isinstance(candidate, str) and isinstance(value, str):
+            if fnmatch.fnmatchcase(value, candidate):
+                return True
+        elif value == candidate:
+            return True
+    return False
+
+
+def verdict(built, **packet):
+    """Walks a packet through the compiled output chain the way nft would."""
+    packet = dict({'oifname': 'eth0', 'skuid': None, 'mark': 0, 'protocol': 'udp'}, **packet)
+    for rule in compile_rules(built):
+        if all(_matches(expr['match'], packet) for expr in rule if 'match' in expr):
+            return 'accept'
+    return compile_ruleset(built)['nftables'][3]['add']['chain']['policy']
+
+
+def test_default_policy_keeps_the_tunnel_up(config):
+    built = Policy.from_config(config)
+    # NordLynx / Mullvad / wg-quick handshakes leave the physical interface with no socket uid, only a mark.
+    assert verdict(built, daddr='185.203.218.5', dport=51820, mark=0xe1f1) == 'accept'
+    assert verdict(built, daddr='185.65.135.80', dport=9124, mark=0x6d6f6c65) == 'accept'
+    assert verdict(built, daddr='2a03:1b20::1', dport=51820, mark=51820) == 'accept'
+    assert verdict(built, oifname='nordlynx', daddr='1.1.1.1', protocol='tcp', dport=443, skuid=1000) == 'accept'
+    # Anything else leaving on the physical interface is still dropped, including root's.
+    assert verdict(built, daddr='185.203.218.5', dport=51820) == 'drop'
+    assert verdict(built, daddr='1.1.1.1', protocol='tcp', dport=443, skuid=0) == 'drop'
+    assert verdict(built, daddr='192.168.1.1', protocol='tcp', dport=22) == 'accept'
+
+
+def test_explicit_endpoints_are_accepted():
+    built = policy(endpoints=['198.51.100.7:1194', '[2001:db8::1]:443', '203.0.113.9'])
+    assert verdict(built, daddr='198.51.100.7', dport=1194) == 'accept'
+    assert verdict(built, daddr='198.51.100.7', protocol='tcp', dport=1194) == 'accept'
+    assert verdict(built, daddr='198.51.100.7', dport=53) == 'drop'
+    assert verdict(built, daddr='2001:db8::1', protocol='tcp', dport=443) == 'accept'
+    assert verdict(built, daddr='203.0.113.9', protocol='tcp', dport=8443) == 'accept'
+    assert verdict(built, daddr='198.51.100.8', dport=1194) == 'drop'
+    assert parse_endpoint('2001:db8::2') == (ipaddress.ip_address('2001:db8::2'), None)
+    with pytest.raises(KillSwitchError, match="Invalid kill-switch endpoint"):
+        policy(endpoints=['vpn.example.com:1194'])
+
+
+def test_compile_rules():
+    rules = [json.dumps(rule, sort_keys=True) for rule in compile_rules(policy())]
+    assert len(rules) == 8
+    assert '"lo"' in rules[0]
+    assert not any('"ct"' in rule for rule in rules)
+    assert '"192.168.1.0"' in rules[-2] and '"10.0.0.0"' in rules[-2] and '"fe80::"' in rules[-1]
+    assert len(compile_rules(policy(allow_lan=False, allowed_ports=[]))) == 4
+    assert compile_rules(policy(allowed_ports=[53, 51820]))[4][0]['match']['right'] == {'set': [53, 51820]}
+
+
+def test_ruleset_swaps_the_table_in_one_batch():
+    commands = compile_ruleset(policy())['nftables']
+    assert [next(iter(command)) for command in commands[:3]] == ['add', 'delete', 'add']
+    assert commands[3]['add']['chain']['policy'] == 'drop'
+    assert all(command['add']['rule']['chain'] == CHAIN for command in commands[4:])
+
+
+def test_diff_ignores_handles_and_other_tables():
+    desired = compile_ruleset(policy())
+    listed = {'nftables': [{'metainfo': {}}, {'table': {'family': FAMILY, 'name': 'other'}}] + [
+        {next(iter(item['add'])): dict(next(iter(item['add'].values())), handle=i)}
+        for i, item in enumerate(desired['nftables'][2:])
+    ]}
+    assert diff_rulesets(desired, listed, 'anon_killswitch') == ([], [])
+    assert list(normalize(desired, 'other')) == []
+
+    added, removed = diff_rulesets(compile_ruleset(policy(allowed_ports=[1194])), listed, 'anon_killswitch')
+    assert len(added) == 2 and len(removed) == 2
+    reordered = compile_ruleset(policy(interfaces=['tun0', 'wg*']))
+    assert diff_rulesets(reordered, listed, 'anon_killswitch') == ([(CHAIN, None)], [(CHAIN, None)])
+    assert diff_rulesets(desired, None, 'anon_killswitch')[0][0] == (CHAIN, None)
+
+
+def test_enable_is_idempotent(nft):
+    command, state = nft
+    switch = KillSwitch(policy(), nft=command)
+    assert switch.live_ruleset() is None and not switch.is_active()
+    assert switch.enable() is True
+    assert switch.is_active()
+    assert switch.enable() is False
+    assert switch.enable(force=True) is True
+    switch.policy = policy(allowed_ports=[1194])
+    assert switch.enable() is True
+    assert switch.disable() is True
+    assert switch.disable() is False
+    assert not state.exists()
+
+
+def test_failures_other_than_a_missing_table_raise(nft, monkeypatch):
+    command, state = nft
+    switch = KillSwitch(policy(), nft=command)
+    monkeypatch.setenv('FAKE_NFT_DENY', '1')
+    with pytest.raises(KillSwitchError, match="password is required"):
+        switch.live_ruleset()
+    with pytest.raises(KillSwitchError):
+        switch.disable()
+    missing = KillSwitch(policy(), nft=('/nonexistent/nft',))
+    with pytest.raises(KillSwitchError, match="Command not found"):
+        missing.is_active()
+
+
+def test_from_config_skips_unknown_users():
+    config = {'killswitch': {'table': 't', 'interfaces': ['wg*'], 'allowed_users': ['root', 'no-such-user-here'],
+                             'allowed_ports': ['51820'], 'allow_lan': False, 'lan_ranges': [],
+                             'endpoint_marks': ['0xe1f1', 51820], 'endpoints': []}}
+    built = Policy.from_config(config)
+    assert built.allowed_uids == [0] and built.allowed_ports == [51820] and built.endpoint_marks == [51820, 0xe1f1]
+
+
+def test_module_imports_without_pwd():
+    code = "import sys; sys.modules['pwd'] = None; import anon_framework.privacy.killswitch"
+    subprocess.run([sys.executable, '-c', code], check=True)
@@ -0,0 +1,147 @@
+import gc
+import time
+import tracemalloc
+import pytest
+from pydle.features.whox import WHOX_IDENTIFIER
+from anon_framework.services.communication.dispatch import parse_line
+from anon_framework.services.communication.membership import MembershipStore, fold
+from tests.conftest import run
+
+USERS = 50000
+NAMES_PER_LINE = 40
+
+
+def names_lines(users=USERS):
+    nicks = [('@' if i % 500 == 0 else '+' if i % 97 == 0 else '') + f"User{i}[x]" for i in range(users)]
+    return [' '.join(nicks[i:i + NAMES_PER_LINE]) for i in range(0, users, NAMES_PER_LINE)]
+
+
+def test_casemapping():
+    assert fold('Nick[Away]') == 'nick{away}'
+    assert fold('a\\b~') == 'a|b^'
+    store = MembershipStore()
+    store.join('#Chan', 'Alice')
+    store.join('#chan', 'ALICE')
+    assert store.members('#CHAN') == ['Alice'] and store.users['alice'].channels == 1
+
+
+def test_refcounts_follow_joins_parts_and_quits():
+    store = MembershipStore()
+    store.join('#a', 'bob', 'b', 'host.example', account='bobby', realname='Bob')
+    store.join('#b', 'bob')
+    assert store.user('BOB').channels == 2 and store.user('bob').account == 'bobby'
+    assert sorted(store.channels_of('bob')) == ['#a', '#b']
+    store.part('#a', 'bob')
+    assert not store.is_member('#a', 'bob') and store.user('bob').channels == 1
+    store.rename('bob', 'Robert')
+    assert store.members('#b') == ['Robert'] and store.user('bob') is None
+    store.quit('robert')
+    assert store.users == {}
+    store.join('#c', 'carol')
+    store.remove_channel('#c')
+    assert store.users == {} and store.channel('#c') is None
+
+
+def test_names_reply_replaces_membership():
+    store = MembershipStore()
+    store.join('#chan', 'gone')
+    store.names('#chan', '@alice +bob carol!c@host.example')
+    # Until 366 arrives the old membership is still what queries see.
+    assert store.members('#chan') == ['gone']
+    store.join('#chan', 'late')
+    store.end_of_names('#chan')
+    assert sorted(store.members('#chan')) == ['alice', 'bob', 'carol', 'late']
+    assert store.user('gone') is None
+    assert (store.prefix('#chan', 'ALICE'), store.prefix('#chan', 'bob'), store.prefix('#chan', 'carol')) == ('@', '+', '')
+    assert (store.user('carol').username, store.user('carol').host) == ('c', 'host.example')
+    assert store.complete('#chan', 'B') == ['bob']
+    assert store.users['alice'] is not None and len(store.channel('#chan').prefixes) == 2
+
+
+def test_nick_keys_are_shared():
+    store = MembershipStore()
+    store.names('#a', ''.join(['Some', 'One']))
+    store.end_of_names('#a')
+    store.join('#b', 'SOMEONE')
+    key_a, = store.channel('#a').members
+    key_b, = store.channel('#b').members
+    assert key_a is key_b
+
+
+def test_whox_replies_need_pydle_token():
+    from anon_framework.services.communication.irc import IRCClient
+    client = IRCClient('me', '#chan')
+    client.members.join('#chan', 'dave')
+    for token, account in (('999', 'wrong'), (WHOX_IDENTIFIER, 'dave_account')):
+        line = f":irc.example 354 me {token} ~dave dave.example dave {account} :Dave Example".encode()
+        run(client.on_raw_354(parse_line(line)))
+    dave = client.members.user('dave')
+    assert (dave.username, dave.host, dave.account, dave.realname) == ('~dave', 'dave.example', 'dave_account', 'Dave Example')
+    client.members.whox('dave', '~dave', 'dave.example', '0', 'Dave')
+    assert dave.account is None
+
+
+def replay(lines):
+    store = MembershipStore()
+    for line in lines:
+        store.names('#big', line)
+    store.end_of_names('#big')
+    return store
+
+
+def test_50k_user_channel_replay():
+    store = replay(names_lines())
+    assert len(store.channel('#big')) == USERS and len(store.users) == USERS
+    assert store.prefix('#big', 'user500[X]') == '@' and store.prefix('#big', 'user97[x]') == '+'
+    # A join/part storm: every member leaves and comes back.
+    nicks = [store.users[key].nick for key in list(store.channel('#big').members)]
+    for nick in nicks:
+        store.part('#big', nick)
+        store.join('#big', nick)
+    assert len(store.users) == USERS and len(store.channel('#big')) == USERS
+    assert store.prefix('#big', 'user500[X]') == ''
+
+
+@pytest.mark.benchmark
+def test_50k_user_channel_footprint():
+    lines = names_lines()
+
+    def pydle_style():
+        # What pydle keeps per user: a dict of fields, plus a set of nicks per channel.
+        users, channel = {}, set()
+        for line in lines:
+            for entry in line.split():
+                nick = entry.lstrip('~&@%+')
+                users[nick] = {'nickname': nick, 'username': None, 'realname': None, 'hostname': None,
+                               'away': False, 'away_message': None, 'account': None, 'identified': False}
+                channel.add(nick)
+        return users, channel
+
+    def measure(build):
+        gc.collect()
+        tracemalloc.start()
+        try:
+            start = time.perf_counter()
+            built = build()
+            elapsed = time.perf_counter() - start
+            return built, tracemalloc.get_traced_memory()[0], elapsed
+        finally:
+            tracemalloc.stop()
+
+    store, store_bytes, _ = measure(lambda: replay(lines))
+    _, pydle_bytes, _ = measure(pydle_style)
+
+    start = time.perf_counter()
+    replay(lines)
+    names_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    nicks = [store.users[key].nick for key in list(store.channel('#big').members)]
+    for nick in nicks:
+        store.part('#big', nick)
+        store.join('#big', nick)
+    storm_seconds = time.perf_counter() - start
+
+    print(f"\n{USERS} users: store {store_bytes / 1e6:.1f} MB vs pydle-style {pydle_bytes / 1e6:.1f} MB; "
+          f"NAMES {USERS / names_seconds:,.0f} users/s, join/part storm {2 * USERS / storm_seconds:,.0f} events/s")
+    assert store_bytes < pydle_bytes * 0.9
@@ -0,0 +1,103 @@
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+import pytest
+from anon_framework.utils import metrics
+from anon_framework.utils.helpers import run_command
+
+
+def test_disabled_recording_is_a_no_op():
+    counter = metrics.counter('test_disabled_total')
+    histogram = metrics.histogram('test_disabled_seconds')
+    counter.inc()
+    histogram.observe(0.2)
+    assert counter.value == 0 and histogram.count == 0
+    # Every disabled span is the same shared object, so timing a hot path allocates nothing.
+    assert metrics.span('a', 'test_disabled_seconds') is metrics.span('b')
+
+
+@pytest.mark.benchmark
+def test_disabled_span_costs_next_to_nothing():
+    loops = 200000
+    start = time.perf_counter()
+    for _ in range(loops):
+        with metrics.span("hot path", 'test_overhead_seconds'):
+            pass
+    per_call = (time.perf_counter() - start) / loops
+    print(f"\n{per_call * 1e9:.0f} ns per disabled span")
+    assert per_call < 2e-6
+
+
+def test_counters_histograms_and_prometheus_text(recording):
+    counter = metrics.counter('test_requests', 'Requests handled.')
+    histogram = metrics.histogram('test_latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+    counter.inc()
+    counter.inc(2)
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value)
+    text = metrics.render_prometheus()
+    assert '# TYPE test_requests counter' in text
+    assert 'test_requests_total 3' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count 3' in text
+
+
+def test_metric_kinds_cannot_be_mixed():
+    metrics.counter('test_kind')
+    try:
+        metrics.histogram('test_kind')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("registering a histogram over a counter must fail")
+
+
+def test_spans_feed_the_phase_report(recording):
+    with metrics.span("phase one", 'test_phase_seconds'):
+        time.sleep(0.01)
+    with metrics.span("phase one"):
+        pass
+    assert metrics.histogram('test_phase_seconds').count == 1
+    report = metrics.phase_report(total=0.02)
+    assert 'phase one' in report and '(wall time)' in report
+    assert report.splitlines()[1].split()[2] == '2'
+
+
+def test_subprocess_calls_are_instrumented(recording):
+    stdout, _, code = run_command([sys.executable, '-c', 'print("hi")'])
+    assert (stdout, code) == ('hi', 0)
+    assert metrics.counter('anon_subprocess_calls').value == 1
+    assert metrics.histogram('anon_subprocess_seconds').count == 1
+
+
+def test_file_and_http_export(recording, tmp_path):
+    metrics.counter('test_exported').inc(7)
+    path = tmp_path / 'metrics.prom'
+    metrics.write_prometheus(str(path))
+    assert 'test_exported_total 7' in path.read_text()
+
+    server = metrics.serve_prometheus(0)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=5) as response:
+            assert 'test_exported_total 7' in response.read().decode()
+    finally:
+        server.shutdown()
+
+
+def test_profile_flag_prints_a_phase_breakdown(tmp_path):
+    env = dict(os.environ, XDG_CONFIG_HOME=str(tmp_path), XDG_CACHE_HOME=str(tmp_path))
+    env = {name: value for name, value in env.items() if not name.startswith('ANON_')}
+    result = subprocess.run(
+        [sys.executable, '-m', 'anon_framework.main', '--profile', '--no-config-cache',
+         'privacy', 'killswitch-on', '--dry-run'],
+        capture_output=True, text=True, env=env, timeout=60,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    assert result.returncode == 0, result.stderr
+    assert 'config load' in result.stderr
+    assert '(wall time)' in result.stderr
@@ -0,0 +1,132 @@
+import os
+import time
+import pytest
+from anon_framework.vpn import monitor as monitor_module
+from anon_framework.vpn.monitor import BandwidthMonitor, RingBuffer, format_rate
+from tests.conftest import run
+
+HEADER = (
+    "Inter-|   Receive                                                |  Transmit\n"
+    " face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed\n"
+)
+
+
+class FakeProcNetDev:
+    """A /proc/net/dev stand-in whose counters are rewritten in place, like procfs."""
+
+    def __init__(self, path, interfaces):
+        self.path = path
+        self.counters = {name: [0, 0] for name in interfaces}
+        self.write()
+
+    def write(self):
+        lines = [f"{name:>6}: {rx} 10 0 0 0 0 0 0 {tx} 10 0 0 0 0 0 0" for name, (rx, tx) in self.counters.items()]
+        with open(self.path, 'r+' if os.path.exists(self.path) else 'w') as f:
+            f.write(HEADER + "\n".join(lines) + "\n")
+            f.truncate()
+
+    def add(self, name, rx, tx):
+        self.counters[name][0] += rx
+        self.counters[name][1] += tx
+        self.write()
+
+
+@pytest.fixture
+def procfs(tmp_path):
+    return FakeProcNetDev(str(tmp_path / 'dev'), ['lo', 'eth0', 'wg0', 'tun0'])
+
+
+def test_ring_buffer_wraps_without_growing():
+    ring = RingBuffer(4)
+    for value in range(1, 7):
+        ring.append(float(value))
+    assert list(ring.values()) == [3.0, 4.0, 5.0, 6.0]
+    assert (ring.latest(), ring.mean(), ring.percentile(50)) == (6.0, 4.5, 5.0)
+    assert len(ring.data) == 4
+    assert ring.histogram((3.0, 5.0)) == [1, 2, 1]
+    assert RingBuffer(3).percentile(95) == 0.0
+
+
+def test_rates_follow_the_counters(procfs):
+    with BandwidthMonitor(['wg', 'tun'], window=8, path=procfs.path) as monitor:
+        assert set(monitor.read_counters()) == {'wg0', 'tun0'}
+        monitor.sample()
+        procfs.add('wg0', 100000, 5000)
+        time.sleep(0.05)
+        stats = monitor.sample()
+        rate = stats['wg0'].rx_rate.latest()
+        assert 100000 / 0.5 < rate < 100000 / 0.05
+        assert stats['tun0'].rx_rate.latest() == 0.0
+        assert stats['wg0'].as_dict()['tx_bytes'] == 5000
+
+        # A re-created interface restarts its counters; that sample is skipped, not negative.
+        procfs.counters['wg0'] = [10, 10]
+        procfs.write()
+        assert monitor.sample()['wg0'].rx_rate.count == 1
+        del procfs.counters['tun0']
+        procfs.write()
+        assert 'tun0' not in monitor.sample()
+
+
+def test_default_skips_loopback(procfs):
+    with BandwidthMonitor(path=procfs.path) as monitor:
+        assert set(monitor.read_counters()) == {'eth0', 'wg0', 'tun0'}
+
+
+def test_files_larger_than_one_read_are_parsed_whole(tmp_path):
+    # Container hosts with hundreds of veths push /proc/net/dev past 64 KiB.
+    names = [f"veth{i:05d}" for i in range(3000)] + ['wg0']
+    large = FakeProcNetDev(str(tmp_path / 'dev'), names)
+    large.add('wg0', 123456789, 987654321)
+    assert os.path.getsize(large.path) > 2 * monitor_module.READ_SIZE
+    with BandwidthMonitor(path=large.path) as monitor:
+        counters = monitor.read_counters()
+        assert len(counters) == len(names) and counters['wg0'] == (123456789, 987654321)
+        assert monitor.read_counters() == counters
+
+
+def test_file_is_opened_once(procfs, monkeypatch):
+    with BandwidthMonitor(path=procfs.path) as monitor:
+        opened = []
+        monkeypatch.setattr(os, 'open', lambda *args, **kwargs: opened.append(args))
+        for _ in range(20):
+            monitor.sample()
+        assert opened == []
+
+
+def test_watch_yields_one_sample_per_interval(procfs):
+    seen = []
+
+    async def watch():
+        with BandwidthMonitor(['wg', 'tun'], path=procfs.path) as monitor:
+            async for stats in monitor.watch(interval=0.01):
+                seen.append((sorted(stats), stats['wg0'].rx_bytes))
+                if len(seen) == 3:
+                    return
+                procfs.add('wg0', 1000, 0)
+
+    run(watch())
+    assert seen == [(['tun0', 'wg0'], 0), (['tun0', 'wg0'], 1000), (['tun0', 'wg0'], 2000)]
+
+
+@pytest.mark.benchmark
+def test_overhead_at_10hz_is_under_one_percent(procfs):
+    samples = []
+
+    async def watch():
+        with BandwidthMonitor(['wg', 'tun'], path=procfs.path) as monitor:
+            async for stats in monitor.watch(interval=0.1):
+                samples.append(stats['wg0'].rx_bytes)
+                if len(samples) == 11:
+                    return
+
+    wall, cpu = time.perf_counter(), time.thread_time()
+    run(watch())
+    wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+    print(f"\n10 Hz sampling: {cpu * 1000:.2f} ms CPU over {wall:.2f} s ({100 * cpu / wall:.3f}%)")
+    assert cpu / wall < 0.01
+
+
+@pytest.mark.parametrize('rate, text', [(12.0, '12.0 B/s'), (1500.0, '1.5 KB/s'), (2.5e6, '2.5 MB/s'), (3e9, '3.0 GB/s')])
+def test_format_rate(rate, text):
+    assert format_rate(rate) == text
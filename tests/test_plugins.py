@@ -0,0 +1,257 @@
+import asyncio
+import random
+import re
+import threading
+import time
+import pytest
+from anon_framework.services.communication.plugins import Matcher, PluginEngine, Trigger, _fold_safe
+from tests.conftest import run
+
+WORDS = ['tor', 'vpn', 'relay', 'exit', 'bridge', 'onion', 'node', 'guard', 'circuit', 'hidden', 'service',
+         'torrent', 'seed', 'peer', 'magnet', 'linux', 'debian', 'kernel', 'patch', 'release']
+
+
+class RecordingConsole:
+    def __init__(self):
+        self.errors = []
+
+    def error(self, text, **fields):
+        self.errors.append(text)
+
+
+def noop(client, event):
+    pass
+
+
+def make_triggers(count=500, seed=3):
+    rng = random.Random(seed)
+    triggers = []
+    for i in range(count):
+        kind = i % 5
+        if kind == 0:
+            triggers.append(Trigger(noop, f"{rng.choice(WORDS)}{i}", name=f"kw{i}"))
+        elif kind == 1:
+            triggers.append(Trigger(noop, f"{rng.choice(WORDS)} {rng.choice(WORDS)}{i}", name=f"phrase{i}"))
+        elif kind == 2:
+            triggers.append(Trigger(noop, rf"\b{rng.choice(WORDS)}-\d+{i}\b", regex=True, name=f"re{i}"))
+        elif kind == 3:
+            triggers.append(Trigger(noop, rf"(?:https?://)\S*{rng.choice(WORDS)}{i}", regex=True, name=f"url{i}"))
+        else:
+            triggers.append(Trigger(noop, rf"{rng.choice(WORDS).upper()}_{i}", regex=True, ignore_case=False,
+                                    name=f"exact{i}"))
+    triggers.append(Trigger(noop, r'\btor\b', regex=True, name='plain-tor'))
+    triggers.append(Trigger(noop, 'tor', name='kw-tor'))
+    return triggers
+
+
+def make_lines(triggers, count=5000, seed=4):
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        words = [rng.choice(WORDS) + rng.choice(['', '', str(rng.randrange(600))]) for _ in range(12)]
+        if i % 10 == 0:
+            # Every tenth line mentions something a trigger is looking for.
+            trigger = rng.choice(triggers)
+            sample = {'kw': trigger.pattern, 'phrase': trigger.pattern}.get(re.sub(r'\d+', '', trigger.name))
+            words.append(sample or f"https://example.org/{rng.choice(WORDS)}{i}")
+        if i % 7 == 0:
+            words[0] = words[0].upper()
+        lines.append(' '.join(words))
+    return lines
+
+
+def naive(patterns, text):
+    return {name for name, pattern in patterns if pattern.search(text)}
+
+
+def test_fold_safety():
+    assert _fold_safe(r'\bexit-\d+\b')
+    assert _fold_safe(r'[a-z0-9]+')
+    assert not _fold_safe(r'\bTor\b')
+    assert not _fold_safe(r'[A-Z]')
+    assert not _fold_safe(r'\S+\N{BULLET}')
+    assert not _fold_safe('café')
+
+
+def test_matcher_agrees_with_one_search_per_trigger():
+    triggers = make_triggers()
+    matcher = Matcher(triggers)
+    patterns = [(trigger.name, re.compile(trigger.expression, re.IGNORECASE if trigger.ignore_case else 0))
+                for trigger in triggers]
+    lines = make_lines(triggers, count=1000) + ['TOR exit', 'Ünïcode tor café', 'tor-bridge', '']
+    for line in lines:
+        assert {trigger.name for trigger, _ in matcher.match(line)} == naive(patterns, line), line
+
+
+@pytest.mark.benchmark
+def test_matcher_throughput_with_500_triggers():
+    # 400 keywords and 100 regexes, as a busy bot would load them.
+    rng = random.Random(5)
+    triggers = [Trigger(noop, f"{rng.choice(WORDS)}{i}", name=f"kw{i}") for i in range(400)]
+    triggers += [Trigger(noop, rf"\b{rng.choice(WORDS)}-\d+{i}\b", regex=True, name=f"re{i}") for i in range(100)]
+    vocabulary = WORDS + [trigger.pattern for trigger in triggers[:400]]
+    lines = [' '.join(rng.choice(vocabulary) for _ in range(rng.randrange(4, 21))) for _ in range(1000)]
+    compiled = [re.compile(trigger.expression, re.IGNORECASE) for trigger in triggers]
+    matcher = Matcher(triggers)
+
+    start = time.perf_counter()
+    matched = sum(len(matcher.match(line)) for line in lines)
+    engine_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    baseline = sum(1 for line in lines for pattern in compiled if pattern.search(line))
+    baseline_seconds = time.perf_counter() - start
+
+    print(f"\n500 triggers: {len(lines) / engine_seconds:,.0f} lines/s matched together, "
+          f"{len(lines) / baseline_seconds:,.0f} lines/s one pattern at a time")
+    assert matched == baseline > 0
+    assert engine_seconds * 10 < baseline_seconds
+
+
+def test_handlers_get_events_and_failures_are_contained():
+    console = RecordingConsole()
+    engine = PluginEngine(client='client', timeout=1, console=console)
+    seen = []
+
+    @engine.trigger(r'(?P<host>\w+)\.onion', regex=True)
+    async def onion(client, event):
+        seen.append((client, event.kind, event.target, event.source, event.match.group('host')))
+
+    @engine.hook('join', 'part')
+    async def membership(client, event):
+        seen.append((event.kind, event.target, event.source))
+
+    @engine.trigger('boom')
+    async def broken(client, event):
+        raise RuntimeError('plugin bug')
+
+    async def scenario():
+        assert engine.dispatch('message', '#chan', 'alice', 'see abcdef.onion') == 1
+        assert engine.dispatch('join', '#chan', 'bob') == 1
+        assert engine.dispatch('message', '#chan', 'alice', 'nothing here') == 0
+        engine.dispatch('message', '#chan', 'alice', 'BOOM!')
+        await asyncio.sleep(0.05)
+
+    run(scenario())
+    assert seen == [('client', 'message', '#chan', 'alice', 'abcdef'), ('join', '#chan', 'bob')]
+    assert console.errors == ["Plugin handler 'test_handlers_get_events_and_failures_are_contained.<locals>.broken' "
+                              "failed: RuntimeError('plugin bug')"]
+    assert engine.remove('test_handlers_get_events_and_failures_are_contained.<locals>.broken') == 1
+    with pytest.raises(ValueError, match="Unknown event"):
+        Trigger(noop, events=('kick',))
+
+
+def test_sync_handlers_run_off_the_event_loop():
+    console = RecordingConsole()
+    engine = PluginEngine(client=None, timeout=5, console=console)
+    finished = []
+    # Both slow handlers must be running at once, and the loop must run a callback while they block.
+    together = threading.Barrier(2, timeout=5)
+    loop_ran = threading.Event()
+    release = threading.Event()
+
+    @engine.trigger('slow')
+    def slow(client, event):
+        together.wait()
+        if loop_ran.wait(5):
+            finished.append(event.text)
+
+    @engine.trigger('stuck', timeout=0.1)
+    def stuck(client, event):
+        release.wait(5)
+
+    async def scenario():
+        for text in ('slow one', 'slow two', 'stuck'):
+            engine.dispatch('message', '#chan', 'alice', text)
+        asyncio.get_running_loop().call_soon(loop_ran.set)
+        while engine.pending():
+            await asyncio.sleep(0.01)
+
+    run(scenario())
+    release.set()
+    assert sorted(finished) == ['slow one', 'slow two']
+    assert console.errors == [f"Plugin handler '{stuck.__qualname__}' timed out after 0.1s."]
+
+
+def test_stuck_sync_handlers_are_capped_and_keep_off_the_runtime_pool():
+    console = RecordingConsole()
+    engine = PluginEngine(client=None, timeout=5, console=console, workers=2)
+    release = threading.Event()
+    threads = []
+
+    @engine.trigger('stuck', timeout=0.05)
+    def stuck(client, event):
+        threads.append(threading.current_thread().name)
+        release.wait(5)
+
+    @engine.trigger('quick')
+    def quick(client, event):
+        threads.append(threading.current_thread().name)
+
+    async def settle():
+        while engine.pending():
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        engine.dispatch('message', '#chan', 'alice', 'stuck')
+        engine.dispatch('message', '#chan', 'alice', 'stuck')
+        await settle()
+        abandoned = engine.abandoned()
+        engine.dispatch('message', '#chan', 'alice', 'quick')
+        await settle()
+        release.set()
+        while engine.abandoned():
+            await asyncio.sleep(0.01)
+        engine.dispatch('message', '#chan', 'alice', 'quick')
+        await settle()
+        await engine.close()
+        return abandoned
+
+    assert run(scenario()) == 2
+    assert len(threads) == 3 and all(name.startswith('anon-plugin') for name in threads)
+    assert console.errors[2:] == [f"Plugin handler '{quick.__qualname__}' skipped: all 2 plugin threads "
+                                  f"are held by handlers that timed out."]
+
+
+def test_async_handlers_are_cancelled_on_timeout():
+    console = RecordingConsole()
+    engine = PluginEngine(client=None, timeout=0.05, console=console)
+    cancelled = []
+
+    @engine.hook('quit')
+    async def hang(client, event):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(event.source)
+            raise
+
+    async def scenario():
+        engine.dispatch('quit', None, 'carol', 'bye')
+        engine.dispatch('quit', None, 'dave', 'bye')
+        await asyncio.sleep(0.1)
+        return engine.pending()
+
+    assert run(scenario()) == 0
+    assert cancelled == ['carol', 'dave'] and len(console.errors) == 2
+
+
+def test_plugins_load_from_a_directory(tmp_path):
+    (tmp_path / 'greeter.py').write_text(
+        "def setup(engine):\n"
+        "    @engine.trigger('hello')\n"
+        "    async def greet(client, event):\n"
+        "        client.append(event.source)\n"
+    )
+    (tmp_path / 'broken.py').write_text("x = 1\n")
+    (tmp_path / '_private.py').write_text("raise SystemExit\n")
+    console = RecordingConsole()
+    greeted = []
+    engine = PluginEngine(client=greeted, console=console)
+    assert engine.load(plugin_dir=str(tmp_path)) == ['greeter']
+    assert "Could not load plugin 'broken'" in console.errors[0]
+
+    async def scenario():
+        engine.dispatch('message', '#chan', 'erin', 'Hello there')
+        await asyncio.sleep(0.01)
+    run(scenario())
+    assert greeted == ['erin']
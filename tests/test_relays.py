@@ -0,0 +1,156 @@
+import argparse
+import asyncio
+import os
+import random
+import time
+import pytest
+import requests
+from anon_framework.config import settings
+from anon_framework.main import handle_vpn_command
+from anon_framework.vpn import nord, relays
+from anon_framework.vpn.relays import (
+    Relay, RelayCatalog, candidates, parse_mullvad, parse_nord, probe_all, rank, rank_relays,
+)
+
+# Loopback addresses standing in for relays, with the handshake delay injected for each.
+DELAYS = {'127.0.0.2': 0.08, '127.0.0.3': 0.025, '127.0.0.4': 0.03, '127.0.0.5': 0.02, '127.0.0.6': 0.5}
+UNREACHABLE = '127.0.0.9'
+
+
+def nord_fixture():
+    def server(number, address, load, country='de', status='online'):
+        return {'hostname': f"{country}{number}.nordvpn.com", 'station': address, 'load': load, 'status': status,
+                'locations': [{'country': {'code': country.upper(), 'city': {'name': 'Frankfurt'}}}]}
+    return [
+        server(100, '127.0.0.2', 10),
+        server(101, '127.0.0.3', 90),
+        server(102, '127.0.0.4', 5),
+        server(103, '127.0.0.5', 40, country='nl'),
+        server(104, '127.0.0.6', 1),
+        server(105, UNREACHABLE, 0),
+        server(106, '127.0.0.7', 0, status='maintenance'),
+    ]
+
+
+@pytest.fixture
+def listeners(monkeypatch):
+    """TCP listeners on each relay address; connects are delayed by the relay's injected latency."""
+    loop = asyncio.new_event_loop()
+    first = loop.run_until_complete(asyncio.start_server(lambda r, w: w.close(), '127.0.0.2', 0))
+    port = first.sockets[0].getsockname()[1]
+    servers = [first] + [loop.run_until_complete(asyncio.start_server(lambda r, w: w.close(), address, port))
+                         for address in list(DELAYS)[1:]]
+    real_open_connection = asyncio.open_connection
+    in_flight, peak = [0], [0]
+
+    async def delayed_open_connection(host, port, **kwargs):
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        try:
+            await asyncio.sleep(DELAYS.get(host, 0))
+            return await real_open_connection(host, port, **kwargs)
+        finally:
+            in_flight[0] -= 1
+    monkeypatch.setattr(relays.asyncio, 'open_connection', delayed_open_connection)
+    asyncio.set_event_loop(loop)
+    yield loop, port, peak
+    for server in servers:
+        server.close()
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+def test_parsers():
+    parsed = parse_nord(nord_fixture())
+    assert [relay.name for relay in parsed] == ['de100', 'de101', 'de102', 'nl103', 'de104', 'de105']
+    assert (parsed[0].country, parsed[0].city, parsed[0].load) == ('de', 'Frankfurt', 10)
+    mullvad = parse_mullvad([
+        {'hostname': 'se-got-wg-001', 'ipv4_addr_in': '127.0.0.2', 'country_code': 'se', 'city_name': 'Gothenburg'},
+        {'hostname': 'se-got-wg-002', 'ipv4_addr_in': '127.0.0.3', 'active': False},
+        {'hostname': 'se-got-br-001', 'ipv4_addr_in': None},
+    ])
+    assert [relay.name for relay in mullvad] == ['se-got-wg-001'] and mullvad[0].load is None
+
+
+def test_snapshot_is_refreshed_on_ttl(tmp_path):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        if len(calls) > 1:
+            raise requests.ConnectionError("offline")
+        return nord_fixture()
+
+    catalog = RelayCatalog('nord', ttl=60, snapshot_dir=str(tmp_path), fetch=fetch)
+    assert len(catalog.load()) == 6 and len(calls) == 1
+    assert len(catalog.load()) == 6 and len(calls) == 1
+    old = time.time() - 120
+    os.utime(catalog.snapshot_path, (old, old))
+    # The refresh fails, so the stale snapshot is used instead.
+    assert len(catalog.load()) == 6 and len(calls) == 2
+    os.remove(catalog.snapshot_path)
+    with pytest.raises(ConnectionError, match="Could not download the nord relay list"):
+        catalog.load()
+    with pytest.raises(ValueError, match="No relay list"):
+        RelayCatalog('tor')
+
+
+def test_candidates_filter_by_country_and_load():
+    parsed = parse_nord(nord_fixture())
+    assert [relay.name for relay in candidates(parsed, country='DE', limit=3)] == ['de105', 'de104', 'de102']
+
+
+def test_candidates_without_load_are_spread_across_locations():
+    # API order lists one country's relays first, the way Mullvad's list is sorted.
+    listed = [Relay(f"{country}-{city}-{i}", None, f"10.0.{n}.{i}", country, f"{country}-{city}")
+              for n, (country, city) in enumerate((c, city) for c in ('al', 'at', 'au', 'be', 'br') for city in 'xy')
+              for i in range(20)]
+    picked = candidates(listed, limit=10, rng=random.Random(1))
+    assert len({relay.name for relay in picked}) == 10
+    assert sorted(relay.country for relay in picked) == ['al', 'al', 'at', 'at', 'au', 'au', 'be', 'be', 'br', 'br']
+    assert len({relay.city for relay in picked}) == 10
+    assert len(candidates(listed, limit=500)) == 200
+    in_country = candidates(listed, country='AT', limit=4, rng=random.Random(2))
+    assert sorted(relay.city for relay in in_country) == ['at-x', 'at-x', 'at-y', 'at-y']
+    # Relays with a load still come first, least loaded first.
+    loaded = [Relay('busy', None, '10.1.0.1', 'de', 'Berlin', load=80), Relay('idle', None, '10.1.0.2', 'de', 'Berlin', load=5)]
+    assert [relay.name for relay in candidates(loaded + listed, limit=3)][:2] == ['idle', 'busy']
+
+
+def test_probing_respects_the_concurrency_cap(listeners):
+    loop, port, peak = listeners
+    parsed = parse_nord(nord_fixture())
+    loop.run_until_complete(probe_all(parsed, port=port, timeout=300, concurrency=2))
+    latencies = {relay.address: relay.latency for relay in parsed}
+    assert peak[0] == 2
+    assert latencies['127.0.0.6'] is None and latencies[UNREACHABLE] is None
+    for address in ('127.0.0.2', '127.0.0.3', '127.0.0.4', '127.0.0.5'):
+        assert latencies[address] >= DELAYS[address]
+
+
+def test_ranking_weighs_latency_by_load():
+    fast_busy = Relay('a', 'a', '1', load=90)
+    fast_busy.latency = 0.010
+    slow_idle = Relay('b', 'b', '2', load=0)
+    slow_idle.latency = 0.015
+    down = Relay('c', 'c', '3')
+    assert rank([fast_busy, slow_idle, down], load_weight=1) == [slow_idle, fast_busy]
+    assert rank([fast_busy, slow_idle, down], load_weight=0) == [fast_busy, slow_idle]
+
+
+def test_fastest_relay_is_passed_to_the_provider_cli(listeners, tmp_path, monkeypatch, capsys):
+    loop, port, _ = listeners
+    settings.load(use_cache=False, environ={}, overrides=[f'relays.probe_port={port}', 'relays.probe_timeout_ms=300'])
+    catalog = RelayCatalog('nord', snapshot_dir=str(tmp_path), fetch=nord_fixture)
+    monkeypatch.setattr(relays, 'RelayCatalog', lambda provider: catalog)
+    commands = []
+    monkeypatch.setattr(nord.subprocess, 'run', lambda command, check: commands.append(command))
+    monkeypatch.setattr('anon_framework.utils.runtime.run', loop.run_until_complete)
+
+    ranked = loop.run_until_complete(rank_relays('nord', country='de'))
+    assert [relay.name for relay in ranked] == ['de102', 'de101', 'de100']
+
+    args = argparse.Namespace(provider='nord', vpn_action='connect', server=None, fastest=True, country='de')
+    handle_vpn_command(args)
+    assert commands == [['nordvpn', 'connect', 'de102']]
+    assert 'Fastest relay: de102' in capsys.readouterr().out
@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import time
+import pytest
+from anon_framework.utils import runtime
+from anon_framework.utils.runtime import AsyncFacade, Runtime, get_runtime
+from anon_framework.vpn import nord
+
+DELAY = 0.3
+
+
+@pytest.fixture(autouse=True)
+def fresh_runtime():
+    runtime.shutdown()
+    yield
+    runtime.shutdown()
+
+
+class BlockingTorrents:
+    """Stands in for QBittorrentClient: every call blocks the calling thread."""
+
+    def search(self, query):
+        time.sleep(DELAY)
+        return [query]
+
+    async def native(self):
+        return 'passed through'
+
+
+def test_subsystems_overlap(monkeypatch):
+    # Both blocking calls must be in flight at once, and the loop must keep ticking while they are.
+    both_blocked = threading.Barrier(2, timeout=5)
+    loop_ticked = threading.Event()
+
+    def meet():
+        both_blocked.wait()
+        assert loop_ticked.wait(5)
+
+    class MeetingTorrents:
+        def search(self, query):
+            meet()
+            return [query]
+
+    monkeypatch.setattr(nord.subprocess, 'run', lambda command, check: meet())
+
+    async def join_irc():
+        await asyncio.sleep(0)
+        return 'joined'
+
+    async def ticker():
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+        loop_ticked.set()
+
+    async def workflow():
+        return await get_runtime().gather(
+            nord.NordVPN().connect('us1234'),
+            AsyncFacade(MeetingTorrents()).search('ubuntu'),
+            join_irc(),
+            ticker(),
+        )
+
+    connected, results, joined, _ = runtime.run(workflow())
+    assert (connected, results, joined) == (True, ['ubuntu'], 'joined')
+
+
+@pytest.mark.benchmark
+def test_subsystems_overlap_in_wall_time(monkeypatch):
+    loop_ticks = []
+
+    def slow_run(command, check):
+        time.sleep(DELAY)
+    monkeypatch.setattr(nord.subprocess, 'run', slow_run)
+
+    async def join_irc():
+        await asyncio.sleep(DELAY)
+        return 'joined'
+
+    async def ticker():
+        # The loop must stay responsive while the blocking calls run.
+        for _ in range(5):
+            loop_ticks.append(time.perf_counter())
+            await asyncio.sleep(DELAY / 5)
+
+    async def workflow():
+        return await get_runtime().gather(
+            nord.NordVPN().connect('us1234'),
+            AsyncFacade(BlockingTorrents()).search('ubuntu'),
+            join_irc(),
+            ticker(),
+        )
+
+    start = time.perf_counter()
+    connected, results, joined, _ = runtime.run(workflow())
+    elapsed = time.perf_counter() - start
+    assert (connected, results, joined) == (True, ['ubuntu'], 'joined')
+    worst_tick = max(b - a for a, b in zip(loop_ticks, loop_ticks[1:]))
+    print(f"\nthree {DELAY * 1000:.0f} ms subsystems took {elapsed * 1000:.0f} ms together; "
+          f"worst loop tick {worst_tick * 1000:.0f} ms")
+    # Run one after another these take 3 * DELAY; overlapped they take about one.
+    assert elapsed < 3 * DELAY
+
+
+def test_executor_is_bounded():
+    pool = Runtime(max_workers=2)
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def work():
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+
+    try:
+        pool.run(pool.gather(*(pool.to_thread(work) for _ in range(6))))
+    finally:
+        pool.close()
+    assert peak[0] == 2
+    assert pool.loop.is_closed()
+
+
+def test_facade_passes_coroutines_and_attributes_through():
+    target = BlockingTorrents()
+    target.host = 'localhost'
+    facade = AsyncFacade(target)
+    assert facade.host == 'localhost'
+    assert runtime.run(facade.native()) == 'passed through'
+    assert facade.search.__name__ == 'search'
+
+
+def test_shutdown_cancels_leftover_tasks():
+    shared = get_runtime()
+    cancelled = []
+
+    async def forever():
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def start():
+        asyncio.ensure_future(forever())
+        await asyncio.sleep(0)
+    runtime.run(start())
+    runtime.shutdown()
+    assert cancelled == [True]
+    assert get_runtime() is not shared
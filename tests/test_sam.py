@@ -0,0 +1,244 @@
+import asyncio
+import time
+import pytest
+from anon_framework.services.sam import SAMClient, SAMError, parse_reply
+from tests.conftest import run
+
+TUNNEL_BUILD = 0.3
+
+
+class FakeBridge:
+    """
+    A SAM v3 bridge stand-in. Session creation takes TUNNEL_BUILD seconds, streams echo
+    what they receive, and `forget()` drops a session the way a router restart does.
+    """
+
+    def __init__(self, names=None):
+        self.names = names or {'irc.echelon.i2p': 'ECHODEST~'}
+        self.sessions = {}
+        self.commands = []
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    def forget(self, session_id):
+        self.sessions.pop(session_id, None)
+
+    async def handle(self, reader, writer):
+        try:
+            hello = await reader.readline()
+            assert hello.startswith(b'HELLO VERSION MIN=3.1 MAX=3.3')
+            writer.write(b'HELLO REPLY RESULT=OK VERSION=3.1\n')
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                return
+            topic, fields = ' '.join(line.split()[:2]), dict(word.split('=', 1) for word in line.split()[2:])
+            self.commands.append((topic, fields))
+            if topic == 'NAMING LOOKUP':
+                if fields['NAME'] in self.names:
+                    writer.write(f"NAMING REPLY RESULT=OK NAME={fields['NAME']} VALUE={self.names[fields['NAME']]}\n".encode())
+                else:
+                    writer.write(f"NAMING REPLY RESULT=KEY_NOT_FOUND NAME={fields['NAME']}\n".encode())
+            elif topic == 'SESSION CREATE':
+                await asyncio.sleep(TUNNEL_BUILD)
+                self.sessions[fields['ID']] = writer
+                writer.write(b'SESSION STATUS RESULT=OK DESTINATION=TRANSIENTDEST~\n')
+                # The control socket stays open for the life of the session.
+                while await reader.readline():
+                    pass
+                self.sessions.pop(fields['ID'], None)
+            elif topic == 'STREAM CONNECT':
+                if fields['ID'] not in self.sessions:
+                    writer.write(b'STREAM STATUS RESULT=INVALID_ID MESSAGE="no such session"\n')
+                elif fields['DESTINATION'] != 'ECHODEST~':
+                    writer.write(b'STREAM STATUS RESULT=CANT_REACH_PEER\n')
+                else:
+                    writer.write(b'STREAM STATUS RESULT=OK\n')
+                    while data := await reader.read(65536):
+                        writer.write(data)
+                        await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+def client(port):
+    return SAMClient(host='127.0.0.1', port=port, options=[], timeout=5, lookup_ttl=60)
+
+
+async def echo(reader, writer, payload=b'PING :hello\r\n'):
+    writer.write(payload)
+    await writer.drain()
+    return await reader.readexactly(len(payload))
+
+
+def test_parse_reply():
+    assert parse_reply('STREAM STATUS RESULT=I2P_ERROR MESSAGE="tunnel build failed"\n') == (
+        'STREAM STATUS', {'RESULT': 'I2P_ERROR', 'MESSAGE': 'tunnel build failed'})
+
+
+def test_warm_sessions_skip_tunnel_building():
+    async def scenario():
+        bridge = FakeBridge()
+
+        def creates():
+            return [topic for topic, _ in bridge.commands].count('SESSION CREATE')
+
+        sam = client(await bridge.start())
+        reader, writer = await sam.open_connection('irc.echelon.i2p')
+        assert await echo(reader, writer) == b'PING :hello\r\n'
+        writer.close()
+        assert creates() == 1
+        _, writer = await sam.open_connection('irc.echelon.i2p')
+        writer.close()
+        assert creates() == 1
+
+        prewarmed = client(bridge.server.sockets[0].getsockname()[1])
+        await prewarmed.warm('default', 'dcc')
+        assert creates() == 3
+        _, writer = await prewarmed.open_connection('irc.echelon.i2p', session='dcc')
+        writer.close()
+        assert creates() == 3
+        assert [topic for topic, _ in bridge.commands].count('NAMING LOOKUP') == 2
+        sam.close()
+        prewarmed.close()
+        bridge.server.close()
+
+    run(scenario())
+
+
+@pytest.mark.benchmark
+def test_stream_setup_latency():
+    async def scenario():
+        bridge = FakeBridge()
+        sam = client(await bridge.start())
+        start = time.perf_counter()
+        _, writer = await sam.open_connection('irc.echelon.i2p')
+        cold = time.perf_counter() - start
+        writer.close()
+        start = time.perf_counter()
+        _, writer = await sam.open_connection('irc.echelon.i2p')
+        warm = time.perf_counter() - start
+        writer.close()
+
+        prewarmed = client(bridge.server.sockets[0].getsockname()[1])
+        await prewarmed.warm('default', 'dcc')
+        start = time.perf_counter()
+        _, writer = await prewarmed.open_connection('irc.echelon.i2p', session='dcc')
+        after_warm = time.perf_counter() - start
+        writer.close()
+        sam.close()
+        prewarmed.close()
+        bridge.server.close()
+        return cold, warm, after_warm
+
+    cold, warm, after_warm = run(scenario())
+    print(f"\nSAM stream setup: {cold * 1000:.0f} ms cold, {warm * 1000:.1f} ms on a live session, "
+          f"{after_warm * 1000:.1f} ms after warm()")
+    assert warm < cold and after_warm < cold
+
+
+def test_concurrent_requests_share_sessions_and_lookups():
+    async def scenario():
+        bridge = FakeBridge()
+        sam = client(await bridge.start())
+        streams = await asyncio.gather(*(sam.open_connection('irc.echelon.i2p') for _ in range(10)))
+        for _, writer in streams:
+            writer.close()
+        topics = [topic for topic, _ in bridge.commands]
+        sam.close()
+        bridge.server.close()
+        return topics
+
+    topics = run(scenario())
+    assert topics.count('SESSION CREATE') == 1
+    assert topics.count('NAMING LOOKUP') == 1
+    assert topics.count('STREAM CONNECT') == 10
+
+
+def test_invalid_id_replaces_and_closes_the_stale_session():
+    async def scenario():
+        bridge = FakeBridge()
+        sam = client(await bridge.start())
+        stale = await sam.session()
+        bridge.forget(stale.id)
+        reader, writer = await sam.open_connection('irc.echelon.i2p')
+        assert await echo(reader, writer) == b'PING :hello\r\n'
+        writer.close()
+        fresh = await sam.session()
+        await asyncio.sleep(0.01)
+        result = (stale is not fresh, stale._writer, stale._keepalive.cancelled() or stale._keepalive.done(),
+                  list(bridge.sessions) == [fresh.id])
+        sam.close()
+        bridge.server.close()
+        return result
+
+    assert run(scenario()) == (True, None, True, True)
+
+
+def test_dead_sessions_are_recreated_and_keepalives_answered():
+    async def scenario():
+        bridge = FakeBridge()
+        sam = client(await bridge.start())
+        session = await sam.session()
+        control = bridge.sessions[session.id]
+        control.write(b'PING 12345\n')
+        await asyncio.sleep(0.05)
+        assert session.alive
+        control.close()
+        await asyncio.sleep(0.05)
+        assert not session.alive
+        replacement = await sam.session()
+        sam.close()
+        bridge.server.close()
+        return session is not replacement
+
+    assert run(scenario())
+
+
+def test_errors_carry_the_result_code():
+    async def scenario():
+        bridge = FakeBridge(names={'irc.echelon.i2p': 'ECHODEST~', 'down.i2p': 'DOWNDEST~'})
+        port = await bridge.start()
+        sam = client(port)
+        with pytest.raises(SAMError) as unreachable:
+            await sam.open_connection('down.i2p')
+        with pytest.raises(SAMError) as unknown:
+            await sam.lookup('missing.i2p')
+        assert await sam.lookup('DIRECTDEST~') == 'DIRECTDEST~'
+        sam.close()
+        bridge.server.close()
+        await bridge.server.wait_closed()
+        with pytest.raises(SAMError, match="Is the I2P router running"):
+            await client(port).lookup('irc.echelon.i2p')
+        return unreachable.value.result, unknown.value.result
+
+    assert run(scenario()) == ('CANT_REACH_PEER', 'KEY_NOT_FOUND')
+
+
+def test_forwarder_pipes_local_connections_over_streams():
+    async def scenario():
+        bridge = FakeBridge()
+        sam = client(await bridge.start())
+        server = await sam.forward('irc.echelon.i2p', 6667)
+        port = server.sockets[0].getsockname()[1]
+        results = []
+        for _ in range(2):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            results.append(await echo(reader, writer, b'NICK anon\r\n' * 1000))
+            writer.close()
+        server.close()
+        await server.wait_closed()
+        with pytest.raises(OSError):
+            await asyncio.open_connection('127.0.0.1', port)
+        ports = [fields.get('TO_PORT') for topic, fields in bridge.commands if topic == 'STREAM CONNECT']
+        sam.close()
+        bridge.server.close()
+        return results, ports
+
+    results, ports = run(scenario())
+    assert results == [b'NICK anon\r\n' * 1000] * 2
+    assert ports == ['6667', '6667']
@@ -0,0 +1,116 @@
+import argparse
+import gc
+import time
+import tracemalloc
+import pytest
+from anon_framework.main import refine_results
+from anon_framework.services.search_results import ResultSet, infohash_from_url, normalize_name
+from tests.qbittorrent_stub import make_result
+
+ROWS = 100000
+
+
+def sample():
+    return [
+        {'fileName': 'Ubuntu 24.04 Desktop', 'fileSize': 6 << 30, 'nbSeeders': 900, 'nbLeechers': 40,
+         'fileUrl': 'magnet:?xt=urn:btih:aaaa', 'siteUrl': 'https://one.example'},
+        {'fileName': 'ubuntu.24.04.desktop', 'fileSize': 6 << 30, 'nbSeeders': 50, 'nbLeechers': 4,
+         'fileUrl': 'magnet:?xt=urn:btih:AAAA&dn=ubuntu', 'siteUrl': 'https://two.example'},
+        {'fileName': 'Debian 12 netinst', 'fileSize': 600 << 20, 'nbSeeders': 300, 'nbLeechers': 900,
+         'fileUrl': 'https://three.example/debian.torrent', 'siteUrl': 'https://three.example'},
+        {'fileName': 'Fedora 40', 'fileSize': -1, 'nbSeeders': -1, 'nbLeechers': None,
+         'fileUrl': 'magnet:?xt=urn:btih:ffff', 'engineName': 'four'},
+    ]
+
+
+def test_columns_and_rows_round_trip():
+    results = ResultSet.from_results(sample())
+    assert len(results) == 4
+    assert list(results.seeders) == [900, 50, 300, 0]
+    assert results.sizes[3] == 0 and results.sources[3] == 'four'
+    assert [row['infohash'] for row in results] == ['AAAA', 'AAAA', None, 'FFFF']
+    appended = ResultSet()
+    for res in sample():
+        appended.append(res)
+    assert list(appended.rows()) == list(results.rows())
+    # Counts are 64-bit on every platform ('l' is 32-bit on Windows).
+    assert {results.sizes.typecode, results.seeders.typecode, results.leechers.typecode} == {'q'}
+    appended.append(dict(sample()[0], nbSeeders=1 << 40))
+    assert appended.take([4]).seeders[0] == 1 << 40
+
+
+def test_filter_sort_top_and_scores():
+    results = ResultSet.from_results(sample())
+    assert results.filter() is results
+    assert results.filter(min_seeds=100, name_contains='UBUNTU').names == ['Ubuntu 24.04 Desktop']
+    assert results.filter(max_size=1 << 30).names == ['Debian 12 netinst', 'Fedora 40']
+    assert list(results.sort('seeds').seeders) == [900, 300, 50, 0]
+    assert results.sort('name', descending=False).names[0] == 'Debian 12 netinst'
+    assert results.top(1, key='score', leechers_weight=1.0).names == ['Debian 12 netinst']
+    assert results.top(2, key='name').names == ['Debian 12 netinst', 'Fedora 40']
+    assert list(results.scores(seeds_weight=1, leechers_weight=0)) == [900.0, 50.0, 300.0, 0.0]
+    with pytest.raises(ValueError, match="Unknown sort key"):
+        results.sort('date')
+
+
+def test_dedup_keeps_the_best_seeded_copy():
+    results = ResultSet.from_results(sample())
+    assert list(results.dedup('infohash').seeders) == [900, 300, 0]
+    assert normalize_name('ubuntu.24.04.desktop') == normalize_name('Ubuntu 24.04 Desktop')
+    assert results.dedup('name').names == ['Ubuntu 24.04 Desktop', 'Debian 12 netinst', 'Fedora 40']
+    assert infohash_from_url('https://example/x.torrent') is None
+    with pytest.raises(ValueError, match="Unknown dedup key"):
+        results.dedup('size')
+
+
+def test_refine_results_applies_cli_options():
+    args = argparse.Namespace(dedup='infohash', min_seeds=100, sort=None, top=None)
+    assert refine_results(sample(), args).names == ['Ubuntu 24.04 Desktop', 'Debian 12 netinst']
+    args = argparse.Namespace(dedup=None, min_seeds=None, sort='size', top=None)
+    assert refine_results(sample(), args).sizes[0] == 6 << 30
+    args = argparse.Namespace(dedup=None, min_seeds=None, sort='leechers', top=1)
+    assert refine_results(sample(), args).names == ['Debian 12 netinst']
+
+
+def retained(build):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        built = build()
+        return built, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def test_100k_rows():
+    raw = [make_result(i) for i in range(ROWS)]
+    # The list-of-dicts baseline keeps a copy of every result dict, as the old code path did.
+    dicts, dict_bytes = retained(lambda: [dict(res) for res in raw])
+    columns, column_bytes = retained(lambda: ResultSet.from_results(raw))
+    expected = sorted(
+        {(res['fileUrl'], res['nbSeeders']): res for res in dicts if res['nbSeeders'] >= 100}.values(),
+        key=lambda res: res['nbSeeders'], reverse=True)
+    best = columns.dedup('infohash').filter(min_seeds=100).top(100)
+    assert column_bytes < dict_bytes
+    assert len(best) == 100
+    assert best.seeders[0] == expected[0]['nbSeeders'] == 499
+    assert len(set(best.infohashes)) == 100
+
+
+@pytest.mark.benchmark
+def test_100k_rows_benchmark():
+    raw = [make_result(i) for i in range(ROWS)]
+    dicts, dict_bytes = retained(lambda: [dict(res) for res in raw])
+    columns, column_bytes = retained(lambda: ResultSet.from_results(raw))
+
+    start = time.perf_counter()
+    sorted({(res['fileUrl'], res['nbSeeders']): res for res in dicts if res['nbSeeders'] >= 100}.values(),
+           key=lambda res: res['nbSeeders'], reverse=True)
+    dict_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    columns.dedup('infohash').filter(min_seeds=100).top(100)
+    column_seconds = time.perf_counter() - start
+
+    print(f"\n{ROWS} rows: dicts {dict_bytes / 1e6:.1f} MB, columns {column_bytes / 1e6:.1f} MB; "
+          f"dedup+filter+top100 {column_seconds * 1000:.0f} ms (dict sort+dedup {dict_seconds * 1000:.0f} ms)")
@@ -0,0 +1,147 @@
+import json
+import os
+import time
+import pytest
+from anon_framework.config import settings
+from anon_framework.config.settings import ConfigError
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    system = tmp_path / 'system.json'
+    user = tmp_path / 'user.json'
+    monkeypatch.setattr(settings, 'SYSTEM_CONFIG_PATH', str(system))
+    monkeypatch.setattr(settings, 'USER_CONFIG_PATH', str(user))
+    monkeypatch.setattr(settings, 'CACHE_PATH', str(tmp_path / 'cache' / 'config.cache'))
+    return system, user
+
+
+def test_defaults_without_any_source(files):
+    _, user = files
+    config = settings.load(use_cache=False, environ={})
+    assert config == settings.defaults()
+
+
+def test_layers_apply_in_order(files):
+    system, user = files
+    system.write_text(json.dumps({'tor': {'socks_port': 9150, 'dns_port': 9154}, 'qbittorrent': {'host': 'nas'}}))
+    user.write_text(json.dumps({'tor': {'socks_port': 9250}}))
+    config = settings.load(
+        use_cache=False,
+        environ={'ANON_TOR_SOCKS_PORT': '9350', 'ANON_QBITTORRENT_PORT': '8081', 'HOME': '/ignored'},
+        overrides=['qbittorrent.port=8082'],
+    )
+    assert config['tor']['dns_port'] == 9154
+    assert config['tor']['socks_port'] == 9350
+    assert config['qbittorrent']['host'] == 'nas'
+    assert config['qbittorrent']['port'] == 8082
+    assert settings.get_config() is config
+
+
+def test_env_prefers_the_longest_section():
+    layer = settings._env_layer({'ANON_TOR_BROWSER_BINARY': '/opt/tb/firefox', 'ANON_TOR_SERVICE': 'tor@default'})
+    assert layer == {'tor_browser': {'binary': '/opt/tb/firefox'}, 'tor': {'service': 'tor@default'}}
+
+
+def test_env_ignores_unrelated_variables_and_warns_about_typos(capsys):
+    layer = settings._env_layer({'ANON_TOR_SOCKSPORT': '1', 'ANON_NOPE_KEY': '1', 'ANON_TOR': '1',
+                                 'ANON_TOR_SOCKS_PORT': '9350'})
+    assert layer == {'tor': {'socks_port': '9350'}}
+    warnings = capsys.readouterr().err.splitlines()
+    assert len(warnings) == 1 and 'ANON_TOR_SOCKSPORT' in warnings[0]
+
+
+def test_explicit_config_file_must_exist(files, tmp_path):
+    with pytest.raises(ConfigError, match="config file not found"):
+        settings.load(config_file=str(tmp_path / 'typo.json'), use_cache=False, environ={})
+
+
+def test_unreadable_config_file_is_a_config_error(files, tmp_path):
+    # A directory stands in for an unreadable file; permission bits do not stop root.
+    with pytest.raises(ConfigError, match="cannot read the file"):
+        settings.load(config_file=str(tmp_path), use_cache=False, environ={})
+
+
+def test_env_values_are_coerced(files):
+    _, user = files
+    config = settings.load(use_cache=False, environ={
+        'ANON_TOR_BROWSER_PREWARM': 'yes',
+        'ANON_KILLSWITCH_ALLOWED_PORTS': '[51820, 1194]',
+    })
+    assert config['tor_browser']['prewarm'] is True
+    assert config['killswitch']['allowed_ports'] == [51820, 1194]
+
+
+@pytest.mark.parametrize('layer, message', [
+    ({'tor': {'socks_port': 'x'}}, "must be of type int"),
+    ({'tor': {'socksport': 1}}, "unknown setting 'tor.socksport'"),
+    ({'nope': {}}, "unknown section 'nope'"),
+    ({'tor': 5}, "must be an object"),
+])
+def test_schema_validation(files, layer, message):
+    _, user = files
+    user.write_text(json.dumps(layer))
+    with pytest.raises(ConfigError, match=message):
+        settings.load(use_cache=False, environ={})
+
+
+def test_bad_overrides_are_rejected(files):
+    _, user = files
+    with pytest.raises(ConfigError, match="expected SECTION.KEY=VALUE"):
+        settings.load(use_cache=False, environ={}, overrides=['tor.socks_port'])
+    with pytest.raises(ConfigError, match="invalid JSON"):
+        user.write_text('{')
+        settings.load(use_cache=False, environ={})
+
+
+def test_cache_is_invalidated_by_mtime(files):
+    _, user = files
+    user.write_text(json.dumps({'tor': {'socks_port': 9150}}))
+    assert settings.load(environ={})['tor']['socks_port'] == 9150
+    assert os.path.exists(settings.CACHE_PATH)
+    user.write_text(json.dumps({'tor': {'socks_port': 9151}}))
+    stat = os.stat(user)
+    os.utime(user, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert settings.load(environ={})['tor']['socks_port'] == 9151
+
+
+def test_cache_ignores_a_corrupt_snapshot(files):
+    _, user = files
+    os.makedirs(os.path.dirname(settings.CACHE_PATH))
+    with open(settings.CACHE_PATH, 'wb') as f:
+        f.write(b'\x00garbage')
+    assert settings.load(environ={}) == settings.defaults()
+
+
+def test_cached_load_skips_reading_the_files(files, monkeypatch):
+    system, user = files
+    system.write_text(json.dumps({'irc': {'servers': [{'name': 'net0', 'host': 'irc0.example', 'port': 6697}]}}))
+    user.write_text(json.dumps({'tor': {'socks_port': 9150}}))
+    uncached = settings.load(use_cache=False, environ={})
+    settings.load(environ={})
+    reads = []
+    read_file = settings._read_file
+    monkeypatch.setattr(settings, '_read_file', lambda path: reads.append(path) or read_file(path))
+    assert settings.load(environ={}) == uncached
+    assert reads == []
+
+
+@pytest.mark.benchmark
+def test_cached_load_is_faster(files):
+    system, user = files
+    system.write_text(json.dumps({'irc': {'servers': [{'name': f"net{i}", 'host': f"irc{i}.example", 'port': 6697}
+                                                      for i in range(200)]}}))
+    user.write_text(json.dumps({'tor': {'socks_port': 9150}}))
+
+    def best_of(use_cache, rounds=50):
+        best = float('inf')
+        for _ in range(rounds):
+            start = time.perf_counter()
+            settings.load(use_cache=use_cache, environ={})
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    settings.load(environ={})
+    cold, warm = best_of(False), best_of(True)
+    print(f"\nconfig load: {cold * 1e6:.0f} us uncached, {warm * 1e6:.0f} us cached")
+    assert warm < cold
@@ -0,0 +1,159 @@
+import asyncio
+import shutil
+import subprocess
+import sys
+import time
+import pytest
+from anon_framework.utils import systemd
+from anon_framework.utils.systemd import BusUnavailable, ServiceError, ServiceManager
+from tests.conftest import run
+
+pytest.importorskip('dbus_next')
+DELAY = 0.02
+
+BUS_CONFIG = """<!DOCTYPE busconfig PUBLIC "-//freedesktop//DTD D-BUS Bus Configuration 1.0//EN"
+ "http://www.freedesktop.org/standards/dbus/1.0/busconfig.dtd">
+<busconfig>
+  <type>session</type>
+  <listen>unix:path={path}</listen>
+  <policy context="default">
+    <allow send_destination="*" eavesdrop="true"/>
+    <allow eavesdrop="true"/>
+    <allow own="*"/>
+  </policy>
+</busconfig>
+"""
+
+
+class RecordingConsole:
+    def __init__(self):
+        self.lines = []
+
+    def noise(self, text, **fields):
+        self.lines.append(text)
+
+
+@pytest.fixture
+def bus(tmp_path):
+    """A private bus with the systemd stub registered on it."""
+    if shutil.which('dbus-daemon') is None:
+        pytest.skip('dbus-daemon is not installed')
+    config = tmp_path / 'bus.conf'
+    config.write_text(BUS_CONFIG.format(path=tmp_path / 'bus'))
+    daemon = subprocess.Popen(['dbus-daemon', '--nofork', '--print-address', f'--config-file={config}'],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    address = daemon.stdout.readline().strip()
+    stub = subprocess.Popen([sys.executable, '-m', 'tests.systemd_stub', address, str(DELAY)], stdout=subprocess.PIPE, text=True)
+    try:
+        assert stub.stdout.readline().strip() == 'ready'
+        yield address
+    finally:
+        for process in (stub, daemon):
+            process.terminate()
+            process.wait()
+
+
+def test_start_and_stop_wait_for_the_unit_state(bus):
+    async def scenario():
+        manager = ServiceManager(backend='dbus', bus_address=bus)
+        try:
+            start = time.perf_counter()
+            assert await manager.start('tor.service') == 'active'
+            elapsed = time.perf_counter() - start
+            assert await manager.active_state('tor.service') == 'active'
+            assert await manager.stop('tor.service') == 'inactive'
+            assert await manager.active_state('tor.service') == 'inactive'
+            return elapsed
+        finally:
+            await manager.close()
+
+    elapsed = run(scenario())
+    # The job finishes after DELAY and the unit settles DELAY later; start() only returns once both happened.
+    assert elapsed >= 2 * DELAY
+
+
+def test_failed_jobs_raise(bus):
+    async def scenario():
+        manager = ServiceManager(backend='dbus', bus_address=bus)
+        try:
+            with pytest.raises(ServiceError, match="StartUnit broken.service: job failed"):
+                await manager.start('broken.service')
+        finally:
+            await manager.close()
+    run(scenario())
+
+
+def test_concurrent_jobs_share_one_connection(bus):
+    async def scenario():
+        manager = ServiceManager(backend='dbus', bus_address=bus)
+        opened = []
+        backend = manager.backend
+        open_bus = backend._open
+
+        async def counting_open():
+            opened.append(1)
+            return await open_bus()
+        backend._open = counting_open
+        try:
+            states = await asyncio.gather(*(manager.start(f"unit{i}.service") for i in range(20)))
+            peak = await backend._call(systemd.SYSTEMD, systemd.SYSTEMD_PATH, 'org.freedesktop.DBus.Properties', 'Get',
+                                       'ss', ['org.freedesktop.systemd1.Manager', 'PeakJobs'])
+            return states, len(opened), peak[0].value
+        finally:
+            await manager.close()
+
+    states, opened, peak = run(scenario())
+    assert states == ['active'] * 20
+    # One bus connection, and all twenty jobs were queued before the first one finished.
+    assert opened == 1 and peak == 20
+
+
+@pytest.mark.benchmark
+def test_concurrent_job_latency(bus):
+    async def scenario():
+        manager = ServiceManager(backend='dbus', bus_address=bus)
+        try:
+            await manager.start('warmup.service')
+            start = time.perf_counter()
+            await asyncio.gather(*(manager.start(f"unit{i}.service") for i in range(20)))
+            elapsed = time.perf_counter() - start
+            round_trips = []
+            for _ in range(20):
+                begin = time.perf_counter()
+                await manager.active_state('tor.service')
+                round_trips.append(time.perf_counter() - begin)
+            return elapsed, sorted(round_trips)[10]
+        finally:
+            await manager.close()
+
+    elapsed, round_trip = run(scenario())
+    print(f"\n20 concurrent starts: {elapsed * 1000:.0f} ms; property read over the bus: {round_trip * 1000:.2f} ms")
+    # Serially these would take 20 * 2 * DELAY.
+    assert elapsed < 10 * DELAY
+
+
+def test_auto_falls_back_to_systemctl(monkeypatch):
+    calls = []
+
+    async def fake_systemctl(self, *args, sudo=True):
+        calls.append(args)
+        return '', '', 0
+
+    monkeypatch.setattr(systemd.CLIBackend, '_systemctl', fake_systemctl)
+    console = RecordingConsole()
+
+    async def scenario():
+        manager = ServiceManager(backend='auto', bus_address='unix:path=/nonexistent/bus', console=console)
+        assert await manager.start('tor.service') == 'active'
+        assert manager.dbus is None
+        assert await manager.stop('tor.service') == 'inactive'
+
+        strict = ServiceManager(backend='dbus', bus_address='unix:path=/nonexistent/bus')
+        with pytest.raises(BusUnavailable, match="Cannot connect to the system bus"):
+            await strict.start('tor.service')
+
+    run(scenario())
+    assert calls == [('start', 'tor.service'), ('stop', 'tor.service')]
+    assert 'falling back to systemctl' in console.lines[0]
+    with pytest.raises(ValueError, match="Unknown service backend"):
+        ServiceManager(backend='upstart')
@@ -0,0 +1,208 @@
+import os
+import stat
+import sys
+import time
+import pytest
+from anon_framework.services import tor_browser
+from anon_framework.services.tor_browser import STAMP_NAME, TorBrowserService, clone_profile
+
+# A stand-in browser: records its arguments, then idles until terminated.
+FAKE_BROWSER = f"""#!{sys.executable}
+import os, sys, time
+profile = sys.argv[sys.argv.index('--profile') + 1]
+with open(os.path.join(profile, 'launched-' + str(os.getpid())), 'w') as f:
+    f.write(' '.join(sys.argv[1:]))
+time.sleep(3600)
+"""
+
+
+@pytest.fixture
+def bundle(tmp_path):
+    binary = tmp_path / 'firefox'
+    binary.write_text(FAKE_BROWSER)
+    binary.chmod(binary.stat().st_mode | stat.S_IXUSR)
+    template = tmp_path / 'profile.default'
+    (template / 'extensions').mkdir(parents=True)
+    for i in range(200):
+        (template / f"cache-{i}.sqlite").write_bytes(os.urandom(2048))
+    (template / 'extensions' / 'torbutton.xpi').write_bytes(os.urandom(1 << 20))
+    (template / 'prefs.js').write_text('user_pref("x", 1);\n')
+    ram = tmp_path / 'ram'
+    ram.mkdir()
+    return str(binary), str(template), str(ram)
+
+
+def launched_args(profile_dir, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        found = [name for name in os.listdir(profile_dir) if name.startswith('launched-')]
+        if found:
+            with open(os.path.join(profile_dir, found[0])) as f:
+                return f.read().split()
+        time.sleep(0.01)
+    raise AssertionError(f"browser never started in {profile_dir}")
+
+
+def test_clone_hardlinks_immutable_files_and_copies_the_rest(bundle, tmp_path):
+    _, template, _ = bundle
+    target = tmp_path / 'clone'
+    open(os.path.join(template, STAMP_NAME), 'w').close()
+    clone_profile(template, str(target))
+    xpi = os.path.join('extensions', 'torbutton.xpi')
+    assert os.stat(target / xpi).st_ino == os.stat(os.path.join(template, xpi)).st_ino
+    assert os.stat(target / 'prefs.js').st_ino != os.stat(os.path.join(template, 'prefs.js')).st_ino
+    assert not (target / STAMP_NAME).exists()
+
+
+def test_session_startup_and_teardown(bundle):
+    binary, template, ram = bundle
+    service = TorBrowserService(binary=binary, template_profile=template, ram_dir=ram, prewarm=False)
+    cold = service.launch()
+    warm = service.launch()
+    assert launched_args(cold.profile_dir)[:3] == ['--no-remote', '--profile', cold.profile_dir]
+    assert cold.profile_dir != warm.profile_dir and cold.is_running()
+    cold.close()
+    warm.close()
+    assert not os.path.exists(cold.profile_dir) and not cold.is_running()
+    assert os.listdir(ram) == [f"anon-tb-template-{tor_browser.getpass.getuser()}"]
+    service.shutdown(clear_template=True)
+    assert os.listdir(ram) == []
+
+
+@pytest.mark.benchmark
+def test_launch_latency(bundle):
+    binary, template, ram = bundle
+    service = TorBrowserService(binary=binary, template_profile=template, ram_dir=ram, prewarm=False)
+    start = time.perf_counter()
+    cold = service.launch()
+    cold_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    staged = service.launch()
+    staged_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    cold.close()
+    teardown_seconds = time.perf_counter() - start
+    staged.close()
+
+    prewarmed = TorBrowserService(binary=binary, template_profile=template, ram_dir=ram, prewarm=True)
+    prewarmed.prewarm(spawn=True).join()
+    start = time.perf_counter()
+    session = prewarmed.launch()
+    warm_seconds = time.perf_counter() - start
+    session.close()
+    prewarmed.shutdown()
+    service.shutdown(clear_template=True)
+    print(f"\nlaunch: {cold_seconds * 1000:.1f} ms first (stages template), {staged_seconds * 1000:.1f} ms after, "
+          f"{warm_seconds * 1000:.2f} ms from a pre-spawned browser; teardown {teardown_seconds * 1000:.1f} ms")
+
+
+def test_template_is_restaged_when_it_changes(bundle):
+    binary, template, ram = bundle
+    service = TorBrowserService(binary=binary, template_profile=template, ram_dir=ram, prewarm=False)
+    staged = service._stage_template()
+    assert not os.path.exists(os.path.join(staged, 'new.js'))
+    with open(os.path.join(template, 'new.js'), 'w') as f:
+        f.write('1')
+    st = os.stat(template)
+    os.utime(template, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert os.path.exists(os.path.join(service._stage_template(), 'new.js'))
+
+
+def test_prewarmed_session_is_reused(bundle):
+    binary, template, ram = bundle
+    service = TorBrowserService(binary=binary, template_profile=template, ram_dir=ram, prewarm=True)
+    service.prewarm(spawn=True).join()
+    profile_dir, process = service._warm
+    session = service.launch()
+    assert (session.profile_dir, session.process) == (profile_dir, process)
+    session.close()
+    service.shutdown(clear_template=True)
+    assert service._warm is None and service._prewarm_thread is None
+
+
+def test_extra_args_restart_a_prespawned_browser(bundle):
+    binary, template, ram = bundle
+    service = TorBrowserService(binary=binary, template_profile=template, ram_dir=ram, prewarm=False)
+    service.prewarm(spawn=True).join()
+    profile_dir, prespawned = service._warm
+    launched_args(profile_dir)
+    session = service.launch(extra_args=['https://check.torproject.org'])
+    try:
+        assert prespawned.poll() is not None
+        assert session.profile_dir == profile_dir and session.process is not prespawned
+        runs = {}
+        deadline = time.monotonic() + 5
+        while len(runs) < 2 and time.monotonic() < deadline:
+            for name in os.listdir(profile_dir):
+                if name.startswith('launched-'):
+                    with open(os.path.join(profile_dir, name)) as f:
+                        runs[name] = f.read()
+            time.sleep(0.01)
+        assert runs[f"launched-{session.process.pid}"].endswith('https://check.torproject.org')
+    finally:
+        session.close()
+        service.shutdown(clear_template=True)
+
+
+def test_only_one_prewarm_thread_runs(bundle, monkeypatch):
+    binary, template, ram = bundle
+    service = TorBrowserService(binary=binary, template_profile=template, ram_dir=ram, prewarm=False)
+    real_new_profile = service._new_profile
+    calls = []
+
+    def slow_new_profile():
+        calls.append(1)
+        time.sleep(0.2)
+        return real_new_profile()
+    monkeypatch.setattr(service, '_new_profile', slow_new_profile)
+    threads = {service.prewarm() for _ in range(5)}
+    assert len(threads) == 1
+    service.shutdown(clear_template=True)
+    assert calls == [1]
+    assert service._warm is None
+    assert [name for name in os.listdir(ram) if name.startswith('anon-tb-session-')] == []
+
+
+def plant(ram, template, mode=0o700, uid=None):
+    """Creates a staging directory the way another user could, with a matching stamp and hostile prefs."""
+    planted = os.path.join(ram, f"anon-tb-template-{tor_browser.getpass.getuser()}")
+    os.mkdir(planted)
+    with open(os.path.join(planted, STAMP_NAME), 'w') as f:
+        f.write(str(os.stat(template).st_mtime_ns))
+    with open(os.path.join(planted, 'prefs.js'), 'w') as f:
+        f.write('user_pref("network.proxy.type", 0);\n')
+    if uid is not None:
+        os.chown(planted, uid, -1)
+    os.chmod(planted, mode)
+    return planted
+
+
+@pytest.mark.parametrize('owner', ['other-user', 'loose-mode'])
+def test_planted_staging_directory_is_never_trusted(bundle, owner):
+    binary, template, ram = bundle
+    if owner == 'other-user':
+        if os.getuid() != 0:
+            pytest.skip("needs root to create a directory owned by another user")
+        planted = plant(ram, template, uid=65534)
+    else:
+        planted = plant(ram, template, mode=0o777)
+    service = TorBrowserService(binary=binary, template_profile=template, ram_dir=ram, prewarm=False)
+    staged = service._stage_template()
+    assert staged != planted and os.path.dirname(staged) == ram
+    assert stat.S_IMODE(os.stat(staged).st_mode) == 0o700
+    session = service.launch()
+    with open(os.path.join(session.profile_dir, 'prefs.js')) as f:
+        assert f.read() == 'user_pref("x", 1);\n'
+    session.close()
+    # The planted directory is left alone, and clearing the template only removes ours.
+    service.shutdown(clear_template=True)
+    assert os.path.isdir(planted) and not os.path.exists(staged)
+
+
+def test_runtime_dir_is_preferred(tmp_path, monkeypatch):
+    runtime = tmp_path / 'run'
+    runtime.mkdir(mode=0o700)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(runtime))
+    assert tor_browser._default_ram_dir() == str(runtime)
+    runtime.chmod(0o755)
+    assert tor_browser._default_ram_dir() != str(runtime)
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+import pytest
+from anon_framework.services.qbittorrent import QBittorrentClient
+from anon_framework.services.torrent_monitor import TorrentMirror, TorrentState
+from tests.conftest import run
+from tests.qbittorrent_stub import QBittorrentStub
+
+POLLS = 10
+
+
+@pytest.fixture(scope='module')
+def stub():
+    with QBittorrentStub(torrents=10000) as stub:
+        yield stub
+
+
+def test_mirror_polls_only_fetch_changes(stub):
+    client = QBittorrentClient(port=stub.port)
+    mirror = TorrentMirror(client)
+    seen = len(stub.requests)
+    assert mirror.poll()
+    assert len(mirror.torrents) == 10000
+    for _ in range(3):
+        stub.tick(0.01)
+        mirror.poll()
+    assert [path for _, path, _ in stub.requests[seen:]] == ['/api/v2/sync/maindata'] * 4
+    for torrent_hash, state in mirror.torrents.items():
+        assert state.progress == stub.torrents[torrent_hash]['progress']
+
+
+@pytest.mark.benchmark
+def test_mirror_uses_less_bandwidth_and_cpu_than_full_polling(stub):
+    client = QBittorrentClient(port=stub.port)
+
+    def measure(poll):
+        stub.bytes_sent = 0
+        cpu = 0.0
+        for _ in range(POLLS):
+            stub.tick(0.01)
+            start = time.thread_time()
+            poll()
+            cpu += time.thread_time() - start
+        return stub.bytes_sent, cpu
+
+    full_torrents = {}
+
+    def full_poll():
+        full_torrents.clear()
+        for torrent in client._request('GET', '/api/v2/torrents/info').json():
+            full_torrents[torrent['hash']] = torrent
+
+    mirror = TorrentMirror(client)
+    assert mirror.poll()
+    assert len(mirror.torrents) == 10000
+
+    full_bytes, full_cpu = measure(full_poll)
+    delta_bytes, delta_cpu = measure(mirror.poll)
+    print(f"\n{POLLS} polls of 10k torrents: full {full_bytes / 1e6:.1f} MB / {full_cpu * 1000:.0f} ms CPU, "
+          f"sync {delta_bytes / 1e6:.2f} MB / {delta_cpu * 1000:.0f} ms CPU")
+    assert delta_bytes * 20 < full_bytes
+    assert delta_cpu < full_cpu
+
+
+def test_subscribers_see_changes_and_removals(stub):
+    mirror = TorrentMirror(QBittorrentClient(port=stub.port))
+    mirror.poll()
+    events = []
+    unsubscribe = mirror.subscribe(lambda *lists: events.append(lists))
+    stub.tick(0.001)
+    gone = next(iter(stub.torrents))
+    stub.remove(gone)
+    mirror.poll()
+    added, changed, removed = events[-1]
+    assert added == [] and removed == [gone]
+    assert 0 < len(changed) <= 10
+    unsubscribe()
+    stub.tick(0.001)
+    mirror.poll()
+    assert len(events) == 1
+
+
+def test_watch_applies_deltas_and_calls_subscribers_on_the_loop(stub):
+    mirror = TorrentMirror(QBittorrentClient(port=stub.port))
+    callers = []
+    mirror.subscribe(lambda *lists: callers.append(threading.get_ident()))
+
+    async def scenario():
+        stop = asyncio.Event()
+
+        def changed(*lists):
+            stop.set()  # stop after the first delta
+
+        mirror.subscribe(changed)
+        await asyncio.wait_for(mirror.watch(interval=0.01, stop_event=stop), 5)
+        return threading.get_ident()
+
+    loop_thread = run(scenario())
+    assert callers == [loop_thread] and len(mirror.torrents) == len(stub.torrents)
+
+
+def test_full_update_reports_survivors_as_changed():
+    mirror = TorrentMirror(client=None)
+    mirror.apply({'rid': 1, 'full_update': True, 'torrents': {'a': {'name': 'A'}, 'b': {'name': 'B'}}})
+    added, changed, removed = mirror.apply({'rid': 2, 'full_update': True, 'torrents': {'b': {'name': 'B'}, 'c': {}}})
+    assert (added, changed, removed) == (['c'], ['b'], ['a'])
+    assert mirror.rid == 2
+
+
+def test_state_keeps_only_tracked_fields():
+    state = TorrentState('abc')
+    assert state.update({'name': 'x', 'save_path': '/srv', 'tracker': 'udp://t'})
+    assert not state.update({'name': 'x'})
+    assert not hasattr(state, '__dict__')
+    assert state.as_dict()['name'] == 'x' and 'save_path' not in state.as_dict()
+
+
+def test_bulk_actions_are_single_requests(stub):
+    mirror = TorrentMirror(QBittorrentClient(port=stub.port))
+    hashes = ['a' * 40, 'b' * 40, 'c' * 40]
+    stub.requests.clear()
+    assert mirror.pause(hashes)
+    assert mirror.resume(hashes)
+    assert mirror.add(['magnet:?xt=urn:btih:1', 'magnet:?xt=urn:btih:2'], category='linux')
+    assert [(path, form.get('hashes') or form.get('urls')) for _, path, form in stub.requests] == [
+        ('/api/v2/torrents/pause', '|'.join(hashes)),
+        ('/api/v2/torrents/resume', '|'.join(hashes)),
+        ('/api/v2/torrents/add', 'magnet:?xt=urn:btih:1\nmagnet:?xt=urn:btih:2'),
+    ]
@@ -0,0 +1,98 @@
+import asyncio
+import fcntl
+import json
+import os
+import pty
+import struct
+import subprocess
+import sys
+import termios
+import threading
+import pytest
+from anon_framework.services.communication.irc import IRCClient
+
+pytest.importorskip('curses')
+from anon_framework.services.communication.tui import SERVER_COMMANDS, TerminalUI, wrap
+from tests.conftest import run
+from tests.tui_flood import FRAME_RATE, MEMBERS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COLUMNS, ROWS = 160, 50
+SECONDS, RATE = 2, 1000
+
+
+def flood_in_pty(tmp_path, mode):
+    """Runs tests.tui_flood on a 160x50 pty and returns its measurements and the bytes it wrote."""
+    master, slave = pty.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack('HHHH', ROWS, COLUMNS, 0, 0))
+    result_path = tmp_path / f"{mode}.json"
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'tests.tui_flood', str(tmp_path), str(result_path), mode, str(SECONDS), str(RATE)],
+        stdin=slave, stdout=slave, stderr=slave, cwd=ROOT, start_new_session=True,
+        env=dict(os.environ, TERM='xterm-256color'))
+    os.close(slave)
+    output = bytearray()
+
+    def drain():
+        while True:
+            try:
+                data = os.read(master, 65536)
+            except OSError:
+                return
+            if not data:
+                return
+            output.extend(data)
+
+    reader = threading.Thread(target=drain, daemon=True)
+    reader.start()
+    process.wait(timeout=60)
+    reader.join(timeout=5)
+    os.close(master)
+    assert result_path.exists(), output.decode('utf-8', 'replace')[-2000:]
+    return json.loads(result_path.read_text()), bytes(output)
+
+
+def test_wrap():
+    assert wrap('abcdefg', 3) == ['abc', 'def', 'g']
+    assert wrap('', 3) == [''] and wrap('ab\ncd', 5) == ['ab', 'cd'] and wrap('x', 0) == []
+
+
+def test_flood_is_coalesced_at_the_frame_cap(tmp_path):
+    tui, _ = flood_in_pty(tmp_path, 'tui')
+    assert tui['sent'] == tui['total']
+    assert tui['bottom'] == f"<User{(tui['total'] - 1) % MEMBERS}> flood message {tui['total'] - 1:06d}"
+    # The first frame goes out immediately; after that at most FRAME_RATE a second.
+    assert tui['frames'] <= FRAME_RATE * (SECONDS + 0.2) + 2
+    assert tui['coalesced'] >= tui['sent'] - tui['frames'] * 2
+
+
+@pytest.mark.benchmark
+def test_flood_cost_against_repainting_per_message(tmp_path):
+    tui, output = flood_in_pty(tmp_path, 'tui')
+    naive, _ = flood_in_pty(tmp_path, 'naive')
+    print(f"\n{RATE} msg/s for {SECONDS} s on {COLUMNS}x{ROWS}: "
+          f"tui {tui['sent']}/{tui['total']} sent in {tui['frames']} frames, {tui['frame_ms']:.2f} ms/frame, "
+          f"{tui['cpu']:.2f} s CPU, p99 lag {tui['lag_p99_ms']:.1f} ms, {len(output) / SECONDS / 1024:.0f} KB/s; "
+          f"naive {naive['sent']}/{naive['total']} sent in {naive['frames']} frames, {naive['frame_ms']:.2f} ms/frame, "
+          f"{naive['cpu']:.2f} s CPU, p99 lag {naive['lag_p99_ms']:.1f} ms")
+    assert naive['frames'] >= naive['sent']
+    assert tui['cpu'] < naive['cpu']
+
+
+def test_server_commands_need_a_connection():
+    async def scenario():
+        client = IRCClient('me', '#chan')
+        ui = TerminalUI(client, frame_rate=30)
+        ui.loop = asyncio.get_running_loop()
+        for name in sorted(SERVER_COMMANDS):
+            ui.submit(f"/{name} #x hello")
+        ui.submit('/bogus')
+        ui.submit('hello')
+        ui.submit('/plugins')
+        return [text for text, _ in ui.lines]
+
+    lines = run(scenario())
+    assert lines[:len(SERVER_COMMANDS)] == [f"/{name}: not connected." for name in sorted(SERVER_COMMANDS)]
+    assert lines[len(SERVER_COMMANDS):len(SERVER_COMMANDS) + 2] == [
+        "Unknown command: /bogus. Type /help for a list.", "You are not in a channel. Use /join <#channel>."]
+    assert lines[-1].startswith('Plugins: none')
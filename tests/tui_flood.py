@@ -0,0 +1,104 @@
+"""
+Drives a TerminalUI in whatever terminal it is started on with a simulated message flood
+and writes the measurements to a JSON file.
+
+Run as `python -m tests.tui_flood <config dir> <result file> <mode> <seconds> <rate>`.
+Mode 'tui' uses the UI as shipped; 'naive' repaints the whole screen for every message.
+The channel has MEMBERS members and someone joins every JOIN_EVERY messages.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from anon_framework.config import settings
+from anon_framework.utils import metrics
+from anon_framework.utils.console import NORMAL, Console
+
+MEMBERS = 5000
+JOIN_EVERY = 20
+FRAME_RATE = 30
+
+
+async def flood(mode, seconds, rate):
+    from anon_framework.services.communication.irc import IRCClient
+    from anon_framework.services.communication.tui import TUI_COALESCED, TerminalUI
+
+    client = IRCClient('me', '#big')
+    client.is_connected = True
+    client.members.names('#big', ' '.join(f"User{i}" for i in range(MEMBERS)))
+    client.members.end_of_names('#big')
+    ui = TerminalUI(client, frame_rate=FRAME_RATE, console=Console())
+    frame_times = []
+    render = ui._render
+
+    def timed_render():
+        start = time.perf_counter()
+        render()
+        frame_times.append(time.perf_counter() - start)
+
+    ui._render = timed_render
+    if mode == 'naive':
+        def request_redraw(*panes):
+            ui._dirty.add('all')
+            ui._render()
+        ui.request_redraw = request_redraw
+
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - start - 0.005)
+
+    ui.start()
+    ticking = asyncio.ensure_future(ticker())
+    cpu = time.process_time()
+    start = time.perf_counter()
+    total, sent = int(seconds * rate), 0
+    while True:
+        elapsed = time.perf_counter() - start
+        if mode == 'naive' and elapsed >= seconds:
+            # It has fallen behind; report how much it managed to show in the time.
+            break
+        due = min(int(elapsed * rate), total)
+        while sent < due:
+            ui.append([(f"<User{sent % MEMBERS}> flood message {sent:06d}", NORMAL, {})])
+            if sent % JOIN_EVERY == 0:
+                client.members.join('#big', f"Joiner{sent}")
+            sent += 1
+        if sent == total or elapsed >= seconds:
+            break
+        await asyncio.sleep(0.001)
+    # Let the last scheduled frame go out.
+    await asyncio.sleep(ui.frame_interval * 2)
+    cpu = time.process_time() - cpu
+    done.set()
+    await ticking
+    # What the buffer pane's bottom row holds once the flood has been drawn.
+    bottom = ui.buffer_win.instr(ui.body_height - 1, 0).decode().strip()
+    ui.stop()
+    lags.sort()
+    return {
+        'sent': sent, 'total': total, 'frames': len(frame_times), 'cpu': cpu,
+        'frame_ms': 1000 * sum(frame_times) / max(len(frame_times), 1),
+        'lag_p99_ms': 1000 * lags[int(len(lags) * 0.99)] if lags else 0.0,
+        'coalesced': TUI_COALESCED.value, 'bottom': bottom,
+    }
+
+
+def main():
+    config_dir, result_path, mode, seconds, rate = sys.argv[1:6]
+    settings.SYSTEM_CONFIG_PATH = os.path.join(config_dir, 'system-config.json')
+    settings.USER_CONFIG_PATH = os.path.join(config_dir, 'user-config.json')
+    settings.load(use_cache=False, environ={})
+    metrics.enable()
+    result = asyncio.run(flood(mode, float(seconds), int(rate)))
+    with open(result_path, 'w') as f:
+        json.dump(result, f)
+
+
+if __name__ == '__main__':
+    main()